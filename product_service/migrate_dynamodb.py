@@ -0,0 +1,332 @@
+import argparse
+import os
+import time
+import zlib
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.types import Binary
+
+from product_service.lambda_func.product_items import (
+    CATALOG_PK, decompress_text, price_bucket, render_product_json)
+
+# Initialize DynamoDB client
+dynamodb = boto3.resource('dynamodb')
+dynamodb_client = boto3.client('dynamodb')
+
+# Reference to our tables
+products_table = dynamodb.Table('products')
+stocks_table = dynamodb.Table('stocks')
+
+PRICE_INDEX_NAME = 'price-index'
+PRICE_SORT_INDEX_NAME = 'price-sort-index'
+TITLE_SORT_INDEX_NAME = 'title-sort-index'
+IN_STOCK_INDEX_NAME = 'in-stock-index'
+
+# Item of the catalog counters table read by GET /products/stats
+STATS_ID = 'catalog'
+
+# View type of the products/stocks streams read by the stream consumers
+STREAM_VIEW_TYPE = 'NEW_AND_OLD_IMAGES'
+
+
+def create_index(table_name: str, index_name: str,
+                 hash_key: tuple, range_key: tuple) -> None:
+    """
+    Add a fully projected GSI to an existing table and wait until it is
+    active. Keys are (attribute name, attribute type) tuples.
+    """
+    table = dynamodb_client.describe_table(TableName=table_name)['Table']
+    existing = {index['IndexName']
+                for index in table.get('GlobalSecondaryIndexes', [])}
+    if index_name in existing:
+        print(f"Index {index_name} already exists")
+        return
+
+    index = {
+        'IndexName': index_name,
+        'KeySchema': [
+            {'AttributeName': hash_key[0], 'KeyType': 'HASH'},
+            {'AttributeName': range_key[0], 'KeyType': 'RANGE'},
+        ],
+        'Projection': {'ProjectionType': 'ALL'},
+    }
+    if table.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+        throughput = table['ProvisionedThroughput']
+        index['ProvisionedThroughput'] = {
+            'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+            'WriteCapacityUnits': throughput['WriteCapacityUnits'],
+        }
+
+    dynamodb_client.update_table(
+        TableName=table_name,
+        AttributeDefinitions=[
+            {'AttributeName': name, 'AttributeType': attribute_type}
+            for name, attribute_type in (hash_key, range_key)
+        ],
+        GlobalSecondaryIndexUpdates=[{'Create': index}],
+    )
+    print(f"Creating index {index_name}, this may take a while")
+
+    # Only one index can be created per UpdateTable call
+    while True:
+        time.sleep(15)
+        table = dynamodb_client.describe_table(TableName=table_name)['Table']
+        status = {index['IndexName']: index['IndexStatus']
+                  for index in table.get('GlobalSecondaryIndexes', [])}
+        if status.get(index_name) == 'ACTIVE':
+            print(f"Index {index_name} is active")
+            return
+
+
+def create_price_index() -> None:
+    """
+    Add the price-index GSI (price_bucket -> price) to the products table.
+    Items are fully projected so range queries need no second read.
+    """
+    create_index('products', PRICE_INDEX_NAME,
+                 ('price_bucket', 'N'), ('price', 'N'))
+
+
+def backfill(table, derive) -> int:
+    """
+    Scan a table and SET the attributes returned by derive(item) on every
+    item where they differ from the stored values. Attributes derived as
+    None are removed.
+    Returns the number of updated items.
+    """
+    key_names = [key['AttributeName'] for key in table.key_schema]
+    scan_kwargs = {}
+    updated = 0
+
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            attributes = {name: value for name, value in derive(item).items()
+                          if item.get(name) != value}
+            if not attributes:
+                continue
+
+            names = {f"#a{i}": name for i, name in enumerate(attributes)}
+            values = {f":v{i}": value
+                      for i, value in enumerate(attributes.values())
+                      if value is not None}
+            clauses = []
+            if values:
+                clauses.append('SET ' + ', '.join(
+                    f"#a{placeholder[2:]} = {placeholder}" for placeholder in values))
+            removed = [f"#a{i}" for i, value in enumerate(attributes.values())
+                       if value is None]
+            if removed:
+                clauses.append('REMOVE ' + ', '.join(removed))
+
+            update_kwargs = {
+                'Key': {name: item[name] for name in key_names},
+                'UpdateExpression': ' '.join(clauses),
+                'ExpressionAttributeNames': names,
+            }
+            if values:
+                update_kwargs['ExpressionAttributeValues'] = values
+            table.update_item(**update_kwargs)
+            updated += 1
+
+        if 'LastEvaluatedKey' not in response:
+            return updated
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def backfill_price_buckets() -> None:
+    """
+    Set price_bucket on existing products where it is missing or out of
+    date, e.g. above MAX_PRICE_BUCKET
+    """
+    updated = backfill(products_table, lambda item: (
+        {'price_bucket': price_bucket(item['price'])} if 'price' in item else {}))
+    print(f"Backfilled price_bucket for {updated} products")
+
+
+def create_sort_indexes() -> None:
+    """
+    Add the price-sort-index and title-sort-index GSIs to the products table.
+    Both use the constant catalog_pk as partition key so that a page of
+    sorted products is a single Query.
+    """
+    create_index('products', PRICE_SORT_INDEX_NAME,
+                 ('catalog_pk', 'S'), ('price', 'N'))
+    create_index('products', TITLE_SORT_INDEX_NAME,
+                 ('catalog_pk', 'S'), ('title_sort', 'S'))
+
+
+def backfill_sort_keys() -> None:
+    """
+    Set catalog_pk and title_sort on existing products. Index keys cannot be
+    empty strings, so untitled products get no title_sort.
+    """
+    updated = backfill(products_table, lambda item: {
+        'catalog_pk': CATALOG_PK,
+        'title_sort': item.get('title', '').lower() or None,
+    })
+    print(f"Backfilled sort keys for {updated} products")
+
+
+def create_in_stock_index() -> None:
+    """
+    Add the sparse in-stock-index GSI (in_stock -> product_id) to the stocks
+    table. Only stock items with a positive count carry in_stock.
+    """
+    create_index('stocks', IN_STOCK_INDEX_NAME,
+                 ('in_stock', 'S'), ('product_id', 'S'))
+
+
+def backfill_in_stock() -> None:
+    """Set in_stock on available stock items and remove it from the rest"""
+    updated = backfill(stocks_table, lambda item: {
+        'in_stock': 'Y' if item.get('count', 0) > 0 else None,
+    })
+    print(f"Backfilled in_stock for {updated} stock items")
+
+
+def enable_streams() -> None:
+    """
+    Enable DynamoDB Streams (NEW_AND_OLD_IMAGES, the stats consumer needs
+    the old image of overwritten items) on both tables and print the stream
+    ARNs to pass as products_stream_arn / stocks_stream_arn CDK context.
+    A stream with another view type is replaced, which gives it a new ARN.
+    """
+    for table_name in ('products', 'stocks'):
+        table = dynamodb_client.describe_table(TableName=table_name)['Table']
+        stream = table.get('StreamSpecification', {})
+        if stream.get('StreamViewType') == STREAM_VIEW_TYPE:
+            print(f"{table_name} stream: {table['LatestStreamArn']}")
+            continue
+
+        if stream.get('StreamEnabled'):
+            dynamodb_client.update_table(
+                TableName=table_name,
+                StreamSpecification={'StreamEnabled': False})
+            dynamodb_client.get_waiter('table_exists').wait(TableName=table_name)
+
+        table = dynamodb_client.update_table(
+            TableName=table_name,
+            StreamSpecification={
+                'StreamEnabled': True,
+                'StreamViewType': STREAM_VIEW_TYPE,
+            },
+        )['TableDescription']
+        print(f"{table_name} stream: {table['LatestStreamArn']}")
+
+
+def item_product_json(item) -> str:
+    """Public product JSON of an existing product item"""
+    return render_product_json(item['id'], item['title'],
+                               decompress_text(item.get('description', '')),
+                               item['price'])
+
+
+def backfill_product_json() -> None:
+    """Set the pre-rendered product_json on existing products"""
+    updated = backfill(products_table, lambda item: (
+        {'product_json': item_product_json(item)}
+        if 'title' in item and 'price' in item
+        and not isinstance(item.get('product_json'), Binary) else {}))
+    print(f"Backfilled product_json for {updated} products")
+
+
+def compress_descriptions() -> None:
+    """
+    Store description and product_json of existing products as zlib binary
+    when they are at least DESCRIPTION_COMPRESSION_MIN_SIZE bytes (default
+    1024) and compression saves space, see product_items.text_attribute().
+    Run after backfill-product-json.
+    """
+    min_size = int(os.getenv('DESCRIPTION_COMPRESSION_MIN_SIZE', '1024'))
+
+    def derive(item):
+        attributes = {}
+        for name in ('description', 'product_json'):
+            value = item.get(name)
+            if not isinstance(value, str):
+                continue
+            encoded = value.encode('utf-8')
+            if len(encoded) < min_size:
+                continue
+            compressed = zlib.compress(encoded, 9)
+            if len(compressed) < len(encoded):
+                attributes[name] = Binary(compressed)
+        return attributes
+
+    updated = backfill(products_table, derive)
+    print(f"Compressed descriptions of {updated} products")
+
+
+def rebuild_stats() -> None:
+    """
+    Recompute the catalog counters from both tables and overwrite the stats
+    item. STATS_TABLE_NAME is the CatalogStatsTable created by the stack.
+    Run it once after enabling the streams and whenever the counters
+    drifted, e.g. after a stream batch was retried or the cheapest / most
+    expensive product was removed.
+    """
+    stats_table = dynamodb.Table(os.environ['STATS_TABLE_NAME'])
+
+    prices = []
+    scan_kwargs = {'ProjectionExpression': 'price'}
+    while True:
+        response = products_table.scan(**scan_kwargs)
+        prices.extend(item['price'] for item in response.get('Items', [])
+                      if 'price' in item)
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    stock_units = 0
+    scan_kwargs = {'ProjectionExpression': '#count',
+                   'ExpressionAttributeNames': {'#count': 'count'}}
+    while True:
+        response = stocks_table.scan(**scan_kwargs)
+        stock_units += sum(item.get('count', 0)
+                           for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    stats = {
+        'id': STATS_ID,
+        'product_count': len(prices),
+        'stock_units': stock_units,
+        'price_sum': sum(prices, Decimal(0)),
+    }
+    if prices:
+        stats['min_price'] = min(prices)
+        stats['max_price'] = max(prices)
+
+    stats_table.put_item(Item=stats)
+    print(f"Rebuilt stats: {len(prices)} products, {stock_units} stock units")
+
+
+MIGRATIONS = {
+    'create-price-index': create_price_index,
+    'backfill-price-buckets': backfill_price_buckets,
+    'create-sort-indexes': create_sort_indexes,
+    'backfill-sort-keys': backfill_sort_keys,
+    'create-in-stock-index': create_in_stock_index,
+    'backfill-in-stock': backfill_in_stock,
+    'enable-streams': enable_streams,
+    'rebuild-stats': rebuild_stats,
+    'backfill-product-json': backfill_product_json,
+    'compress-descriptions': compress_descriptions,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Create secondary indexes and backfill derived attributes')
+    parser.add_argument('steps', nargs='+', choices=MIGRATIONS)
+    args = parser.parse_args()
+
+    for step in args.steps:
+        MIGRATIONS[step]()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import boto3
+import os
 import uuid
 from typing import Dict, Any
 
+from product_service.lambda_func.product_items import (
+    CATALOG_PK, change_log_put, price_bucket, render_product_json)
+
 # Initialize DynamoDB client
 dynamodb = boto3.resource('dynamodb')
 
@@ -9,6 +13,11 @@ dynamodb = boto3.resource('dynamodb')
 products_table = dynamodb.Table('products')
 stocks_table = dynamodb.Table('stocks')
 
+# Change log table of the deployed stack. The search indexer follows it to
+# keep the product id filter of GET /products/{productId} complete; without
+# it, rebuild the index afterwards by invoking it with {"rebuild": true}.
+CHANGES_TABLE_NAME = os.getenv('CHANGES_TABLE_NAME')
+
 
 # Test data
 
@@ -84,8 +93,21 @@ test_products = [
 
 def put_product(product: Dict[str, Any]) -> None:
     """Insert a product into the products table"""
+    item = {
+        **product,
+        # keys of the secondary indexes, see migrate_dynamodb.py
+        "price_bucket": price_bucket(product["price"]),
+        "catalog_pk": CATALOG_PK,
+        # public JSON returned by the read handlers
+        "product_json": render_product_json(
+            product["id"], product["title"], product["description"],
+            product["price"])
+    }
+    if product["title"]:
+        item["title_sort"] = product["title"].lower()
+
     try:
-        products_table.put_item(Item=product)
+        products_table.put_item(Item=item)
         print(f"Added product: {product['title']}")
     except Exception as e:
         print(f"Error adding product {product['title']}: {str(e)}")
@@ -94,17 +116,28 @@ def put_product(product: Dict[str, Any]) -> None:
 def put_stock(product_id: str, count: int) -> None:
     """Insert a stock record into the stocks table"""
     try:
-        stocks_table.put_item(
-            Item={
-                "product_id": product_id,
-                "count": count
-            }
-        )
+        item = {
+            "product_id": product_id,
+            "count": count
+        }
+        # key of the sparse in-stock index, see migrate_dynamodb.py
+        if count > 0:
+            item["in_stock"] = "Y"
+        stocks_table.put_item(Item=item)
         print(f"Added stock for product: {product_id}")
     except Exception as e:
         print(f"Error adding stock for product {product_id}: {str(e)}")
 
 
+def put_change(product_id: str) -> None:
+    """Record a product write in the change log"""
+    try:
+        put = change_log_put(CHANGES_TABLE_NAME, product_id)['Put']
+        dynamodb.meta.client.put_item(**put)
+    except Exception as e:
+        print(f"Error recording change of product {product_id}: {str(e)}")
+
+
 def main():
     # Add products and their corresponding stock
     for product in test_products:
@@ -115,6 +148,13 @@ def main():
         import random
         put_stock(product["id"], random.randint(1, 100))
 
+        if CHANGES_TABLE_NAME:
+            put_change(product["id"])
+
+    if not CHANGES_TABLE_NAME:
+        print("CHANGES_TABLE_NAME not set: rebuild the search index and the "
+              "product id filter with {\"rebuild\": true}")
+
 
 if __name__ == "__main__":
     main()
@@ -1,3 +1,6 @@
+import json
+import os
+
 from aws_cdk import (
     Stack,
     aws_lambda as lambda_,
@@ -7,6 +10,11 @@ from aws_cdk import (
 from constructs import Construct
 
 
+# Rules of the POST /products body, shared with create_product.validate_product_data()
+PRODUCT_SCHEMA_PATH = os.path.join(
+    os.path.dirname(__file__), "lambda_func", "product_schema.json")
+
+
 class ApiGateway(Stack):
     """
     A CDK Stack that creates an API Gateway for the Product Service.
@@ -21,6 +29,11 @@ class ApiGateway(Stack):
             get_products_fn: lambda_.Function,
             get_product_by_id_fn: lambda_.Function,
             create_product_fn: lambda_.Function,
+            get_product_changes_fn: lambda_.Function,
+            get_product_stats_fn: lambda_.Function,
+            search_products_fn: lambda_.Function,
+            get_products_batch_fn: lambda_.Function,
+            create_products_batch_fn: lambda_.Function,
             **kwargs
     ) -> None:
         """
@@ -32,14 +45,22 @@ class ApiGateway(Stack):
             get_products_fn (_lambda): Lambda function for getting products list.
             get_product_by_id_fn (_lambda): Lambda function for getting product by id
             create_product_fn (_lambda): Lambda function for creating product
+            get_product_changes_fn (_lambda): Lambda function for the product change feed
+            get_product_stats_fn (_lambda): Lambda function for the catalog statistics
+            search_products_fn (_lambda): Lambda function for the product search
+            get_products_batch_fn (_lambda): Lambda function for batch lookups by id
+            create_products_batch_fn (_lambda): Lambda function for bulk product creation
             **kwargs: Additional keyword arguments to pass to the parent Stack.
         """
 
         super().__init__(scope, constructor_id, **kwargs)
 
         # Create REST API instance
+        # All media types are treated as binary so that base64-encoded
+        # (compressed) Lambda responses are decoded by API Gateway
         api = apigateway.RestApi(
-            self, "ProductServiceApi", rest_api_name="ProductsApi"
+            self, "ProductServiceApi", rest_api_name="ProductsApi",
+            binary_media_types=["*/*"]
         )
 
         # Add '/products' resource to the API
@@ -60,8 +81,87 @@ class ApiGateway(Stack):
                 get_product_by_id_fn)
         )
 
+        # Add '/products/changes' resource to the API
+        changes_resource = products_resource.add_resource("changes")
+
+        # Configure GET method for '/products/changes' endpoint with Lambda integration
+        changes_resource.add_method(
+            "GET", apigateway.LambdaIntegration(
+                get_product_changes_fn)
+        )
+
+        # Add '/products/stats' resource to the API
+        stats_resource = products_resource.add_resource("stats")
+
+        # Configure GET method for '/products/stats' endpoint with Lambda integration
+        stats_resource.add_method(
+            "GET", apigateway.LambdaIntegration(
+                get_product_stats_fn)
+        )
+
+        # Add '/products/search' resource to the API
+        search_resource = products_resource.add_resource("search")
+
+        # Configure GET method for '/products/search' endpoint with Lambda integration
+        search_resource.add_method(
+            "GET", apigateway.LambdaIntegration(
+                search_products_fn)
+        )
+
+        # Add '/products/batchGet' resource to the API
+        batch_get_resource = products_resource.add_resource("batchGet")
+
+        # Configure POST method for '/products/batchGet' endpoint with Lambda integration
+        batch_get_resource.add_method(
+            "POST", apigateway.LambdaIntegration(
+                get_products_batch_fn)
+        )
+
+        # Add '/products/batch' resource to the API
+        batch_resource = products_resource.add_resource("batch")
+
+        # Configure POST method for '/products/batch' endpoint with Lambda integration
+        batch_resource.add_method(
+            "POST", apigateway.LambdaIntegration(
+                create_products_batch_fn)
+        )
+
+        # Reject POST '/products' bodies not matching the product schema
+        # at the gateway, before invoking the Lambda function
+        with open(PRODUCT_SCHEMA_PATH) as f:
+            product_schema = json.load(f)
+        create_product_model = api.add_model(
+            "CreateProductModel",
+            content_type="application/json",
+            model_name=product_schema["title"],
+            schema=json_schema(product_schema),
+        )
+        body_validator = api.add_request_validator(
+            "BodyValidator", validate_request_body=True)
+
         # Configure POST method for '/products' endpoint with Lambda integration
         products_resource.add_method(
             "POST", apigateway.LambdaIntegration(
-                create_product_fn)
+                create_product_fn),
+            request_models={"application/json": create_product_model},
+            request_validator=body_validator
         )
+
+
+def json_schema(definition: dict) -> apigateway.JsonSchema:
+    """
+    Converts a JSON Schema (draft 4) document into its CDK representation.
+    Only the keywords used by the product schema are supported.
+    """
+    return apigateway.JsonSchema(
+        schema=apigateway.JsonSchemaVersion.DRAFT4
+        if "$schema" in definition else None,
+        title=definition.get("title"),
+        type=getattr(apigateway.JsonSchemaType, definition["type"].upper()),
+        properties={
+            name: json_schema(prop)
+            for name, prop in definition.get("properties", {}).items()
+        } or None,
+        required=definition.get("required"),
+        minimum=definition.get("minimum"),
+    )
@@ -1,4 +1,5 @@
 from aws_cdk import (
+    Duration,
     Stack,
     aws_lambda as lambda_,
     aws_sqs as sqs,
@@ -21,19 +22,27 @@ class CatalogBatchProcess(Stack):
     - Necessary IAM permissions and event sources
     """
 
-    def __init__(self, scope: Construct, construct_id: str, environment: dict, **kwargs):
+    def __init__(self, scope: Construct, construct_id: str, environment: dict,
+                 write_mode: str = "transaction", **kwargs):
         super().__init__(scope, construct_id, **kwargs)
 
         # Create SQS Queue for receiving product data
+        # The visibility timeout must exceed the Lambda timeout
         catalog_items_queue = sqs.Queue(
             self,
             "CatalogItemsQueue",
-            queue_name='CatalogItemsQueue'
+            queue_name='CatalogItemsQueue',
+            visibility_timeout=Duration.seconds(180)
         )
 
         # Configure SQS as event source for Lambda
+        # Large batches are written many products per request; a short
+        # batching window lets them fill up
+        # Only the records reported in batchItemFailures are redelivered
         event_source = lambda_event_sources.SqsEventSource(
-            catalog_items_queue, batch_size=5)
+            catalog_items_queue, batch_size=100,
+            max_batching_window=Duration.seconds(5),
+            report_batch_item_failures=True)
 
         # Create SNS Topic for notifications
         create_product_topic = sns.Topic(
@@ -56,7 +65,12 @@ class CatalogBatchProcess(Stack):
         )
 
         # Add SNS Topic ARN to Lambda environment variables
-        environment["SNS_TOPIC_ARN"] = create_product_topic.topic_arn
+        # (on a copy, the dict is shared with the other functions)
+        environment = {
+            **environment,
+            "SNS_TOPIC_ARN": create_product_topic.topic_arn,
+            "CATALOG_WRITE_MODE": write_mode,
+        }
 
         # Create Lambda function for processing catalog items
         self.catalog_batch_process = lambda_.Function(
@@ -65,6 +79,7 @@ class CatalogBatchProcess(Stack):
             code=lambda_.Code.from_asset("product_service/lambda_func/"),
             handler="catalog_batch.handler",
             environment=environment,
+            timeout=Duration.seconds(30),
         )
 
         # SQS policy
@@ -0,0 +1,86 @@
+from aws_cdk import (
+    Duration,
+    Stack,
+    aws_dynamodb as dynamodb,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_lambda as lambda_,
+    aws_s3 as s3
+)
+
+from constructs import Construct
+
+
+class CatalogSearch(Stack):
+    """
+    AWS CDK Stack for the product search.
+
+    This stack creates:
+    - Lambda function maintaining the inverted search index in S3, invoked
+      asynchronously by the product writers and following the change log
+    - Schedule refreshing the index and the id filter every hour
+    - Lambda function serving GET /products/search from that index
+    - Necessary IAM permissions
+
+    The index is kept in the catalog snapshot bucket, see CatalogSnapshot.
+    """
+
+    def __init__(
+            self,
+            scope: Construct, construct_id: str,
+            environment: dict,
+            catalog_bucket: s3.IBucket,
+            products_table: dynamodb.ITable,
+            stock_table: dynamodb.ITable,
+            changes_table: dynamodb.ITable,
+            **kwargs
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        environment = {
+            **environment,
+            "CATALOG_BUCKET_NAME": catalog_bucket.bucket_name,
+        }
+
+        # Create Lambda function for maintaining the index
+        # A single concurrent execution keeps read-modify-write of the
+        # index free of lost updates
+        self.catalog_indexer = lambda_.Function(
+            self, "CatalogIndexerHandler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            code=lambda_.Code.from_asset("product_service/lambda_func/"),
+            handler="catalog_indexer.handler",
+            environment=environment,
+            reserved_concurrent_executions=1,
+        )
+
+        # Refresh the index from the change log every hour, so that the id
+        # filter version keeps up with the change log retention even when no
+        # product is written, and build it if it never was
+        events.Rule(
+            self, "CatalogIndexerSchedule",
+            schedule=events.Schedule.rate(Duration.hours(1)),
+            targets=[targets.LambdaFunction(
+                self.catalog_indexer,
+                event=events.RuleTargetInput.from_object({"refresh": True}))],
+        )
+
+        # Create Lambda function for searching products
+        # This function will handle the GET '/products/search' endpoint
+        self.product_search = lambda_.Function(
+            self, "ProductSearchHandler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            code=lambda_.Code.from_asset("product_service/lambda_func/"),
+            handler="product_search.handler",
+            environment=environment,
+        )
+
+        # S3 policy
+        catalog_bucket.grant_read_write(self.catalog_indexer)
+        catalog_bucket.grant_read(self.product_search)
+
+        # DynamoDB policy
+        products_table.grant_read_data(self.catalog_indexer)
+        changes_table.grant_read_data(self.catalog_indexer)
+        products_table.grant_read_data(self.product_search)
+        stock_table.grant_read_data(self.product_search)
@@ -0,0 +1,71 @@
+from aws_cdk import (
+    Stack,
+    aws_dynamodb as dynamodb,
+    aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_event_sources,
+    aws_s3 as s3
+)
+
+from constructs import Construct
+
+
+class CatalogSnapshot(Stack):
+    """
+    AWS CDK Stack for the materialized catalog snapshot.
+
+    This stack creates:
+    - S3 Bucket holding the pre-joined catalog (JSON and NDJSON)
+    - Lambda function consuming products/stocks DynamoDB Streams and
+      patching the snapshot
+    - Necessary IAM permissions and event sources
+
+    Event sources are only attached for tables that were imported with a
+    stream ARN, see ProductServiceStack.
+    """
+
+    def __init__(
+            self,
+            scope: Construct, construct_id: str,
+            environment: dict,
+            products_table: dynamodb.ITable,
+            stock_table: dynamodb.ITable,
+            **kwargs
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        # Create S3 Bucket for the catalog snapshot
+        self.catalog_bucket = s3.Bucket(self, "CatalogSnapshotBucket")
+
+        # Create Lambda function for maintaining the snapshot
+        # A single concurrent execution keeps read-modify-write of the
+        # snapshot free of lost updates
+        self.catalog_snapshot = lambda_.Function(
+            self, "CatalogSnapshotHandler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            code=lambda_.Code.from_asset("product_service/lambda_func/"),
+            handler="catalog_snapshot.handler",
+            environment={
+                **environment,
+                "CATALOG_BUCKET_NAME": self.catalog_bucket.bucket_name,
+            },
+            reserved_concurrent_executions=1,
+        )
+
+        # DynamoDB Streams as event sources
+        for table in (products_table, stock_table):
+            if table.table_stream_arn:
+                self.catalog_snapshot.add_event_source(
+                    lambda_event_sources.DynamoEventSource(
+                        table,
+                        starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                        batch_size=100,
+                        retry_attempts=10,
+                    )
+                )
+
+        # S3 policy
+        self.catalog_bucket.grant_read_write(self.catalog_snapshot)
+
+        # DynamoDB policy (full rebuild)
+        products_table.grant_read_data(self.catalog_snapshot)
+        stock_table.grant_read_data(self.catalog_snapshot)
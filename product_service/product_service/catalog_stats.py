@@ -0,0 +1,58 @@
+from aws_cdk import (
+    Stack,
+    aws_dynamodb as dynamodb,
+    aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_event_sources
+)
+
+from constructs import Construct
+
+
+class CatalogStats(Stack):
+    """
+    AWS CDK Stack for the catalog counters read by GET /products/stats.
+
+    This stack creates:
+    - Lambda function consuming products/stocks DynamoDB Streams and
+      applying the changes to the counters item
+    - Read access to the price sort index, which holds the price extremes
+    - Necessary event sources
+
+    The streams must carry old and new images (NEW_AND_OLD_IMAGES, see
+    migrate_dynamodb.py enable-streams). Event sources are only attached for
+    tables that were imported with a stream ARN, see ProductServiceStack.
+    """
+
+    def __init__(
+            self,
+            scope: Construct, construct_id: str,
+            environment: dict,
+            products_table: dynamodb.ITable,
+            stock_table: dynamodb.ITable,
+            **kwargs
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        # Create Lambda function for maintaining the counters
+        self.catalog_stats = lambda_.Function(
+            self, "CatalogStatsHandler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            code=lambda_.Code.from_asset("product_service/lambda_func/"),
+            handler="catalog_stats.handler",
+            environment=environment,
+        )
+
+        # DynamoDB policy: the price extremes are read from price-sort-index
+        products_table.grant_read_data(self.catalog_stats)
+
+        # DynamoDB Streams as event sources
+        for table in (products_table, stock_table):
+            if table.table_stream_arn:
+                self.catalog_stats.add_event_source(
+                    lambda_event_sources.DynamoEventSource(
+                        table,
+                        starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                        batch_size=100,
+                        retry_attempts=10,
+                    )
+                )
@@ -1,4 +1,5 @@
 from aws_cdk import (
+    Duration,
     Stack,
     aws_lambda as lambda_
 )
@@ -23,3 +24,15 @@ class CreateProduct(Stack):
             code=lambda_.Code.from_asset("product_service/lambda_func/"),
             environment=environment
         )
+
+        # Bulk creation shares the module and its validation
+        # Up to 500 products per request need more than the default timeout
+        self.create_products_batch = lambda_.Function(
+            self,
+            "CreateProductsBatchHandler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="create_product.batch_handler",
+            code=lambda_.Code.from_asset("product_service/lambda_func/"),
+            environment=environment,
+            timeout=Duration.seconds(29)
+        )
@@ -12,6 +12,8 @@ class GetProductById(Stack):
     Attributes:
         get_product_by_id (_lambda.Function): An AWS Lambda function that
             handles product by id retrieval.
+        get_products_batch (_lambda.Function): An AWS Lambda function that
+            handles batch lookups of many product ids.
     """
 
     def __init__(self, scope: Construct, construct_id: str, environment: dict) -> None:
@@ -35,3 +37,13 @@ class GetProductById(Stack):
             code=lambda_.Code.from_asset("product_service/lambda_func/"),
             environment=environment
         )
+
+        # Batch lookups share the module and its shaping logic
+        self.get_products_batch = lambda_.Function(
+            self,
+            "GetProductsBatchHandler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="product_by_id.batch_handler",
+            code=lambda_.Code.from_asset("product_service/lambda_func/"),
+            environment=environment
+        )
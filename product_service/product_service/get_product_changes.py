@@ -0,0 +1,37 @@
+from aws_cdk import (
+    Stack,
+    aws_lambda as lambda_
+)
+from constructs import Construct
+
+
+class GetProductChanges(Stack):
+    """
+    CDK Stack that creates a Lambda function for the product change feed.
+
+    Attributes:
+        get_product_changes (_lambda.Function): An AWS Lambda function that
+            returns products changed since a version token.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, environment: dict) -> None:
+        """
+        Initialize GetProductChanges stack.
+
+        Args:
+            scope: CDK app construct scope
+            construct_id: Unique identifier for the stack
+            environment: Environment variables for the Lambda function
+
+        """
+        super().__init__(scope, construct_id)
+
+        # Define an AWS Lambda resource
+        self.get_product_changes = lambda_.Function(
+            self,
+            "GetProductChangesHandler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="product_changes.handler",
+            code=lambda_.Code.from_asset("product_service/lambda_func/"),
+            environment=environment
+        )
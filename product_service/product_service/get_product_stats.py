@@ -0,0 +1,37 @@
+from aws_cdk import (
+    Stack,
+    aws_lambda as lambda_
+)
+from constructs import Construct
+
+
+class GetProductStats(Stack):
+    """
+    CDK Stack that creates a Lambda function for the catalog statistics.
+
+    Attributes:
+        get_product_stats (_lambda.Function): An AWS Lambda function that
+            returns pre-aggregated catalog statistics.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, environment: dict) -> None:
+        """
+        Initialize GetProductStats stack.
+
+        Args:
+            scope: CDK app construct scope
+            construct_id: Unique identifier for the stack
+            environment: Environment variables for the Lambda function
+
+        """
+        super().__init__(scope, construct_id)
+
+        # Define an AWS Lambda resource
+        self.get_product_stats = lambda_.Function(
+            self,
+            "GetProductStatsHandler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="product_stats.handler",
+            code=lambda_.Code.from_asset("product_service/lambda_func/"),
+            environment=environment
+        )
@@ -1,12 +1,38 @@
 import json
 import os
+import time
+
 import boto3
 
+try:
+    from .product_items import (change_log_put, change_version,
+                                notify_search_indexer, product_item,
+                                stock_item)
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_items import (change_log_put, change_version,
+                               notify_search_indexer, product_item,
+                               stock_item)
+
 
 dynamodb_client = boto3.client('dynamodb')
 dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION"))
 sns_client = boto3.client('sns')
 
+# "transaction" writes every product atomically with its stock, "batch"
+# uses BatchWriteItem for bulk imports, where a product may be written
+# without its stock until the record is redelivered.
+CATALOG_WRITE_MODE = os.getenv("CATALOG_WRITE_MODE", "transaction")
+
+# TransactWriteItems accepts at most 100 actions. Every product takes three
+# (product, stock and change log Puts).
+TRANSACT_MAX_ACTIONS = 100
+TRANSACTION_CHUNK_SIZE = TRANSACT_MAX_ACTIONS // 3
+
+# BatchWriteItem accepts at most 25 Puts, i.e. 8 products
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_CHUNK_SIZE = BATCH_WRITE_MAX_ITEMS // 3
+BATCH_WRITE_MAX_RETRIES = int(os.getenv("BATCH_WRITE_MAX_RETRIES", "5"))
+
 
 def handler(event, _context):
     """
@@ -14,15 +40,26 @@ def handler(event, _context):
      - create corresponding products in the products and stock table
      - publish to SNS with filters.
 
+    Products are written many at a time, see CATALOG_WRITE_MODE:
+    transactions of up to TRANSACTION_CHUNK_SIZE products, or BatchWriteItem
+    calls of up to BATCH_WRITE_CHUNK_SIZE products. A failed transaction is
+    retried product by product to find the records that cannot be written.
+
+    Records that are invalid or could not be written are reported in
+    batchItemFailures (ReportBatchItemFailures), so that SQS only redelivers
+    those records and deletes the rest of the batch.
+
     Args:
         event: SQS event containing product data
         _context: Lambda context
     """
     stock_table_name = os.environ['STOCK_TABLE_NAME']
     product_table_name = os.environ['PRODUCTS_TABLE_NAME']
+    changes_table_name = os.environ['CHANGES_TABLE_NAME']
     sns_topic_arn = os.environ['SNS_TOPIC_ARN']
 
     products_for_sns = []
+    batch_item_failures = []
 
     # Check if there are any records
     if not event.get('Records'):
@@ -36,6 +73,10 @@ def handler(event, _context):
             }
         }
 
+    table_names = (product_table_name, stock_table_name, changes_table_name)
+
+    # Parse and validate all records before writing
+    valid_records = []
     for record in event['Records']:
         try:
             record_data = json.loads(record['body'])
@@ -44,41 +85,29 @@ def handler(event, _context):
             required_fields = ['id', 'title', 'description', 'price', 'count']
             for field in required_fields:
                 if field not in record_data:
-                    return {
-                        'statusCode': 400,
-                        'body': json.dumps({'message': f'Invalid input: {field} is missing'})
-                    }
+                    raise ValueError(f'Invalid input: {field} is missing')
 
-            product_item = {
-                'id': {'S': str(record_data['id'])},
-                'title': {'S': record_data['title']},
-                'description': {'S': record_data['description']},
-                'price': {'N': str(record_data['price'])}
-            }
+            valid_records.append((record, record_data))
 
-            stock_item = {
-                'product_id': {'S': str(record_data['id'])},
-                'count': {'N': str(record_data['count'])}
-            }
+        except Exception as e:
+            print(f"Error processing record {record.get('messageId')}: {str(e)}")
+            batch_item_failures.append({'itemIdentifier': record.get('messageId')})
 
-            # save to DynamoDB
-            dynamodb_client.transact_write_items(
-                TransactItems=[
-                    {
-                        'Put': {
-                            'TableName': product_table_name,
-                            'Item': product_item
-                        }
-                    },
-                    {
-                        'Put': {
-                            'TableName': stock_table_name,
-                            'Item': stock_item
-                        }
-                    }
-                ]
-            )
+    if CATALOG_WRITE_MODE == 'batch':
+        chunks = product_chunks(valid_records, BATCH_WRITE_CHUNK_SIZE)
+        write_chunk = write_batch_chunk
+    else:
+        chunks = product_chunks(valid_records, TRANSACTION_CHUNK_SIZE)
+        write_chunk = write_transaction_chunk
 
+    for chunk in chunks:
+        written, failed = write_chunk(table_names, chunk)
+
+        for record, error in failed:
+            print(f"Error processing record {record.get('messageId')}: {error}")
+            batch_item_failures.append({'itemIdentifier': record.get('messageId')})
+
+        for record_data in written:
             products_for_sns.append({
                 'id': str(record_data['id']),
                 'title': record_data['title'],
@@ -87,9 +116,7 @@ def handler(event, _context):
                 'count': record_data['count']
             })
 
-        except Exception as e:
-            print(f"Error processing record: {str(e)}")
-            continue
+    notify_search_indexer([product['id'] for product in products_for_sns])
 
     # Filter products(with price attribute)
     for product in products_for_sns:
@@ -117,6 +144,9 @@ def handler(event, _context):
         except Exception as e:
             print(f"Error publishing expensive product: {str(e)}")
 
+    if batch_item_failures:
+        print(f"{len(batch_item_failures)} of {len(event['Records'])} records failed")
+
     return {
         'statusCode': 200,
         'body': json.dumps({'message': 'Products added successfully'}),
@@ -124,5 +154,160 @@ def handler(event, _context):
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Credentials': True,
             'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        }
+        },
+        'batchItemFailures': batch_item_failures
     }
+
+
+def product_chunks(records, chunk_size):
+    """
+    Splits (record, record_data) pairs into chunks of at most chunk_size,
+    in order. A product id occurring again starts a new chunk, since one
+    request cannot write the same item twice.
+    """
+    chunks = []
+    chunk = []
+    chunk_ids = set()
+    for record, record_data in records:
+        product_id = str(record_data['id'])
+        if len(chunk) == chunk_size or product_id in chunk_ids:
+            chunks.append(chunk)
+            chunk = []
+            chunk_ids = set()
+        chunk.append((record, record_data))
+        chunk_ids.add(product_id)
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def product_actions(table_names, record_data):
+    """
+    Builds the transaction Puts writing a product: the product item, its
+    stock item and the change log entry.
+    """
+    product_table_name, stock_table_name, changes_table_name = table_names
+    product_id = str(record_data['id'])
+    version = change_version(product_id)
+
+    return [
+        {
+            'Put': {
+                'TableName': product_table_name,
+                'Item': product_item(
+                    product_id, record_data['title'],
+                    record_data['description'], record_data['price'], version)
+            }
+        },
+        {
+            'Put': {
+                'TableName': stock_table_name,
+                'Item': stock_item(product_id, record_data['count'], version)
+            }
+        },
+        change_log_put(changes_table_name, product_id, version)
+    ]
+
+
+def write_transaction_chunk(table_names, chunk):
+    """
+    Writes the products of a chunk, with their stock, in one transaction.
+    When it fails, every product is retried in its own transaction so that
+    only the records which cannot be written are reported.
+
+    Returns:
+        tuple: (written record data, [(record, error), ...])
+    """
+    records_data = [record_data for _record, record_data in chunk]
+    transaction_items = []
+    try:
+        for record_data in records_data:
+            transaction_items.extend(product_actions(table_names, record_data))
+
+        # save to DynamoDB
+        dynamodb_client.transact_write_items(TransactItems=transaction_items)
+        return records_data, []
+
+    except Exception as e:
+        if len(chunk) == 1:
+            return [], [(chunk[0][0], str(e))]
+        print(f"Transaction of {len(chunk)} products failed, "
+              f"retrying them one by one: {str(e)}")
+
+    written = []
+    failed = []
+    for pair in chunk:
+        pair_written, pair_failed = write_transaction_chunk(table_names, [pair])
+        written.extend(pair_written)
+        failed.extend(pair_failed)
+    return written, failed
+
+
+def write_batch_chunk(table_names, chunk):
+    """
+    Writes the products of a chunk with one BatchWriteItem, retrying
+    UnprocessedItems with exponential backoff. A record whose items cannot
+    be built fails on its own; when the request fails, every product is
+    retried in its own request, as in write_transaction_chunk().
+
+    Returns:
+        tuple: (written record data, [(record, error), ...])
+    """
+    request_items = {}
+    built = []
+    failed = []
+    for record, record_data in chunk:
+        try:
+            actions = product_actions(table_names, record_data)
+        except Exception as e:
+            failed.append((record, str(e)))
+            continue
+
+        built.append((record, record_data))
+        for action in actions:
+            request_items.setdefault(action['Put']['TableName'], []).append(
+                {'PutRequest': {'Item': action['Put']['Item']}})
+
+    if not built:
+        return [], failed
+
+    try:
+        attempt = 0
+        while request_items:
+            result = dynamodb_client.batch_write_item(RequestItems=request_items)
+            request_items = result.get('UnprocessedItems') or {}
+            if request_items:
+                attempt += 1
+                if attempt > BATCH_WRITE_MAX_RETRIES:
+                    break
+                time.sleep(min(0.05 * 2 ** attempt, 1))
+
+    except Exception as e:
+        if len(built) == 1:
+            return [], failed + [(built[0][0], str(e))]
+        print(f"Batch write of {len(built)} products failed, "
+              f"retrying them one by one: {str(e)}")
+
+        written = []
+        for pair in built:
+            pair_written, pair_failed = write_batch_chunk(table_names, [pair])
+            written.extend(pair_written)
+            failed.extend(pair_failed)
+        return written, failed
+
+    # Products with any Put left unprocessed are redelivered
+    unprocessed_ids = set()
+    for requests in request_items.values():
+        for request in requests:
+            item = request['PutRequest']['Item']
+            unprocessed_ids.add((item.get('id') or item['product_id'])['S'])
+
+    written = []
+    for record, record_data in built:
+        if str(record_data['id']) in unprocessed_ids:
+            failed.append((record, 'Write was not processed'))
+        else:
+            written.append(record_data)
+
+    return written, failed
@@ -0,0 +1,258 @@
+import base64
+import json
+import math
+import os
+
+import boto3
+from botocore.exceptions import ClientError
+
+try:
+    from .product_items import (ID_FILTER_KEY, SEARCH_INDEX_KEY,
+                                batch_get_items, bloom_positions,
+                                changed_product_ids, decompress_text,
+                                retained_version, settled_version, tokenize)
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_items import (ID_FILTER_KEY, SEARCH_INDEX_KEY,
+                               batch_get_items, bloom_positions,
+                               changed_product_ids, decompress_text,
+                               retained_version, settled_version, tokenize)
+
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION"))
+dynamodb_client = boto3.client('dynamodb', region_name=os.getenv("AWS_REGION"))
+
+# State of the index inside CATALOG_BUCKET_NAME, next to SEARCH_INDEX_KEY
+# and ID_FILTER_KEY
+SEARCH_STATE_KEY = "search/state.json"
+
+# Target false positive rate of the product id Bloom filter
+ID_FILTER_ERROR_RATE = float(os.getenv("ID_FILTER_ERROR_RATE", "0.01"))
+
+# Product attributes that are searchable
+SEARCH_FIELDS = ("title", "description")
+
+# Last state loaded or written by this container: {"etag": ..., "state": ...}
+_state_cache = {}
+
+
+def handler(event, _context):
+    """
+    Handler maintaining the inverted index read by GET /products/search.
+
+    Invoked asynchronously by create_product and catalog_batch with
+    {"ids": [...]} after products were written. Only those products are
+    re-read and re-tokenized. Invoking it with {"rebuild": true} rebuilds
+    the index from a scan of the products table. {"refresh": true}, sent
+    every hour by a schedule, only follows the change log, or rebuilds the
+    index when it is not complete yet.
+
+    Once the state is complete, every run also indexes the products of the
+    change log since the state's version, so products whose notification
+    was lost are picked up, and advances the version. A state whose version
+    is older than the change log retention is rebuilt.
+
+    Three objects are kept in CATALOG_BUCKET_NAME:
+     - search/state.json: {"docs": {id: [title_sort, [tokens]]},
+       "complete": bool, "version": str}
+     - search/index.json: the compact index, see render_index()
+     - filters/product-ids.json: Bloom filter of all product ids used by
+       product_by_id to answer unknown ids without a DynamoDB read, see
+       render_id_filter(). Only written once the state is complete, i.e.
+       after a rebuild, since a partial filter would hide existing products.
+       It holds every product with a change log version below its version.
+
+    Args:
+        event: {"ids": [...]}, {"refresh": true} or {"rebuild": true}
+        _context: Lambda context
+    """
+    bucket_name = os.environ['CATALOG_BUCKET_NAME']
+
+    if event.get('rebuild'):
+        rebuild(bucket_name)
+        return
+
+    product_ids = [str(product_id) for product_id in event.get('ids') or []]
+    if not product_ids and not event.get('refresh'):
+        print("No products to index")
+        return
+
+    state = load_state(bucket_name)
+    if not state.get('complete') and event.get('refresh'):
+        print("No complete index yet, rebuilding it")
+        rebuild(bucket_name)
+        return
+
+    if state.get('complete'):
+        if state.get('version', '') < retained_version():
+            print("Change log no longer covers the index, rebuilding it")
+            rebuild(bucket_name)
+            return
+
+        version = settled_version()
+        changed = changed_product_ids(dynamodb_client, state['version'])
+        product_ids = list(dict.fromkeys(product_ids + sorted(changed)))
+        state['version'] = version
+
+    products = get_products(product_ids)
+    for product_id in product_ids:
+        product = products.get(product_id)
+        if product:
+            state['docs'][product_id] = index_document(product)
+        else:
+            state['docs'].pop(product_id, None)
+
+    write_index(bucket_name, state)
+    print(f"Indexed {len(products)} of {len(product_ids)} products")
+
+
+def index_document(product):
+    """
+    Returns the state entry of a product: its sort key and unique tokens.
+    """
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        tokens.update(tokenize(str(decompress_text(product.get(field, '')))))
+    return [str(product.get('title', '')).lower(), sorted(tokens)]
+
+
+def render_index(state):
+    """
+    Builds the compact inverted index from the state:
+    {"ids": [...], "terms": [...], "postings": [[...], ...]}
+
+    ids are ordered by title, so that postings (positions in ids) are
+    already in result order. terms are sorted so that prefix lookups are a
+    binary search; postings[i] lists the documents containing terms[i].
+    """
+    docs = sorted(state['docs'].items(), key=lambda doc: (doc[1][0], doc[0]))
+
+    postings = {}
+    for position, (_product_id, (_title, tokens)) in enumerate(docs):
+        for token in tokens:
+            postings.setdefault(token, []).append(position)
+
+    terms = sorted(postings)
+    return {
+        'ids': [product_id for product_id, _doc in docs],
+        'terms': terms,
+        'postings': [postings[term] for term in terms],
+    }
+
+
+def rebuild(bucket_name: str):
+    """
+    Rebuilds the index and the id filter from a scan of the products table.
+    The version is taken before the scan, so the scan sees every write
+    below it.
+    """
+    version = settled_version()
+    state = build_state()
+    state['version'] = version
+    write_index(bucket_name, state)
+    print(f"Search index rebuilt with {len(state['docs'])} products")
+
+
+def build_state():
+    """
+    Scans the products table to build a fresh index state.
+    """
+    product_table = dynamodb.Table(os.environ['PRODUCTS_TABLE_NAME'])
+    scan_kwargs = {
+        'ProjectionExpression': '#id, #title, #description',
+        'ExpressionAttributeNames': {'#id': 'id', '#title': 'title',
+                                     '#description': 'description'},
+    }
+
+    docs = {}
+    while True:
+        response = product_table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            docs[str(item['id'])] = index_document(item)
+        if 'LastEvaluatedKey' not in response:
+            return {'docs': docs, 'complete': True}
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def get_products(product_ids):
+    """
+    Reads the searchable attributes of the given products.
+
+    Returns:
+        dict: product id -> item, ids without a product item are left out
+    """
+    return batch_get_items(
+        dynamodb_client, os.environ['PRODUCTS_TABLE_NAME'], 'id', product_ids,
+        ProjectionExpression='#id, #title, #description',
+        ExpressionAttributeNames={'#id': 'id', '#title': 'title',
+                                  '#description': 'description'})
+
+
+def load_state(bucket_name: str):
+    """
+    Loads the index state from S3, reusing the copy held by this warm
+    container when the object has not changed since.
+    """
+    request = {'Bucket': bucket_name, 'Key': SEARCH_STATE_KEY}
+    if _state_cache:
+        request['IfNoneMatch'] = _state_cache['etag']
+
+    try:
+        response = s3.get_object(**request)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in ('304', 'NotModified'):
+            return _state_cache['state']
+        if code in ('NoSuchKey', '404'):
+            print("No search index state found, starting from an empty index")
+            return {'docs': {}, 'complete': False}
+        raise
+
+    state = json.loads(response['Body'].read())
+    _state_cache.update(etag=response['ETag'], state=state)
+    return state
+
+
+def render_id_filter(product_ids, version: str = None):
+    """
+    Builds a Bloom filter of the product ids:
+    {"m": bits, "k": hashes, "bits": base64, "version": str}
+    where version is the change log version up to which it is complete.
+
+    Sized for twice the current number of ids so that products created
+    until the next update still keep the false positive rate low.
+    """
+    capacity = max(2 * len(product_ids), 1000)
+    m = math.ceil(-capacity * math.log(ID_FILTER_ERROR_RATE) / math.log(2) ** 2)
+    k = max(1, round(m / capacity * math.log(2)))
+
+    bits = bytearray((m + 7) // 8)
+    for product_id in product_ids:
+        for position in bloom_positions(product_id, m, k):
+            bits[position // 8] |= 1 << (position % 8)
+
+    return {'m': m, 'k': k, 'bits': base64.b64encode(bytes(bits)).decode('ascii'),
+            'version': version}
+
+
+def write_index(bucket_name: str, state):
+    """
+    Writes the rendered index, the id filter and the state to S3.
+    """
+    s3.put_object(
+        Bucket=bucket_name, Key=SEARCH_INDEX_KEY,
+        Body=json.dumps(render_index(state), separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json')
+
+    if state.get('complete'):
+        s3.put_object(
+            Bucket=bucket_name, Key=ID_FILTER_KEY,
+            Body=json.dumps(render_id_filter(
+                list(state['docs']), state.get('version'))).encode('utf-8'),
+            ContentType='application/json')
+
+    response = s3.put_object(
+        Bucket=bucket_name, Key=SEARCH_STATE_KEY,
+        Body=json.dumps(state, separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json')
+    _state_cache.update(etag=response['ETag'], state=state)
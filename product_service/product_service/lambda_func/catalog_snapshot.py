@@ -0,0 +1,198 @@
+import json
+import os
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+try:
+    from .product_items import scan_all, shape_product
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_items import scan_all, shape_product
+
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION"))
+deserializer = TypeDeserializer()
+
+# Object keys inside CATALOG_BUCKET_NAME
+STATE_KEY = "catalog/state.json"
+JSON_KEY = "catalog/products.json"
+NDJSON_KEY = "catalog/products.ndjson"
+
+# Last state loaded or written by this container: {"etag": ..., "state": ...}
+_state_cache = {}
+
+
+def handler(event, _context):
+    """
+    Handler for DynamoDB Streams events of the products and stocks tables.
+
+    Keeps a pre-joined catalog snapshot in S3 up to date:
+     - catalog/state.json: products by id and stock counts by product id,
+       "complete" once built from a scan of both tables
+     - catalog/products.json: the GET /products response body
+     - catalog/products.ndjson: one product per line
+
+    Only the entries touched by the stream records are patched. Records
+    arriving before the state is complete trigger a rebuild instead, so a
+    partial catalog is never published. Invoking the function with
+    {"rebuild": true} rebuilds the snapshot from scratch.
+
+    Args:
+        event: DynamoDB Streams event, or {"rebuild": true}
+        _context: Lambda context
+    """
+    bucket_name = os.environ['CATALOG_BUCKET_NAME']
+
+    if event.get('rebuild'):
+        rebuild(bucket_name)
+        return
+
+    records = event.get('Records') or []
+    if not records:
+        print("No records to process")
+        return
+
+    state = load_state(bucket_name)
+    if not state.get('complete'):
+        print("Snapshot not built yet, rebuilding it")
+        rebuild(bucket_name)
+        return
+
+    changed = apply_records(state, records)
+
+    if changed:
+        write_snapshot(bucket_name, state)
+    print(f"Applied {changed} of {len(records)} change records")
+
+
+def apply_records(state, records):
+    """
+    Patches the snapshot state with stream records.
+
+    Returns:
+        int: Number of records that changed the state.
+    """
+    product_table_name = os.environ['PRODUCTS_TABLE_NAME']
+    stock_table_name = os.environ['STOCK_TABLE_NAME']
+
+    changed = 0
+    for record in records:
+        table_name = record['eventSourceARN'].split(':table/')[1].split('/')[0]
+        change = record['dynamodb']
+        keys = deserialize(change['Keys'])
+        removed = record['eventName'] == 'REMOVE'
+
+        if table_name == product_table_name:
+            product_id = str(keys['id'])
+            if removed:
+                changed += state['products'].pop(product_id, None) is not None
+            else:
+                state['products'][product_id] = shape_product(
+                    deserialize(change['NewImage']))
+                changed += 1
+
+        elif table_name == stock_table_name:
+            product_id = str(keys['product_id'])
+            if removed:
+                changed += state['stocks'].pop(product_id, None) is not None
+            else:
+                state['stocks'][product_id] = int(
+                    deserialize(change['NewImage']).get('count', 0))
+                changed += 1
+
+        else:
+            print(f"Skipping record from unknown table {table_name}")
+
+    return changed
+
+
+def rebuild(bucket_name: str):
+    """
+    Rebuilds the snapshot from a scan of both tables.
+    """
+    state = build_state()
+    write_snapshot(bucket_name, state)
+    print(f"Snapshot rebuilt with {len(state['products'])} products")
+
+
+def build_state():
+    """
+    Reads both tables in full to build a fresh, complete snapshot state.
+    The scans are consistent, so they include every write whose stream
+    record triggered the rebuild.
+    """
+    product_table = dynamodb.Table(os.environ['PRODUCTS_TABLE_NAME'])
+    stock_table = dynamodb.Table(os.environ['STOCK_TABLE_NAME'])
+
+    return {
+        'products': {str(item['id']): shape_product(item)
+                     for item in scan_all(product_table, ConsistentRead=True)},
+        'stocks': {str(item['product_id']): int(item.get('count', 0))
+                   for item in scan_all(stock_table, ConsistentRead=True)},
+        'complete': True,
+    }
+
+
+def render_products(state):
+    """
+    Joins products with stock counts into the public representation.
+    """
+    return [dict(product, count=state['stocks'].get(product_id, 0))
+            for product_id, product in state['products'].items()]
+
+
+def load_state(bucket_name: str):
+    """
+    Loads the snapshot state from S3, reusing the copy held by this warm
+    container when the object has not changed since.
+    """
+    request = {'Bucket': bucket_name, 'Key': STATE_KEY}
+    if _state_cache:
+        request['IfNoneMatch'] = _state_cache['etag']
+
+    try:
+        response = s3.get_object(**request)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code in ('304', 'NotModified'):
+            return _state_cache['state']
+        if code in ('NoSuchKey', '404'):
+            print("No snapshot state found")
+            return {'products': {}, 'stocks': {}, 'complete': False}
+        raise
+
+    state = json.loads(response['Body'].read())
+    _state_cache.update(etag=response['ETag'], state=state)
+    return state
+
+
+def write_snapshot(bucket_name: str, state):
+    """
+    Writes the state to S3, and both rendered snapshot formats once the
+    state is complete. These carry the "complete" metadata checked by
+    product_list, which ignores objects written without it.
+    """
+    if state.get('complete'):
+        products = render_products(state)
+
+        s3.put_object(
+            Bucket=bucket_name, Key=JSON_KEY,
+            Body=json.dumps(products).encode('utf-8'),
+            ContentType='application/json', Metadata={'complete': 'true'})
+        s3.put_object(
+            Bucket=bucket_name, Key=NDJSON_KEY,
+            Body=''.join(json.dumps(product) + '\n'
+                         for product in products).encode('utf-8'),
+            ContentType='application/x-ndjson', Metadata={'complete': 'true'})
+
+    response = s3.put_object(
+        Bucket=bucket_name, Key=STATE_KEY,
+        Body=json.dumps(state).encode('utf-8'),
+        ContentType='application/json')
+    _state_cache.update(etag=response['ETag'], state=state)
+
+
+def deserialize(image):
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
@@ -0,0 +1,163 @@
+import os
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+
+try:
+    from .product_items import CATALOG_PK
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_items import CATALOG_PK
+
+
+dynamodb_client = boto3.client('dynamodb', region_name=os.getenv("AWS_REGION"))
+deserializer = TypeDeserializer()
+
+# Item of the catalog counters table read by GET /products/stats
+STATS_ID = 'catalog'
+
+
+def handler(event, _context):
+    """
+    Handler for DynamoDB Streams events of the products and stocks tables.
+
+    Keeps the catalog counters read by GET /products/stats up to date.
+    The streams carry old and new images (NEW_AND_OLD_IMAGES), so that an
+    overwritten product or stock item only applies the difference to the
+    counters instead of being counted again. All records of a batch are
+    folded into a single ADD update. When a product price changed, the
+    price extremes are read again from the price sort index.
+
+    The product writers never touch the counters item, which would make
+    their transactions conflict with each other.
+
+    Args:
+        event: DynamoDB Streams event
+        _context: Lambda context
+    """
+    records = event.get('Records') or []
+    if not records:
+        print("No records to process")
+        return
+
+    stats_table_name = os.environ['STATS_TABLE_NAME']
+    deltas, prices_changed = aggregate_records(records)
+
+    if any(deltas.values()):
+        dynamodb_client.update_item(
+            TableName=stats_table_name,
+            Key={'id': {'S': STATS_ID}},
+            UpdateExpression='ADD product_count :products, '
+                             'stock_units :units, price_sum :price_sum',
+            ExpressionAttributeValues={
+                ':products': {'N': str(deltas['product_count'])},
+                ':units': {'N': str(deltas['stock_units'])},
+                ':price_sum': {'N': str(deltas['price_sum'])}
+            }
+        )
+
+    if prices_changed:
+        update_price_extremes(stats_table_name)
+
+    print(f"Applied {len(records)} change records to the catalog stats: {deltas}")
+
+
+def aggregate_records(records):
+    """
+    Folds stream records into counter deltas.
+
+    Returns:
+        tuple: ({"product_count", "stock_units", "price_sum"} deltas,
+            whether any product price was added, changed or removed)
+    """
+    product_table_name = os.environ['PRODUCTS_TABLE_NAME']
+    stock_table_name = os.environ['STOCK_TABLE_NAME']
+
+    deltas = {'product_count': 0, 'stock_units': 0, 'price_sum': Decimal(0)}
+    prices_changed = False
+    for record in records:
+        table_name = record['eventSourceARN'].split(':table/')[1].split('/')[0]
+        change = record['dynamodb']
+        old_image = deserialize(change.get('OldImage') or {})
+        new_image = deserialize(change.get('NewImage') or {})
+
+        if table_name == product_table_name:
+            deltas['product_count'] += bool(new_image) - bool(old_image)
+            deltas['price_sum'] += (new_image.get('price', 0)
+                                    - old_image.get('price', 0))
+            prices_changed |= new_image.get('price') != old_image.get('price')
+
+        elif table_name == stock_table_name:
+            deltas['stock_units'] += (new_image.get('count', 0)
+                                      - old_image.get('count', 0))
+
+        else:
+            print(f"Skipping record from unknown table {table_name}")
+
+    return deltas, prices_changed
+
+
+def update_price_extremes(stats_table_name):
+    """
+    Stores the prices of the cheapest and the most expensive product as
+    min_price / max_price of the catalog counters, see read_price_extremes().
+    Reading them again, instead of only moving them outward, also follows
+    price rises of the cheapest product and removed products.
+    """
+    try:
+        extremes = read_price_extremes()
+        if extremes:
+            update_kwargs = {
+                'UpdateExpression': 'SET min_price = :min_price, '
+                                    'max_price = :max_price',
+                'ExpressionAttributeValues': {
+                    ':min_price': extremes[0],
+                    ':max_price': extremes[1]
+                }
+            }
+        else:
+            update_kwargs = {'UpdateExpression': 'REMOVE min_price, max_price'}
+
+        dynamodb_client.update_item(
+            TableName=stats_table_name,
+            Key={'id': {'S': STATS_ID}},
+            **update_kwargs
+        )
+    except Exception as e:
+        # The sums are already applied, a retried batch would apply
+        # them twice
+        print(f"Warning: could not update the price extremes: {str(e)}")
+
+
+def read_price_extremes():
+    """
+    Reads the lowest and the highest price with one Limit=1 query each way
+    on the price sort index. The index is eventually consistent: a change
+    it does not show yet is picked up with the next product write.
+
+    Returns:
+        tuple: (min price, max price) as typed attribute values, None when
+            there are no products
+    """
+    prices = []
+    for forward in (True, False):
+        result = dynamodb_client.query(
+            TableName=os.environ['PRODUCTS_TABLE_NAME'],
+            IndexName=os.getenv('PRICE_SORT_INDEX_NAME', 'price-sort-index'),
+            KeyConditionExpression='catalog_pk = :catalog_pk',
+            ExpressionAttributeValues={':catalog_pk': {'S': CATALOG_PK}},
+            ProjectionExpression='#price',
+            ExpressionAttributeNames={'#price': 'price'},
+            ScanIndexForward=forward,
+            Limit=1
+        )
+        items = result.get('Items') or []
+        if not items:
+            return None
+        prices.append(items[0]['price'])
+
+    return tuple(prices)
+
+
+def deserialize(image):
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
@@ -1,12 +1,26 @@
+import hashlib
 import json
 import os
+import time
 import traceback
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 
 from botocore.exceptions import ClientError
 
+try:
+    from .product_http import get_body, get_header
+    from .product_items import (change_log_put, change_version,
+                                notify_search_indexer, product_item,
+                                stock_item)
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_http import get_body, get_header
+    from product_items import (change_log_put, change_version,
+                               notify_search_indexer, product_item,
+                               stock_item)
+
 # Common headers:
 HEADERS = {
     'Access-Control-Allow-Origin': '*',
@@ -15,21 +29,71 @@ HEADERS = {
     'Content-Type': 'application/json'
 }
 
+# Responses of POST /products with an Idempotency-Key header are kept this
+# long; retries with the same key within that time replay the response
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Rules of the POST /products body, shared with the API Gateway request
+# model (see ApiGateway) so that both reject the same bodies
+with open(os.path.join(os.path.dirname(__file__), 'product_schema.json')) as f:
+    PRODUCT_SCHEMA = json.load(f)
+
+# Python types of the JSON Schema types used in PRODUCT_SCHEMA
+SCHEMA_TYPES = {'string': str, 'number': (int, float), 'integer': int}
+
+# TransactWriteItems accepts at most 100 actions. Every product takes three
+# (product, stock and change log Puts).
+TRANSACT_MAX_ACTIONS = 100
+BATCH_CHUNK_SIZE = TRANSACT_MAX_ACTIONS // 3
+
+# Limits of POST /products/batch. Chunks only write their own new items
+# (the stats counters are maintained from the table streams), so parallel
+# transactions do not conflict.
+MAX_BATCH_PRODUCTS = int(os.getenv("MAX_BATCH_PRODUCTS", "500"))
+BATCH_WRITE_CONCURRENCY = int(os.getenv("BATCH_WRITE_CONCURRENCY", "4"))
+
 
 def handler(event, _context):
     """
     Lambda handler for POST /products endpoint.
+
+    With an Idempotency-Key header, the response is recorded in the same
+    transaction as the product. Retries with the same key and body get the
+    recorded response (Idempotent-Replayed: true) instead of creating
+    another product; reusing a key with a different body is answered
+    with 422.
     """
     print("POST /products request received")
 
     try:
-        body = json.loads(event["body"])
+        body = json.loads(get_body(event) or "{}")
+
+        idempotency_key = get_header(event, 'Idempotency-Key')
+        request_hash = None
+        if idempotency_key and os.getenv("IDEMPOTENCY_TABLE_NAME"):
+            if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                raise ValueError(
+                    f"Idempotency-Key must be at most "
+                    f"{IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+            request_hash = hashlib.sha256(
+                json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+            recorded = get_recorded_response(idempotency_key, request_hash)
+            if recorded:
+                return recorded
+        else:
+            idempotency_key = None
 
         validate_product_data(body)
         print("Request body validation successful")
 
         # Create product using transacton
-        new_product = create_product_transaction(body)
+        new_product = create_product_transaction(
+            body, idempotency_key, request_hash)
+        if new_product is None:
+            # A concurrent request with the same key was recorded first
+            return get_recorded_response(idempotency_key, request_hash)
 
         return {
             'statusCode': 201,
@@ -49,71 +113,56 @@ def handler(event, _context):
         return error_response(500, "Internal server error")
 
 
-def create_product_transaction(data):
+def create_product_transaction(data, idempotency_key=None, request_hash=None):
     """
     Creates a new product and its stock information using a DynamoDB transaction.
     Ensures atomicity: if stock creation fails, product is not created.
+
+    With an idempotency key, the response is recorded in the same
+    transaction. Returns None when the key has been recorded meanwhile.
     """
     # Initialize DynamoDB resources
-    dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION"))
     dynamodb_client = boto3.client('dynamodb')
 
-    product_table_name = os.getenv("PRODUCTS_TABLE_NAME")
-    stock_table_name = os.getenv("STOCK_TABLE_NAME")
-
-    if not product_table_name or not stock_table_name:
-        raise ValueError(
-            "Missing environment variables: PRODUCTS_TABLE_NAME or STOCK_TABLE_NAME")
+    table_names = get_table_names()
 
     # Generate a unique product ID
     product_id = str(uuid.uuid4())
+    version = change_version(product_id)
 
-    title = data.get('title')
-    description = data.get('description', '')
-    price = data.get('price')
-    count = data.get('count')
+    transaction_items = product_actions(table_names, product_id, data, version)
 
-    transaction_items = [
-        {
-            'Put': {
-                'TableName': product_table_name,
-                'Item': {
-                    'id': {'S': product_id},
-                    'title': {'S': title},
-                    'description': {'S': description},
-                    'price': {'N': str(price)}
-                }
-            }
-        },
-        {
-            'Put': {
-                'TableName': stock_table_name,
-                'Item': {
-                    'product_id': {'S': product_id},
-                    'count': {'N': str(count)}
-                }
-            }
+    new_product = {
+        "message": "Product and stock created successfully",
+        "product": {
+            "id": product_id,
+            "title": data["title"],
+            "description": data["description"],
+            "price": data["price"],
+            "count": data["count"]
         }
-    ]
+    }
+
+    if idempotency_key:
+        transaction_items.append(idempotency_put(
+            idempotency_key, request_hash, 201, json.dumps(new_product)))
 
     try:
         response = dynamodb_client.transact_write_items(
             TransactItems=transaction_items)
         print(f"Transaction successful: {response}")
 
-        return {
-            "message": "Product and stock created successfully",
-            "product": {
-                "id": product_id,
-                "title": data["title"],
-                "description": data["description"],
-                "price": data["price"],
-                "count": data["count"]
-            }
-        }
+        notify_search_indexer([product_id])
+
+        return new_product
 
     except ClientError as e:
         if e.response['Error']['Code'] == 'TransactionCanceledException':
+            reasons = e.response.get('CancellationReasons') or []
+            if (idempotency_key and len(reasons) == len(transaction_items)
+                    and reasons[-1].get('Code') == 'ConditionalCheckFailed'):
+                print(f"Idempotency key {idempotency_key} already recorded")
+                return None
             raise ValueError(
                 "Transaction failed: Potential stock constraint violation.")
         raise
@@ -125,26 +174,265 @@ def create_product_transaction(data):
         raise
 
 
+def idempotency_put(idempotency_key, request_hash, status_code, body):
+    """
+    Builds the transaction Put recording the response of a request with an
+    Idempotency-Key header. Fails when the key is recorded and not expired
+    yet (TTL deletion may lag behind expires_at).
+    """
+    now = int(time.time())
+    return {
+        'Put': {
+            'TableName': os.getenv("IDEMPOTENCY_TABLE_NAME"),
+            'Item': {
+                'idempotency_key': {'S': idempotency_key},
+                'request_hash': {'S': request_hash},
+                'status_code': {'N': str(status_code)},
+                'response_body': {'S': body},
+                'expires_at': {'N': str(now + IDEMPOTENCY_TTL_HOURS * 3600)}
+            },
+            'ConditionExpression': 'attribute_not_exists(idempotency_key) '
+                                   'OR expires_at < :now',
+            'ExpressionAttributeValues': {':now': {'N': str(now)}}
+        }
+    }
+
+
+def get_recorded_response(idempotency_key, request_hash):
+    """
+    Returns the recorded response of an idempotency key, a 422 error when
+    the key was used for a different request body, or None when the key is
+    unknown or expired.
+    """
+    dynamodb_client = boto3.client('dynamodb')
+    item = dynamodb_client.get_item(
+        TableName=os.getenv("IDEMPOTENCY_TABLE_NAME"),
+        Key={'idempotency_key': {'S': idempotency_key}},
+        ConsistentRead=True
+    ).get('Item')
+
+    if not item or int(item['expires_at']['N']) < time.time():
+        return None
+
+    if item['request_hash']['S'] != request_hash:
+        return error_response(
+            422, "Idempotency-Key was already used with a different request")
+
+    print(f"Replaying response of idempotency key {idempotency_key}")
+    return {
+        'statusCode': int(item['status_code']['N']),
+        'headers': dict(HEADERS, **{'Idempotent-Replayed': 'true'}),
+        'body': item['response_body']['S']
+    }
+
+
+def batch_handler(event, _context):
+    """
+    Lambda handler for POST /products/batch endpoint.
+
+    Creates up to MAX_BATCH_PRODUCTS products: {"products": [...]}.
+    Every product is validated with validate_product_data(). Valid products
+    are written in transactions of BATCH_CHUNK_SIZE products which run
+    concurrently; a transaction creates all of its products or none.
+
+    Returns one result per product, in request order:
+    {"items": [{"status": "created", "product": {...}} |
+               {"status": "failed", "error": "..."} |
+               {"status": "unknown", "error": "..."}],
+     "created": int, "failed": int, "unknown": int}
+
+    "unknown" means the transaction did not answer, e.g. it timed out: it
+    may or may not have committed, so clients should check before retrying.
+    """
+    print("POST /products/batch request received")
+
+    try:
+        products = parse_products(json.loads(get_body(event) or "{}"))
+        table_names = get_table_names()
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    results = [None] * len(products)
+    valid = []
+    for index, data in enumerate(products):
+        try:
+            if not isinstance(data, dict):
+                raise ValueError("Product must be an object")
+            validate_product_data(data)
+            valid.append(index)
+        except ValueError as e:
+            results[index] = {'status': 'failed', 'error': str(e)}
+
+    try:
+        dynamodb_client = boto3.client('dynamodb')
+        chunks = [valid[start:start + BATCH_CHUNK_SIZE]
+                  for start in range(0, len(valid), BATCH_CHUNK_SIZE)]
+
+        with ThreadPoolExecutor(max_workers=BATCH_WRITE_CONCURRENCY) as executor:
+            futures = [
+                (chunk, executor.submit(
+                    write_product_chunk, dynamodb_client, table_names,
+                    [products[index] for index in chunk]))
+                for chunk in chunks
+            ]
+
+            for chunk, future in futures:
+                try:
+                    created = future.result()
+                except ClientError as e:
+                    print(f"DynamoDB error: {json.dumps(e.response, indent=2)}")
+                    error = "Database error: " + e.response['Error'].get(
+                        'Message', 'Unknown error')
+                    for index in chunk:
+                        results[index] = {'status': 'failed', 'error': error}
+                    continue
+                except Exception as e:
+                    print(f"Transaction outcome unknown: {str(e)}")
+                    for index in chunk:
+                        results[index] = {
+                            'status': 'unknown',
+                            'error': "Database did not respond, the product "
+                                     "may have been created"}
+                    continue
+
+                for index, product in zip(chunk, created):
+                    results[index] = {'status': 'created', 'product': product}
+
+        created = [result['product'] for result in results
+                   if result['status'] == 'created']
+        notify_search_indexer([product['id'] for product in created])
+        unknown = sum(result['status'] == 'unknown' for result in results)
+
+        print(f"Created {len(created)} of {len(products)} products")
+
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': json.dumps({
+                'items': results,
+                'created': len(created),
+                'failed': len(products) - len(created) - unknown,
+                'unknown': unknown
+            })
+        }
+
+    except Exception as e:
+        print(f"Unhandled server error: {str(e)}")
+        print(traceback.format_exc())  # Log full traceback
+        return error_response(500, "Internal server error")
+
+
+def write_product_chunk(dynamodb_client, table_names, products):
+    """
+    Creates validated products, with their stock, in one transaction.
+
+    Returns:
+        list: the created products, in the order of products
+    """
+    transaction_items = []
+    created = []
+    for data in products:
+        product_id = str(uuid.uuid4())
+        version = change_version(product_id)
+        transaction_items.extend(
+            product_actions(table_names, product_id, data, version))
+        created.append({
+            "id": product_id,
+            "title": data["title"],
+            "description": data["description"],
+            "price": data["price"],
+            "count": data["count"]
+        })
+
+    dynamodb_client.transact_write_items(TransactItems=transaction_items)
+    return created
+
+
+def parse_products(body):
+    """
+    Returns the products of a POST /products/batch body.
+    Raises ValueError on invalid bodies.
+    """
+    products = body.get('products') if isinstance(body, dict) else None
+    if not isinstance(products, list) or not products:
+        raise ValueError("Body must contain a non-empty products list")
+
+    if len(products) > MAX_BATCH_PRODUCTS:
+        raise ValueError(
+            f"At most {MAX_BATCH_PRODUCTS} products can be created at once")
+
+    return products
+
+
+def get_table_names():
+    """
+    Returns the names of the products, stock and changes tables.
+    Raises ValueError when one is not configured.
+    """
+    table_names = (os.getenv("PRODUCTS_TABLE_NAME"),
+                   os.getenv("STOCK_TABLE_NAME"),
+                   os.getenv("CHANGES_TABLE_NAME"))
+
+    if not all(table_names):
+        raise ValueError(
+            "Missing environment variables: PRODUCTS_TABLE_NAME, "
+            "STOCK_TABLE_NAME or CHANGES_TABLE_NAME")
+
+    return table_names
+
+
+def product_actions(table_names, product_id, data, version):
+    """
+    Builds the transaction Puts creating a validated product: the product
+    item, its stock item and the change log entry.
+    """
+    product_table_name, stock_table_name, changes_table_name = table_names
+
+    title = data.get('title')
+    description = data.get('description', '')
+    price = data.get('price')
+
+    return [
+        {
+            'Put': {
+                'TableName': product_table_name,
+                'Item': product_item(
+                    product_id, title, description, price, version)
+            }
+        },
+        {
+            'Put': {
+                'TableName': stock_table_name,
+                'Item': stock_item(product_id, data.get('count'), version)
+            }
+        },
+        change_log_put(changes_table_name, product_id, version)
+    ]
+
+
 def validate_product_data(data):
     """
-    Validates the incoming product data.
+    Validates the incoming product data against PRODUCT_SCHEMA.
     Raises ValueError if validation fails.
     """
-    required_fields = {'title': str, 'description': str,
-                       'price': (int, float), 'count': int}
-
-    for field, expected_type in required_fields.items():
+    for field in PRODUCT_SCHEMA['required']:
         if field not in data:
             raise ValueError(f"Missing required field: {field}")
-        if not isinstance(data[field], expected_type):
-            raise ValueError(
-                f"Field '{field}' must be of type {expected_type.__name__}")
 
-    if data['price'] < 0:
-        raise ValueError("Price must be a non-negative number")
+    for field, rules in PRODUCT_SCHEMA['properties'].items():
+        if field not in data:
+            continue
 
-    if data['count'] < 0:
-        raise ValueError("Stock count cannot be negative")
+        value = data[field]
+        # bool is an int in Python but not a number in JSON
+        if (isinstance(value, bool)
+                or not isinstance(value, SCHEMA_TYPES[rules['type']])):
+            raise ValueError(
+                f"Field '{field}' must be of type {rules['type']}")
+
+        if 'minimum' in rules and value < rules['minimum']:
+            raise ValueError(
+                f"Field '{field}' must be at least {rules['minimum']}")
 
 
 def error_response(status_code, message):
@@ -1,6 +1,31 @@
+import base64
+import hashlib
 import json
 import os
+import time
+from collections import OrderedDict
+
 import boto3
+from botocore.exceptions import ClientError
+
+try:
+    from .product_http import (compress_response, compute_etag, get_body,
+                               get_header, matching_etag, parse_bool,
+                               parse_fields)
+    from .product_items import (BATCH_GET_MAX_KEYS, ID_FILTER_KEY,
+                                PRODUCT_FIELDS, batch_get, bloom_positions,
+                                changed_product_ids, decompress_text,
+                                deserialize, projection_kwargs,
+                                retained_version, shape_product)
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_http import (compress_response, compute_etag, get_body,
+                              get_header, matching_etag, parse_bool,
+                              parse_fields)
+    from product_items import (BATCH_GET_MAX_KEYS, ID_FILTER_KEY,
+                               PRODUCT_FIELDS, batch_get, bloom_positions,
+                               changed_product_ids, decompress_text,
+                               deserialize, projection_kwargs,
+                               retained_version, shape_product)
 
 
 # Common headers for all responses
@@ -11,11 +36,55 @@ HEADERS = {
     "Access-Control-Allow-Credentials": True,
 }
 
+# Attributes read along with the requested ?fields=: the version keys the ETag
+VERSION_ATTRIBUTES = ("version",)
+
+# Maximum number of ids accepted by POST /products/batchGet
+MAX_BATCH_IDS = int(os.getenv("MAX_BATCH_IDS", "100"))
+
+# Ids the filter of known product ids (ID_FILTER_KEY) rules out are answered
+# with 404 without reading the products, see ruled_out(). Warm containers
+# revalidate it after ID_FILTER_TTL seconds.
+ID_FILTER_TTL = int(os.getenv("ID_FILTER_TTL", "10"))
+
+# Warm containers keep recently read products. Entries are served for
+# PRODUCT_CACHE_TTL seconds; after that they are revalidated against the
+# versions the writers stamp on product and stock items, so a write becomes
+# visible after at most PRODUCT_CACHE_TTL seconds. 0 disables the cache.
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "5"))
+PRODUCT_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", "1000"))
+
+s3 = boto3.client("s3")
+
+# product id -> (fresh_until, item), least recently used first
+_product_cache = OrderedDict()
+_product_cache_stats = {"hits": 0, "misses": 0, "revalidations": 0,
+                        "evictions": 0}
+
+# Filter loaded by this container and the ids written since its version:
+# {"etag": ..., "checked_at": ..., "filter": {"m", "k", "bits", "version"}
+#  | None, "changed": set | None}
+_id_filter_cache = {}
+
 
 def handler(event, _context):
     """
     Lambda handler for GET /products/{productId} endpoint.
     Returns a single product with its stock information.
+
+    ?fields=id,title,price limits the attributes read and returned.
+
+    ?consistent=true reads product and stock as one consistent snapshot
+    (TransactGetItems) instead of a single eventually consistent
+    BatchGetItem.
+
+    Unknown ids are mostly answered from the id filter, see ruled_out().
+
+    Responses carry an ETag derived from the product and stock versions
+    maintained by the writers. A matching If-None-Match is answered with
+    304 after reading only the version attributes.
+
+    Products are served from a per-container cache, see cache_get().
     """
     # Log the event for debugging purposes
     print("GET /products/{{productId}} request received")
@@ -24,62 +93,496 @@ def handler(event, _context):
     if not event.get('pathParameters') or 'id' not in event['pathParameters']:
         return error_response(400, "Product ID is required")
 
+    params = event.get("queryStringParameters") or {}
+    try:
+        fields = parse_fields(params.get("fields"))
+        consistent = parse_bool("consistent", params.get("consistent"))
+    except ValueError as e:
+        return error_response(400, str(e))
+
     try:
         # Extract the product ID from the path parameters
         product_id = event["pathParameters"]["id"]
         print(f"Searching for product with ID: {product_id}")
 
+        # Consistent reads never trust the possibly stale filter
+        if not consistent and ruled_out([product_id]):
+            print(f"Product with ID {product_id} ruled out by id filter")
+            return error_response(404, "Product not found")
+
+        if_none_match = get_header(event, "If-None-Match")
+
+        # Consistent reads bypass the cache
+        item = None if consistent else cache_get(product_id)
+        log_cache_stats()
+
+        if item is not None:
+            body = render_product(item, fields)
+            etag = (version_etag(item.get("version"),
+                                 item.get("stock_version"), fields)
+                    or compute_etag(body))
+            matched = matching_etag(if_none_match, etag)
+            if matched:
+                return not_modified_response(matched)
+            return compress_response(event, {
+                "statusCode": 200,
+                "headers": dict(HEADERS, ETag=etag),
+                "body": body,
+            })
+
+        # Revalidation: compare versions before reading the whole item
+        if if_none_match and not consistent:
+            versions = get_product_versions(product_id, fields)
+            if versions is None:
+                print(f"Product with ID {product_id} not found")
+                return error_response(404, "Product not found")
+
+            etag = version_etag(*versions, fields)
+            matched = etag and matching_etag(if_none_match, etag)
+            if matched:
+                print(f"Product with ID {product_id} not modified")
+                return not_modified_response(matched)
+
         # Find the product with the specified ID
-        product = get_product_by_id(product_id)
+        item = get_product_item(product_id, fields, consistent)
 
-        if not product:
+        if not item:
             # return 404 if product was not found
             print(f"Product with ID {product_id} not found")
             return error_response(404, "Product not found")
 
-        print(f"Successfully retrieved product: {json.dumps(product)}")
+        # Only complete items can serve later requests for any fields
+        if fields is None:
+            cache_put(product_id, item)
 
-        return {
+        body = render_product(item, fields)
+        print(f"Successfully retrieved product: {body}")
+
+        # Items written before versions existed get a body hash instead
+        etag = (version_etag(item.get("version"), item.get("stock_version"),
+                             fields)
+                or compute_etag(body))
+        matched = matching_etag(if_none_match, etag)
+        if matched:
+            return not_modified_response(matched)
+
+        return compress_response(event, {
             "statusCode": 200,
-            "headers": HEADERS,
-            "body": json.dumps(product),
-        }
+            "headers": dict(HEADERS, ETag=etag),
+            "body": body,
+        })
 
     except Exception as e:
         print(f"Error: An unexpected error occurred: {str(e)}")
         return error_response(500, "Internal Server Error")
 
 
-def get_product_by_id(product_id: str):
+def batch_handler(event, _context):
+    """
+    Lambda handler for POST /products/batchGet endpoint.
+
+    Body: {"ids": ["...", ...]} with up to MAX_BATCH_IDS product ids.
+    Returns the products found, in request order, and the ids that do not
+    exist: {"items": [...], "missing": [...]}
+
+    ?fields= works as for GET /products/{productId}.
+    """
+    print("POST /products/batchGet request received")
+
+    params = event.get("queryStringParameters") or {}
+    try:
+        fields = parse_fields(params.get("fields"))
+        product_ids = parse_ids(json.loads(get_body(event) or "{}"))
+    except ValueError as e:
+        # json.JSONDecodeError is a ValueError as well
+        return error_response(400, str(e))
+
+    try:
+        absent = ruled_out(product_ids)
+        items = get_product_items(
+            [product_id for product_id in product_ids
+             if product_id not in absent], fields)
+        missing = [product_id for product_id in product_ids
+                   if product_id not in items]
+
+        print(f"Found {len(items)} of {len(product_ids)} products")
+
+        products = ", ".join(render_product(items[product_id], fields)
+                             for product_id in product_ids
+                             if product_id in items)
+        return compress_response(event, {
+            "statusCode": 200,
+            "headers": dict(HEADERS, **{"Access-Control-Allow-Methods": "POST"}),
+            "body": f'{{"items": [{products}], "missing": {json.dumps(missing)}}}',
+        })
+
+    except Exception as e:
+        print(f"Error: An unexpected error occurred: {str(e)}")
+        return error_response(500, "Internal Server Error")
+
+
+def parse_ids(body):
+    """
+    Validates the ids of a batch lookup body. Duplicates are dropped.
+    Raises ValueError on invalid input.
+    """
+    product_ids = body.get("ids") if isinstance(body, dict) else None
+    if not isinstance(product_ids, list) or not product_ids:
+        raise ValueError("ids must be a non-empty list")
+    if not all(isinstance(product_id, str) and product_id
+               for product_id in product_ids):
+        raise ValueError("ids must be non-empty strings")
+
+    product_ids = list(dict.fromkeys(product_ids))
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise ValueError(f"At most {MAX_BATCH_IDS} ids are allowed")
+
+    return product_ids
+
+
+def get_product_items(product_ids, fields: tuple = None):
+    """
+    Reads many products with their stock counts using chunked BatchGetItem
+    calls; each chunk holds both the product and the stock keys.
+
+    Returns:
+        dict: product id -> item as returned by get_product_item(), for the
+            products that exist.
+    """
+    stock_table_name = os.getenv("STOCK_TABLE_NAME")
+    product_table_name = os.getenv("PRODUCTS_TABLE_NAME")
+    with_stock = fields is None or "count" in fields
+    # a chunk of BATCH_GET_MAX_KEYS keys holds 50 product+stock pairs
+    chunk_size = BATCH_GET_MAX_KEYS // 2 if with_stock else BATCH_GET_MAX_KEYS
+
+    dynamodb_client = boto3.client("dynamodb", region_name=os.getenv("AWS_REGION"))
+    products = {}
+
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        request_items = {
+            product_table_name: {
+                "Keys": [{"id": {"S": product_id}} for product_id in chunk],
+                **projection_kwargs(fields, VERSION_ATTRIBUTES),
+            },
+        }
+        if with_stock:
+            request_items[stock_table_name] = {
+                "Keys": [{"product_id": {"S": product_id}}
+                         for product_id in chunk],
+            }
+
+        items = batch_get(dynamodb_client, request_items)
+        counts = {}
+        for stock in items.get(stock_table_name, []):
+            stock = deserialize(stock)
+            counts[stock["product_id"]] = stock.get("count", 0)
+
+        for product in items.get(product_table_name, []):
+            product = deserialize(product)
+            if with_stock:
+                product["count"] = counts.get(product["id"], 0)
+            products[product["id"]] = product
+
+    return products
+
+
+def cache_get(product_id: str):
+    """
+    Returns the cached item of a product, or None on a miss.
+
+    Entries older than PRODUCT_CACHE_TTL are revalidated with a
+    version-only read: unchanged entries are served for another TTL,
+    changed or deleted products are dropped and read again.
+    """
+    entry = _product_cache.get(product_id)
+    if entry is None:
+        _product_cache_stats["misses"] += 1
+        return None
+
+    fresh_until, item = entry
+    if time.time() >= fresh_until:
+        versions = get_product_versions(product_id)
+        if not versions or not versions[0] or versions != (
+                item.get("version"), item.get("stock_version")):
+            del _product_cache[product_id]
+            _product_cache_stats["misses"] += 1
+            return None
+
+        _product_cache[product_id] = (time.time() + PRODUCT_CACHE_TTL, item)
+        _product_cache_stats["revalidations"] += 1
+
+    _product_cache.move_to_end(product_id)
+    _product_cache_stats["hits"] += 1
+    return item
+
+
+def cache_put(product_id: str, item):
+    """
+    Caches a complete product item, evicting the least recently used
+    entries above PRODUCT_CACHE_MAX_ENTRIES.
+    """
+    if PRODUCT_CACHE_TTL <= 0 or PRODUCT_CACHE_MAX_ENTRIES <= 0:
+        return
+
+    _product_cache[product_id] = (time.time() + PRODUCT_CACHE_TTL, item)
+    _product_cache.move_to_end(product_id)
+    while len(_product_cache) > PRODUCT_CACHE_MAX_ENTRIES:
+        _product_cache.popitem(last=False)
+        _product_cache_stats["evictions"] += 1
+
+
+def log_cache_stats():
+    """
+    Logs the cache counters of this container.
+    """
+    stats = " ".join(f"{name}={value}"
+                     for name, value in _product_cache_stats.items())
+    print(f"Product cache: {stats} size={len(_product_cache)}")
+
+
+def get_product_versions(product_id: str, fields: tuple = None):
+    """
+    Reads only the version attributes of the product and, when "count" is
+    returned, of its stock item, with a single BatchGetItem.
+
+    Returns:
+        tuple: (product_version, stock_version), either may be None for
+            items written before versions existed; None if the product
+            does not exist.
+    """
+    stock_table_name = os.getenv("STOCK_TABLE_NAME")
+    product_table_name = os.getenv("PRODUCTS_TABLE_NAME")
+
+    request_items = {
+        product_table_name: {
+            "Keys": [{"id": {"S": product_id}}],
+            "ProjectionExpression": "#id, #version",
+            "ExpressionAttributeNames": {"#id": "id", "#version": "version"},
+        },
+    }
+    if fields is None or "count" in fields:
+        request_items[stock_table_name] = {
+            "Keys": [{"product_id": {"S": product_id}}],
+            "ProjectionExpression": "#product_id, #version",
+            "ExpressionAttributeNames": {"#product_id": "product_id",
+                                         "#version": "version"},
+        }
+
+    dynamodb_client = boto3.client("dynamodb", region_name=os.getenv("AWS_REGION"))
+    items = batch_get(dynamodb_client, request_items)
+
+    products = items.get(product_table_name, [])
+    if not products:
+        return None
+    stocks = items.get(stock_table_name, [])
+
+    product_version = products[0].get("version", {}).get("S")
+    stock_version = stocks[0].get("version", {}).get("S") if stocks else None
+    return product_version, stock_version
+
+
+def version_etag(product_version, stock_version, fields: tuple = None):
+    """
+    Builds the ETag of a product representation from the item versions,
+    or None when the product item has no version.
+    """
+    if not product_version:
+        return None
+
+    fields = fields or PRODUCT_FIELDS
+    if "count" not in fields:
+        stock_version = None
+    key = f"{product_version}|{stock_version or ''}|{','.join(fields)}"
+    return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def not_modified_response(etag: str):
+    return {
+        "statusCode": 304,
+        "headers": dict(HEADERS, ETag=etag),
+        "body": "",
+    }
+
+
+def ruled_out(product_ids):
+    """
+    Returns the ids among product_ids that certainly do not exist, without
+    reading the products: those the id filter rules out that were not
+    written since the filter's version either.
+
+    The filter and the ids written since its version are both refreshed once
+    per ID_FILTER_TTL, so a product created meanwhile may be answered with
+    404 by a warm container for up to ID_FILTER_TTL seconds; consistent
+    reads never consult the filter. Without a filter, or with one the
+    change log no longer covers, no id is ruled out.
+    """
+    id_filter = load_id_filter()
+    if not id_filter or (id_filter.get("version") or "") < retained_version():
+        return set()
+
+    absent = {product_id for product_id in product_ids
+              if not might_exist(product_id, id_filter)}
+    if absent:
+        absent -= changed_since_filter(id_filter)
+    return absent
+
+
+def changed_since_filter(id_filter):
+    """
+    Returns the ids of the products written since the filter's version,
+    read from the change log once per filter check, see load_id_filter().
+    """
+    if _id_filter_cache.get("changed") is None:
+        dynamodb_client = boto3.client(
+            "dynamodb", region_name=os.getenv("AWS_REGION"))
+        _id_filter_cache["changed"] = changed_product_ids(
+            dynamodb_client, id_filter["version"])
+    return _id_filter_cache["changed"]
+
+
+def might_exist(product_id: str, id_filter=None) -> bool:
+    """
+    Checks the product id against the Bloom filter of known ids, the one
+    cached by this container unless id_filter is given. False means the
+    product was not written before the filter's version, see ruled_out();
+    without a filter every id might exist.
+    """
+    id_filter = id_filter or load_id_filter()
+    if not id_filter:
+        return True
+
+    bits = id_filter["bits"]
+    return all(bits[position // 8] & (1 << (position % 8))
+               for position in bloom_positions(
+                   product_id, id_filter["m"], id_filter["k"]))
+
+
+def load_id_filter():
+    """
+    Loads the id filter lazily and keeps it in the warm container, checking
+    S3 for a newer one with a conditional GET every ID_FILTER_TTL seconds.
+    Every check also drops the ids read by changed_since_filter().
+    Returns None when no bucket is configured or no filter was built yet.
+    """
+    bucket_name = os.getenv("CATALOG_BUCKET_NAME")
+    if not bucket_name:
+        return None
+
+    now = time.time()
+    if (_id_filter_cache
+            and now - _id_filter_cache["checked_at"] < ID_FILTER_TTL):
+        return _id_filter_cache["filter"]
+
+    request = {"Bucket": bucket_name, "Key": ID_FILTER_KEY}
+    if _id_filter_cache.get("etag"):
+        request["IfNoneMatch"] = _id_filter_cache["etag"]
+
+    try:
+        response = s3.get_object(**request)
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        if code in ("304", "NotModified"):
+            _id_filter_cache.update(checked_at=now, changed=None)
+            return _id_filter_cache["filter"]
+        if code not in ("NoSuchKey", "404"):
+            # fail open: without a filter every id is looked up
+            print(f"Warning: could not load the id filter: {str(e)}")
+        _id_filter_cache.update(
+            etag=None, checked_at=now, filter=None, changed=None)
+        return None
+
+    id_filter = json.loads(response["Body"].read())
+    id_filter["bits"] = base64.b64decode(id_filter["bits"])
+    _id_filter_cache.update(
+        etag=response["ETag"], checked_at=now, filter=id_filter, changed=None)
+    return id_filter
+
+
+def get_product_by_id(product_id: str, fields: tuple = None,
+                      consistent: bool = False):
     """
     Retrieves a specific product and its stock information by product ID.
+
+    Args:
+        product_id: The product to look up.
+        fields: Attributes to read and return, None for all of them.
+            The stock table is not read unless "count" is included.
+        consistent: Read product and stock as one consistent snapshot.
+    """
+    item = get_product_item(product_id, fields, consistent)
+    return shape_product(item, fields) if item else None
+
+
+def get_product_item(product_id: str, fields: tuple = None,
+                     consistent: bool = False):
     """
+    Reads the product item by ID with the stock count merged in as "count",
+    or None when the product does not exist. See get_product_by_id().
 
-    dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION"))
+    Product and stock are fetched in a single round trip: one BatchGetItem,
+    or TransactGetItems when a consistent snapshot of both is requested.
+    """
     stock_table_name = os.getenv("STOCK_TABLE_NAME")
     product_table_name = os.getenv("PRODUCTS_TABLE_NAME")
 
-    product_table = dynamodb.Table(product_table_name)
-    stock_table = dynamodb.Table(stock_table_name)
+    if fields is not None and "count" not in fields:
+        # No stock needed, a single GetItem
+        dynamodb = boto3.resource(
+            "dynamodb", region_name=os.getenv("AWS_REGION"))
+        product_table = dynamodb.Table(product_table_name)
+        return product_table.get_item(
+            Key={"id": product_id}, **projection_kwargs(fields, VERSION_ATTRIBUTES)).get("Item")
+
+    dynamodb_client = boto3.client("dynamodb", region_name=os.getenv("AWS_REGION"))
+    product_key = {"id": {"S": product_id}}
+    stock_key = {"product_id": {"S": product_id}}
 
-    # Get product
-    product_response = product_table.get_item(Key={"id": product_id})
-    product = product_response.get("Item")
+    if consistent:
+        response = dynamodb_client.transact_get_items(TransactItems=[
+            {"Get": {"TableName": product_table_name, "Key": product_key,
+                     **projection_kwargs(fields, VERSION_ATTRIBUTES)}},
+            {"Get": {"TableName": stock_table_name, "Key": stock_key}},
+        ])
+        product, stock = (result.get("Item")
+                          for result in response["Responses"])
+    else:
+        items = batch_get(dynamodb_client, {
+            product_table_name: {"Keys": [product_key],
+                                 **projection_kwargs(fields, VERSION_ATTRIBUTES)},
+            stock_table_name: {"Keys": [stock_key]},
+        })
+        product = next(iter(items.get(product_table_name, [])), None)
+        stock = next(iter(items.get(stock_table_name, [])), None)
 
     if not product:
         return None
 
-    # Get stock information
-    stock_response = stock_table.get_item(Key={"product_id": product_id})
+    product = deserialize(product)
 
     # Add stock information to the product
-    product["count"] = int(stock_response.get(
-        "Item", {"count": 0}).get("count"))
-    product['price'] = float(product['price'])
+    stock = deserialize(stock) if stock else {}
+    product["count"] = stock.get("count", 0)
+    product["stock_version"] = stock.get("version")
 
     return product
 
 
+def render_product(item, fields: tuple = None) -> str:
+    """
+    Serializes a product item read by get_product_item().
+
+    With all fields requested, the JSON pre-rendered by the writers
+    (product_json) is used and only the stock count is spliced in.
+    Items written before product_json existed are converted field by field.
+    """
+    if fields is None and "product_json" in item:
+        product_json = decompress_text(item["product_json"])
+        return f'{product_json[:-1]}, "count": {int(item.get("count", 0))}}}'
+
+    return json.dumps(shape_product(item, fields))
+
+
 def error_response(status_code: int, message: str):
     """
     Helper function to create error responses.
@@ -0,0 +1,175 @@
+import base64
+import binascii
+import json
+import os
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+try:
+    from .product_items import (CHANGES_FEED, get_products, retained_version,
+                                settled_version)
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_items import (CHANGES_FEED, get_products, retained_version,
+                               settled_version)
+
+
+# Common headers for all responses
+HEADERS = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET",
+    "Access-Control-Allow-Credentials": True,
+}
+
+# Maximum number of change log entries read per request
+CHANGES_PAGE_LIMIT = int(os.getenv("CHANGES_PAGE_LIMIT", "500"))
+
+
+def handler(event, _context):
+    """
+    Lambda handler for GET /products/changes endpoint.
+
+    Returns the products (with stock) changed since the version token
+    passed as ?since=, together with a new token:
+    {"items": [...], "removed": [...], "nextToken": "...", "hasMore": bool}
+
+    Without ?since= no items are returned, only a token to start from:
+    clients fetch it before downloading the full catalog.
+    """
+    print("GET /products/changes request received")
+
+    params = event.get("queryStringParameters") or {}
+
+    try:
+        since = decode_token(params.get("since"))
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    # Entries are only read, and tokens only advance, up to now -
+    # CHANGES_SETTLE_MS. Clients may see the same product twice and should
+    # upsert.
+    settled = settled_version()
+
+    if since is None:
+        return response(200, {
+            "items": [],
+            "removed": [],
+            "nextToken": encode_token(settled),
+            "hasMore": False,
+        })
+
+    if since < retained_version():
+        return error_response(
+            410, "Token expired, reload the full catalog")
+
+    try:
+        product_ids, last_version, has_more = get_changed_product_ids(
+            since, settled)
+        dynamodb_client = boto3.client(
+            "dynamodb", region_name=os.getenv("AWS_REGION"))
+        products = get_products(dynamodb_client, product_ids)
+
+        found = {product["id"] for product in products}
+        next_version = last_version if has_more else max(since, settled)
+
+        print(f"Returning {len(products)} changed products since {since}")
+
+        return response(200, {
+            "items": products,
+            "removed": [product_id for product_id in product_ids
+                        if product_id not in found],
+            "nextToken": encode_token(next_version),
+            "hasMore": has_more,
+        })
+
+    except Exception as e:
+        print(f"Error: An unexpected error occurred: {str(e)}")
+        return error_response(500, "Internal Server Error")
+
+
+def get_changed_product_ids(since: str, until: str):
+    """
+    Reads change log entries newer than `since`, up to `until`, with
+    consistent reads so that no committed entry below `until` is skipped.
+
+    Returns:
+        tuple: (product_ids, last_version, has_more) with product ids unique
+            and in order of their latest change.
+    """
+    if since >= until:
+        return [], None, False
+
+    dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION"))
+    changes_table = dynamodb.Table(os.getenv("CHANGES_TABLE_NAME"))
+
+    query_kwargs = {
+        "KeyConditionExpression": (Key("feed").eq(CHANGES_FEED)
+                                   & Key("version").between(since, until)),
+        "ProjectionExpression": "version, product_id",
+        "ConsistentRead": True,
+    }
+
+    entries = []
+    last_key = None
+    while len(entries) < CHANGES_PAGE_LIMIT:
+        query_kwargs["Limit"] = CHANGES_PAGE_LIMIT - len(entries)
+        result = changes_table.query(**query_kwargs)
+        # between() includes `since`, the entry the previous page ended on
+        entries.extend(entry for entry in result.get("Items", [])
+                       if entry["version"] != since)
+
+        last_key = result.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_key
+
+    # keep the latest change of every product
+    product_ids = {}
+    for entry in entries:
+        product_ids.pop(entry["product_id"], None)
+        product_ids[entry["product_id"]] = entry["version"]
+
+    last_version = entries[-1]["version"] if entries else None
+    return list(product_ids), last_version, last_key is not None
+
+
+def encode_token(version: str) -> str:
+    """
+    Wraps a change log version into an opaque URL-safe token.
+    """
+    return base64.urlsafe_b64encode(version.encode("utf-8")).decode("ascii")
+
+
+def decode_token(token):
+    """
+    Unwraps a token produced by encode_token().
+    Raises ValueError if the token is malformed.
+    """
+    if not token:
+        return None
+
+    try:
+        version = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Invalid token")
+
+    if len(version) < 13 or not version[:13].isdigit():
+        raise ValueError("Invalid token")
+
+    return version
+
+
+def response(status_code: int, body):
+    return {
+        "statusCode": status_code,
+        "headers": HEADERS,
+        "body": json.dumps(body),
+    }
+
+
+def error_response(status_code: int, message: str):
+    """
+    Helper function to create error responses.
+    """
+    return response(status_code, {"message": message})
@@ -0,0 +1,164 @@
+import base64
+import gzip
+import hashlib
+import os
+
+try:
+    from .product_items import PRODUCT_FIELDS
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_items import PRODUCT_FIELDS
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+
+def get_header(event, name: str):
+    """
+    Case-insensitive lookup of a request header.
+    """
+    headers = (event or {}).get("headers") or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def get_body(event):
+    """
+    Returns the raw request body, decoding it when API Gateway passed it
+    base64-encoded (binary media types). None when there is no body.
+    """
+    body = (event or {}).get("body")
+    if body and event.get("isBase64Encoded"):
+        body = base64.b64decode(body).decode("utf-8")
+    return body
+
+
+def parse_fields(value):
+    """
+    Parses the ?fields= query parameter (comma separated attribute names).
+    Returns None when all fields are requested; "id" is always included.
+    Raises ValueError on unknown fields.
+    """
+    if not value:
+        return None
+
+    requested = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    return tuple(field for field in PRODUCT_FIELDS
+                 if field == "id" or field in requested)
+
+
+def parse_bool(name: str, value):
+    """
+    Parses a true/false query parameter, missing means false.
+    """
+    if value is None:
+        return False
+    if value.lower() in ("true", "1"):
+        return True
+    if value.lower() in ("false", "0"):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+
+def compute_etag(body: str) -> str:
+    """
+    Builds a strong ETag from the serialized response body.
+    """
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest() + '"'
+
+
+def matching_etag(if_none_match, etag: str):
+    """
+    Checks an If-None-Match header value against the current ETag with the
+    weak comparison, so that the weak ETags of compressed responses match.
+
+    Returns:
+        str: the matching entity tag sent by the client (the current ETag
+            for "*"), to be echoed in the 304; None when nothing matches.
+    """
+    if not if_none_match:
+        return None
+
+    for tag in (tag.strip() for tag in if_none_match.split(",")):
+        if tag == "*":
+            return etag
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return tag
+    return None
+
+
+def compress_response(event, response):
+    """
+    Compresses the response body according to the request's Accept-Encoding.
+
+    Brotli is preferred when the module is available, gzip otherwise. Bodies
+    smaller than COMPRESSION_MIN_SIZE bytes are returned unchanged.
+    Compressed bodies differ byte for byte from the identity body, so
+    their ETag is made weak.
+    """
+    body = response.get("body")
+    if not body or len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    accepted = parse_accept_encoding(get_header(event, "Accept-Encoding"))
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        encoding, compressed = "br", brotli.compress(body.encode("utf-8"))
+    elif accepted.get("gzip", 0) > 0:
+        encoding, compressed = "gzip", gzip.compress(
+            body.encode("utf-8"), compresslevel=6)
+    else:
+        return response
+
+    headers = dict(response["headers"], **{
+        "Content-Encoding": encoding,
+        "Vary": "Accept-Encoding",
+    })
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+
+    return dict(
+        response,
+        headers=headers,
+        body=base64.b64encode(compressed).decode("ascii"),
+        isBase64Encoded=True,
+    )
+
+
+def parse_accept_encoding(value):
+    """
+    Parses an Accept-Encoding header into {coding: q-value}.
+    """
+    accepted = {}
+    for part in (value or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    if "*" in accepted:
+        for coding in ("br", "gzip"):
+            accepted.setdefault(coding, accepted["*"])
+
+    return accepted
@@ -0,0 +1,385 @@
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.types import Binary, TypeDeserializer
+
+
+# Partition key value shared by all products in the sort indexes
+CATALOG_PK = 'PRODUCT'
+
+# Value of the in_stock attribute keying the sparse in-stock index
+IN_STOCK = 'Y'
+
+# Change log read by GET /products/changes
+CHANGES_FEED = 'products'
+CHANGES_RETENTION_DAYS = int(os.getenv("CHANGES_RETENTION_DAYS", "7"))
+
+# Readers of the change log only trust it up to now - CHANGES_SETTLE_MS, so
+# that writes from containers with a slightly late clock are still picked
+# up later.
+CHANGES_SETTLE_MS = int(os.getenv("CHANGES_SETTLE_MS", "5000"))
+
+# Descriptions (and the product JSON containing them) of at least this many
+# bytes are stored zlib-compressed as binary attributes. 0 disables it.
+DESCRIPTION_COMPRESSION_MIN_SIZE = int(
+    os.getenv("DESCRIPTION_COMPRESSION_MIN_SIZE", "0"))
+
+# Public product attributes, also the values accepted by ?fields=
+PRODUCT_FIELDS = ('id', 'title', 'description', 'price', 'count')
+
+# BatchGetItem accepts at most 100 keys per request
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_RETRIES = int(os.getenv("BATCH_GET_MAX_RETRIES", "5"))
+
+deserializer = TypeDeserializer()
+
+# Objects written by catalog_indexer into CATALOG_BUCKET_NAME: the search
+# index read by product_search and the Bloom filter of known product ids
+# read by product_by_id
+SEARCH_INDEX_KEY = 'search/index.json'
+ID_FILTER_KEY = 'filters/product-ids.json'
+
+# Last bucket of the price index. It holds every price of at least
+# 2 ** (MAX_PRICE_BUCKET - 1), so a price range never spans more buckets.
+MAX_PRICE_BUCKET = int(os.getenv("MAX_PRICE_BUCKET", "24"))
+
+
+def stock_item(product_id, count, version):
+    """
+    Builds a stocks table item. Only items with a positive count carry the
+    in_stock attribute, which keys the sparse in-stock index.
+    """
+    item = {
+        'product_id': {'S': product_id},
+        'count': {'N': str(count)},
+        'version': {'S': version}
+    }
+    if int(count) > 0:
+        item['in_stock'] = {'S': IN_STOCK}
+    return item
+
+
+def product_item(product_id, title, description, price, version):
+    """
+    Builds a products table item with the keys of the secondary indexes and
+    the rendered product_json. Index keys cannot be empty strings, so
+    untitled products are left out of the title sort index.
+    """
+    item = {
+        'id': {'S': product_id},
+        'title': {'S': title},
+        'description': text_attribute(description),
+        'price': {'N': str(price)},
+        'price_bucket': {'N': str(price_bucket(price))},
+        'catalog_pk': {'S': CATALOG_PK},
+        'product_json': text_attribute(render_product_json(
+            product_id, title, description, price)),
+        'version': {'S': version}
+    }
+    if title:
+        item['title_sort'] = {'S': title.lower()}
+    return item
+
+
+def change_version(product_id):
+    """
+    Version of a product write: sorts by write time in the change log and
+    is stored as "version" on the product and stock items, where it keys
+    the ETag of GET /products/{productId}.
+    """
+    return f"{int(time.time() * 1000):013d}#{product_id}"
+
+
+def change_log_put(changes_table_name, product_id, version=None):
+    """
+    Builds the transaction Put recording a product change for the
+    GET /products/changes feed. Versions sort by write time and expire
+    after CHANGES_RETENTION_DAYS.
+    """
+    now = time.time()
+    return {
+        'Put': {
+            'TableName': changes_table_name,
+            'Item': {
+                'feed': {'S': CHANGES_FEED},
+                'version': {'S': version or change_version(product_id)},
+                'product_id': {'S': product_id},
+                'expires_at': {'N': str(int(now) + CHANGES_RETENTION_DAYS * 86400)}
+            }
+        }
+    }
+
+
+def settled_version() -> str:
+    """
+    Change log version before which all writes are assumed to be visible,
+    see CHANGES_SETTLE_MS.
+    """
+    return f"{int(time.time() * 1000) - CHANGES_SETTLE_MS:013d}"
+
+
+def retained_version() -> str:
+    """
+    Oldest change log version that has not expired yet.
+    """
+    now_ms = int(time.time() * 1000)
+    return f"{now_ms - CHANGES_RETENTION_DAYS * 86400 * 1000:013d}"
+
+
+def changed_product_ids(dynamodb_client, since: str):
+    """
+    Reads the ids of the products written at or after the change log
+    version `since`, with consistent reads so that committed writes are
+    never missed.
+    """
+    query_kwargs = {
+        'TableName': os.getenv("CHANGES_TABLE_NAME"),
+        'KeyConditionExpression': '#feed = :feed AND #version >= :since',
+        'ProjectionExpression': '#product_id',
+        'ExpressionAttributeNames': {'#feed': 'feed', '#version': 'version',
+                                     '#product_id': 'product_id'},
+        'ExpressionAttributeValues': {':feed': {'S': CHANGES_FEED},
+                                      ':since': {'S': since}},
+        'ConsistentRead': True,
+    }
+
+    product_ids = set()
+    while True:
+        result = dynamodb_client.query(**query_kwargs)
+        product_ids.update(item['product_id']['S']
+                           for item in result.get('Items', []))
+        if not result.get('LastEvaluatedKey'):
+            return product_ids
+        query_kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def notify_search_indexer(product_ids):
+    """
+    Asks catalog_indexer to re-index the written products. The invocation
+    is asynchronous and best effort: the search index is only eventually
+    consistent and can be rebuilt with {"rebuild": true}.
+    """
+    function_name = os.getenv('SEARCH_INDEXER_FUNCTION_NAME')
+    if not function_name or not product_ids:
+        return
+
+    try:
+        lambda_client = boto3.client(
+            'lambda', region_name=os.getenv("AWS_REGION"))
+        lambda_client.invoke(
+            FunctionName=function_name,
+            InvocationType='Event',
+            Payload=json.dumps({'ids': product_ids}).encode('utf-8'))
+    except Exception as e:
+        print(f"Warning: could not notify the search indexer: {str(e)}")
+
+
+def render_product_json(product_id, title, description, price) -> str:
+    """
+    Renders the public JSON of a product without its stock count. Stored as
+    product_json so that the read handlers can return it without
+    converting every attribute; they splice in "count".
+    """
+    return json.dumps({
+        'id': product_id,
+        'title': title,
+        'description': description,
+        'price': float(Decimal(str(price)))
+    })
+
+
+def text_attribute(value: str):
+    """
+    Typed attribute value for a long text attribute: binary zlib data when
+    compression is enabled, the value is large enough and compressing it
+    actually saves space, a string otherwise. See decompress_text().
+    """
+    encoded = value.encode('utf-8')
+    if (DESCRIPTION_COMPRESSION_MIN_SIZE
+            and len(encoded) >= DESCRIPTION_COMPRESSION_MIN_SIZE):
+        compressed = zlib.compress(encoded, 9)
+        if len(compressed) < len(encoded):
+            return {'B': compressed}
+    return {'S': value}
+
+
+def decompress_text(value):
+    """
+    Returns a text attribute that the writers may have stored
+    zlib-compressed as binary, see text_attribute().
+    Accepts raw values as well as values deserialized by boto3.
+    """
+    if isinstance(value, Binary):
+        value = value.value
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+
+def shape_product(item, fields: tuple = None):
+    """
+    Converts a DynamoDB item into its public JSON representation,
+    keeping only the requested public attributes.
+    """
+    product = {field: item[field] for field in fields or PRODUCT_FIELDS
+               if field in item}
+
+    if 'description' in product:
+        product['description'] = decompress_text(product['description'])
+    if 'price' in product:
+        product['price'] = float(product['price'])
+    if 'count' in product:
+        product['count'] = int(product['count'])
+
+    return product
+
+
+def projection_kwargs(fields, extra: tuple = ()):
+    """
+    Builds ProjectionExpression arguments for the product attributes in
+    `fields` plus the `extra` attributes. All attribute names go through
+    placeholders since several of them are DynamoDB reserved words.
+    """
+    if fields is None:
+        return {}
+
+    names = {f"#{name}": name
+             for name in fields + tuple(extra) if name != 'count'}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names,
+    }
+
+
+def price_bucket(price) -> int:
+    """
+    Returns the price index bucket for a price: int(price).bit_length(),
+    so buckets double in width ([0, 1), [1, 2), [2, 4), [4, 8), ...),
+    capped at MAX_PRICE_BUCKET.
+    """
+    return min(max(int(Decimal(str(price))), 0).bit_length(),
+               MAX_PRICE_BUCKET)
+
+
+def tokenize(text: str):
+    """
+    Splits text into lower-case word tokens, for both indexing and search
+    queries.
+    """
+    return re.findall(r'\w+', text.lower())
+
+
+def scan_all(table, **scan_kwargs):
+    """
+    Scans a table to the end, following LastEvaluatedKey across 1 MB pages.
+    """
+    items = []
+    while True:
+        response = table.scan(**scan_kwargs)
+        items.extend(response.get('Items', []))
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return items
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+
+def bloom_positions(key: str, m: int, k: int):
+    """
+    Bit positions of a key in a Bloom filter of m bits and k hashes
+    (double hashing of SHA-256).
+    """
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:16], 'big') | 1
+    return [(h1 + i * h2) % m for i in range(k)]
+
+
+def get_products(dynamodb_client, product_ids):
+    """
+    Fetches products and their stock with chunked BatchGetItem calls,
+    keeping the order of product_ids. Ids without a product item are left
+    out.
+    """
+    product_items = batch_get_items(
+        dynamodb_client, os.getenv("PRODUCTS_TABLE_NAME"), 'id', product_ids,
+        **projection_kwargs(('id', 'title', 'description', 'price')))
+    stock_items = batch_get_items(
+        dynamodb_client, os.getenv("STOCK_TABLE_NAME"), 'product_id',
+        list(product_items), ProjectionExpression='#product_id, #count',
+        ExpressionAttributeNames={'#product_id': 'product_id',
+                                  '#count': 'count'})
+
+    return [
+        shape_product(dict(product_items[product_id], count=stock_items.get(
+            product_id, {}).get('count', 0)))
+        for product_id in product_ids if product_id in product_items
+    ]
+
+
+def batch_get_items(dynamodb_client, table_name: str, key_name: str, ids,
+                    **request_kwargs):
+    """
+    Reads items of one table by string key, BATCH_GET_MAX_KEYS keys per
+    batch_get() call. request_kwargs (e.g. ProjectionExpression) are added
+    to the request of the table.
+
+    Returns:
+        dict: key value -> item in Python types, for the keys that exist
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    items = {}
+
+    for start in range(0, len(unique_ids), BATCH_GET_MAX_KEYS):
+        responses = batch_get(dynamodb_client, {
+            table_name: {
+                'Keys': [{key_name: {'S': key}} for key in
+                         unique_ids[start:start + BATCH_GET_MAX_KEYS]],
+                **request_kwargs,
+            }
+        })
+        for item in responses.get(table_name, []):
+            item = deserialize(item)
+            items[item[key_name]] = item
+
+    return items
+
+
+def batch_get(dynamodb_client, request_items):
+    """
+    Runs one BatchGetItem request, which may span several tables, retrying
+    UnprocessedKeys with exponential backoff at most BATCH_GET_MAX_RETRIES
+    times.
+
+    Returns:
+        dict: table name -> list of items (low-level DynamoDB format)
+    """
+    items = {}
+    attempt = 0
+    while request_items:
+        result = dynamodb_client.batch_get_item(RequestItems=request_items)
+        for table_name, table_items in result.get('Responses', {}).items():
+            items.setdefault(table_name, []).extend(table_items)
+
+        request_items = result.get('UnprocessedKeys') or {}
+        if request_items:
+            attempt += 1
+            if attempt > BATCH_GET_MAX_RETRIES:
+                raise RuntimeError(
+                    f"Batch read of {', '.join(request_items)} did not complete")
+            time.sleep(min(0.05 * 2 ** attempt, 1))
+
+    return items
+
+
+def deserialize(item):
+    """
+    Converts a low-level DynamoDB item into Python types.
+    """
+    return {name: deserializer.deserialize(value) for name, value in item.items()}
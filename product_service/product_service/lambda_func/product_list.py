@@ -1,69 +1,833 @@
+import base64
+import binascii
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+try:
+    from .product_http import (compress_response, compute_etag, get_header,
+                               matching_etag, parse_bool, parse_fields)
+    from .product_items import (MAX_PRICE_BUCKET, batch_get_items,
+                                decompress_text, price_bucket,
+                                projection_kwargs, scan_all, shape_product)
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_http import (compress_response, compute_etag, get_header,
+                              matching_etag, parse_bool, parse_fields)
+    from product_items import (MAX_PRICE_BUCKET, batch_get_items,
+                               decompress_text, price_bucket,
+                               projection_kwargs, scan_all, shape_product)
+
+
+# Common headers for all responses
+HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET",
+    "Access-Control-Allow-Credentials": True,
+    "Content-Type": "application/json",
+}
+
+# Upper bound for the ?limit= query parameter
+MAX_PAGE_LIMIT = int(os.getenv("MAX_PAGE_LIMIT", "100"))
+
+# Number of parallel scan segments per table for full-catalog requests.
+# 1 keeps the plain sequential scan.
+SCAN_TOTAL_SEGMENTS = int(os.getenv("SCAN_TOTAL_SEGMENTS", "1"))
+
+# Seconds a serialized catalog response is reused by a warm container.
+# 0 disables the cache.
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "64"))
+
+# GSI on the products table: partition key price_bucket, sort key price.
+# A product with price p lives in bucket price_bucket(p), i.e. buckets
+# double in width: [0, 1), [1, 2), [2, 4), [4, 8), ... up to MAX_PRICE_BUCKET
+PRICE_INDEX_NAME = os.getenv("PRICE_INDEX_NAME", "price-index")
+
+# GSIs on the products table for ?sort=: partition key catalog_pk (the same
+# value for every product), sort key price / lower-cased title
+CATALOG_PK = "PRODUCT"
+SORT_INDEXES = {
+    "price": (os.getenv("PRICE_SORT_INDEX_NAME", "price-sort-index"), "price"),
+    "title": (os.getenv("TITLE_SORT_INDEX_NAME", "title-sort-index"), "title_sort"),
+}
+
+# Sparse GSI on the stocks table: only items with count > 0 carry the
+# in_stock attribute, so out-of-stock products are never read
+IN_STOCK_INDEX_NAME = os.getenv("IN_STOCK_INDEX_NAME", "in-stock-index")
+IN_STOCK = "Y"
+
+# Full-catalog requests can be answered from the S3 snapshot maintained by
+# catalog_snapshot.py: "serve" returns its body, "redirect" answers with a
+# 302 to a presigned URL. Empty reads DynamoDB.
+CATALOG_SNAPSHOT_MODE = os.getenv("CATALOG_SNAPSHOT_MODE", "")
+CATALOG_SNAPSHOT_KEY = "catalog/products.json"
+CATALOG_SNAPSHOT_URL_TTL = int(os.getenv("CATALOG_SNAPSHOT_URL_TTL", "300"))
+
+s3 = boto3.client("s3")
+deserializer = TypeDeserializer()
+serializer = TypeSerializer()
+
+# Survives across warm invocations: cache key -> (expires_at, body, etag)
+_catalog_cache = {}
+
+# Whether this container has seen a complete catalog snapshot
+_snapshot_status = {"complete": False}
 
 
-def handler(_event, _context):
+def handler(event, _context):
     """
     Lambda handler for GET /products endpoint.
     Returns a list of all products with their stock information.
+
+    When ?limit= or ?cursor= is passed, a single page is returned instead:
+    {"items": [...], "nextCursor": "..." | null}
+
+    ?fields=id,title,price limits the attributes read and returned; the stock
+    lookup is skipped unless "count" is requested.
+
+    ?minPrice= / ?maxPrice= are served by Query calls on the price index.
+
+    ?sort=price|title&order=asc|desc returns products sorted by a GSI sort
+    key; pages continue from the last sort key, not from an offset.
+
+    ?inStock=true only returns products with a count above zero. On its own
+    it is served from the sparse in-stock index of the stocks table.
+
+    Requests without parameters may be served from the S3 catalog snapshot,
+    see CATALOG_SNAPSHOT_MODE.
     """
     # Log incoming request
     print("GET /products request received")
 
+    params = (event or {}).get("queryStringParameters") or {}
+
     try:
-        products = get_products_with_stocks()
-        print(f"Successfully retrieved {len(products)} products")
+        limit = parse_limit(params.get("limit"))
+        start_key = decode_cursor(params.get("cursor"))
+        fields = parse_fields(params.get("fields"))
+        price_range = parse_price_range(
+            params.get("minPrice"), params.get("maxPrice"))
+        sort = parse_sort(params.get("sort"), params.get("order"))
+        in_stock = parse_bool("inStock", params.get("inStock"))
+        check_cursor(start_key, price_range, sort, in_stock)
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    cache_key = (limit, params.get("cursor"), fields, price_range, sort,
+                 in_stock)
+    full_catalog = cache_key == (None, None, None, None, None, False)
+
+    try:
+        if (full_catalog and CATALOG_SNAPSHOT_MODE == "redirect"
+                and catalog_snapshot_complete()):
+            return snapshot_redirect_response()
 
-        return {
+        cached = _cache_get(cache_key)
+        if cached:
+            body, etag = cached
+            print("Serving catalog from warm container cache")
+        else:
+            body = None
+            if full_catalog and CATALOG_SNAPSHOT_MODE == "serve":
+                body = read_catalog_snapshot()
+            if body is None:
+                body = render_json(load_catalog(
+                    limit, start_key, fields, price_range, sort, in_stock))
+            etag = compute_etag(body)
+            _cache_put(cache_key, body, etag)
+
+        matched = matching_etag(get_header(event, "If-None-Match"), etag)
+        if matched:
+            return {
+                "statusCode": 304,
+                "headers": dict(HEADERS, ETag=matched),
+                "body": "",
+            }
+
+        return compress_response(event, {
             "statusCode": 200,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET",
-                "Access-Control-Allow-Credentials": True,
-                "Content-Type": "application/json",
-            },
-            "body": json.dumps(products),
-        }
+            "headers": dict(HEADERS, ETag=etag),
+            "body": body,
+        })
     except Exception as e:
         print(f"Error occurred: {str(e)}")
+        return error_response(500, str(e))
 
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET",
-                "Access-Control-Allow-Credentials": True,
-                "Content-Type": "application/json",
-            },
-            "body": json.dumps({"error": str(e)}),
-        }
 
+def load_catalog(limit: int = None, start_key: dict = None, fields: tuple = None,
+                 price_range: tuple = None, sort: tuple = None,
+                 in_stock: bool = False):
+    """
+    Reads the response payload from DynamoDB: the full product list, or a
+    single page when limit or start_key is set.
+    """
+    paged = limit is not None or start_key is not None
+    page_limit = (limit or MAX_PAGE_LIMIT) if paged else None
 
-def get_products_with_stocks():
-    dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION"))
+    if sort or price_range or in_stock:
+        if sort:
+            products, last_key = get_products_sorted(
+                *sort, limit=page_limit, start_key=start_key, fields=fields,
+                price_range=price_range, in_stock=in_stock)
+        elif price_range:
+            products, last_key = get_products_by_price(
+                *price_range, limit=page_limit, start_key=start_key,
+                fields=fields, in_stock=in_stock)
+        else:
+            products, last_key = get_products_in_stock(
+                limit=page_limit, start_key=start_key, fields=fields)
+        print(f"Successfully retrieved {len(products)} products from index")
+        if not paged:
+            return products
+        return {"items": products, "nextCursor": encode_cursor(last_key)}
 
-    product_table_name = os.getenv("PRODUCTS_TABLE_NAME")
-    stock_table_name = os.getenv("STOCK_TABLE_NAME")
+    if limit is None and start_key is None:
+        products = get_products_with_stocks(fields=fields)
+        print(f"Successfully retrieved {len(products)} products")
+        return products
+
+    products, last_key = get_products_page(
+        limit or MAX_PAGE_LIMIT, start_key, fields)
+    print(f"Successfully retrieved page of {len(products)} products")
+    return {"items": products, "nextCursor": encode_cursor(last_key)}
+
+
+def read_catalog_snapshot():
+    """
+    Returns the serialized catalog from the S3 snapshot, or None when no
+    complete snapshot has been built yet.
+    """
+    try:
+        response = s3.get_object(
+            Bucket=os.environ["CATALOG_BUCKET_NAME"], Key=CATALOG_SNAPSHOT_KEY)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            print("Catalog snapshot not found, reading DynamoDB")
+            return None
+        raise
+
+    if not snapshot_marked_complete(response):
+        print("Catalog snapshot is not complete, reading DynamoDB")
+        return None
+
+    print("Serving catalog from S3 snapshot")
+    return response["Body"].read().decode("utf-8")
+
+
+def catalog_snapshot_complete() -> bool:
+    """
+    Checks that a complete catalog snapshot exists before redirecting to it.
+    Snapshots never become incomplete again, so a warm container only
+    checks until it has seen one.
+    """
+    if not _snapshot_status["complete"]:
+        try:
+            response = s3.head_object(
+                Bucket=os.environ["CATALOG_BUCKET_NAME"],
+                Key=CATALOG_SNAPSHOT_KEY)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            response = {}
+        _snapshot_status["complete"] = snapshot_marked_complete(response)
+        if not _snapshot_status["complete"]:
+            print("Catalog snapshot is not complete, reading DynamoDB")
+    return _snapshot_status["complete"]
+
+
+def snapshot_marked_complete(response) -> bool:
+    """
+    catalog_snapshot marks the snapshot objects built from a complete state
+    with the "complete" metadata; older objects may be truncated.
+    """
+    return (response.get("Metadata") or {}).get("complete") == "true"
+
+
+def snapshot_redirect_response():
+    """
+    Redirects the client to a presigned URL of the S3 catalog snapshot.
+    """
+    url = s3.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": os.environ["CATALOG_BUCKET_NAME"],
+            "Key": CATALOG_SNAPSHOT_KEY,
+        },
+        ExpiresIn=CATALOG_SNAPSHOT_URL_TTL,
+    )
 
-    product_table = dynamodb.Table(product_table_name)
-    stock_table = dynamodb.Table(stock_table_name)
+    return {
+        "statusCode": 302,
+        "headers": dict(HEADERS, Location=url),
+        "body": "",
+    }
 
-    # get all products
-    product_response = product_table.scan()
+
+def get_products_with_stocks(total_segments: int = None, fields: tuple = None):
+    """
+    Retrieves the whole catalog, following LastEvaluatedKey until both
+    tables are fully read.
+
+    Args:
+        total_segments: Number of parallel scan segments per table.
+            Defaults to SCAN_TOTAL_SEGMENTS; with more than one segment both
+            tables are scanned at the same time.
+        fields: Attributes to read and return, None for all of them.
+            The stocks table is not read unless "count" is included.
+    """
+    total_segments = total_segments or SCAN_TOTAL_SEGMENTS
+    product_table, stock_table = _get_tables()
+    with_stock = fields is None or "count" in fields
+    tables = [product_table, stock_table] if with_stock else [product_table]
+    scan_kwargs = [projection_kwargs(fields), {}]
+
+    if total_segments > 1:
+        results = parallel_scan_tables(tables, total_segments, scan_kwargs)
+    else:
+        results = [scan_all(table, **kwargs)
+                   for table, kwargs in zip(tables, scan_kwargs)]
+
+    product_items = results[0]
+    stock_items = None
+    if with_stock:
+        stock_items = {item['product_id']: item['count']
+                       for item in results[1]}
+
+    return join_stocks(product_items, stock_items, fields)
+
+
+def get_products_page(limit: int, start_key: dict = None, fields: tuple = None):
+    """
+    Retrieves a single page of at most `limit` products.
+
+    Returns:
+        tuple: (products, last_evaluated_key) where last_evaluated_key is
+            None once the end of the table has been reached.
+    """
+    product_table, stock_table = _get_tables()
+
+    scan_kwargs = {"Limit": limit, **projection_kwargs(fields)}
+    if start_key:
+        scan_kwargs["ExclusiveStartKey"] = start_key
+
+    product_response = product_table.scan(**scan_kwargs)
     product_items = product_response.get("Items", [])
 
-    # get stock information
-    stock_response = stock_table.scan()
-    stock_items = {item['product_id']: item['count']
-                   for item in stock_response['Items']}
+    # only fetch stock for the products on this page
+    stock_items = None
+    if fields is None or "count" in fields:
+        stock_items = get_stock_counts(
+            stock_table, [item['id'] for item in product_items])
+
+    return (join_stocks(product_items, stock_items, fields),
+            product_response.get("LastEvaluatedKey"))
+
+
+def get_products_by_price(min_price, max_price, limit: int = None,
+                          start_key: dict = None, fields: tuple = None,
+                          in_stock: bool = False):
+    """
+    Retrieves products with min_price <= price <= max_price from the price
+    index, querying only the buckets that overlap the range, cheapest first.
+
+    Args:
+        min_price: Lower bound (Decimal) or None.
+        max_price: Upper bound (Decimal) or None.
+        limit: Page size, None to read the whole range.
+        start_key: Cursor from a previous page. Either a LastEvaluatedKey of
+            the index or {"price_bucket": n} to start at the top of a bucket.
+        fields: Attributes to read and return, None for all of them.
+        in_stock: Leave out products with a count of zero (pages may come
+            back shorter than limit).
+
+    Returns:
+        tuple: (products, last_key) where last_key is None after the last page.
+    """
+    product_table, stock_table = _get_tables()
+
+    first_bucket = price_bucket(min_price) if min_price is not None else 0
+    last_bucket = (price_bucket(max_price) if max_price is not None
+                   else MAX_PRICE_BUCKET)
+
+    exclusive_start_key = None
+    if start_key:
+        first_bucket = min(int(start_key["price_bucket"]), MAX_PRICE_BUCKET)
+        if len(start_key) > 1:
+            exclusive_start_key = start_key
+
+    items = []
+    last_key = None
+    for bucket in range(first_bucket, last_bucket + 1):
+        query_kwargs = {
+            "IndexName": PRICE_INDEX_NAME,
+            "KeyConditionExpression": price_key_condition(
+                bucket, min_price, max_price),
+            **projection_kwargs(fields),
+        }
+        if exclusive_start_key:
+            query_kwargs["ExclusiveStartKey"] = exclusive_start_key
+            exclusive_start_key = None
+
+        while True:
+            if limit:
+                query_kwargs["Limit"] = limit - len(items)
+
+            response = product_table.query(**query_kwargs)
+            items.extend(response.get("Items", []))
+            bucket_last_key = response.get("LastEvaluatedKey")
+
+            if limit and len(items) >= limit:
+                if bucket_last_key:
+                    last_key = bucket_last_key
+                elif bucket < last_bucket:
+                    last_key = {"price_bucket": bucket + 1}
+                break
+
+            if not bucket_last_key:
+                break
+            query_kwargs["ExclusiveStartKey"] = bucket_last_key
+
+        if limit and len(items) >= limit:
+            break
+
+    stock_items = None
+    if fields is None or "count" in fields or in_stock:
+        stock_items = get_stock_counts(
+            stock_table, [item['id'] for item in items])
+
+    return join_stocks(items, stock_items, fields, in_stock), last_key
+
+
+def get_products_sorted(sort_field: str, descending: bool = False,
+                        limit: int = None, start_key: dict = None,
+                        fields: tuple = None, price_range: tuple = None,
+                        in_stock: bool = False):
+    """
+    Retrieves products ordered by price or title from the sort indexes.
+
+    A page is a single Query continuing after the last returned sort key.
+    With sort_field "price" a price range narrows the key condition; with
+    "title" it is applied as a filter. in_stock drops products with a count
+    of zero after the stock join, so pages may come back shorter than limit.
+
+    Returns:
+        tuple: (products, last_key) where last_key is None after the last page.
+    """
+    product_table, stock_table = _get_tables()
+    index_name, sort_key = SORT_INDEXES[sort_field]
+
+    condition = Key("catalog_pk").eq(CATALOG_PK)
+    query_kwargs = {
+        "IndexName": index_name,
+        "ScanIndexForward": not descending,
+        **projection_kwargs(fields),
+    }
+
+    if price_range:
+        if sort_field == "price":
+            condition = condition & price_range_condition(
+                Key("price"), *price_range)
+        else:
+            query_kwargs["FilterExpression"] = price_range_condition(
+                Attr("price"), *price_range)
+
+    query_kwargs["KeyConditionExpression"] = condition
+    if start_key:
+        query_kwargs["ExclusiveStartKey"] = start_key
+
+    items = []
+    while True:
+        if limit:
+            query_kwargs["Limit"] = limit - len(items)
+
+        response = product_table.query(**query_kwargs)
+        items.extend(response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+
+        # a page is one Query, even when a filter left it short
+        if limit or not last_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_key
+
+    stock_items = None
+    if fields is None or "count" in fields or in_stock:
+        stock_items = get_stock_counts(
+            stock_table, [item['id'] for item in items])
+
+    return join_stocks(items, stock_items, fields, in_stock), last_key
+
+
+def get_products_in_stock(limit: int = None, start_key: dict = None,
+                          fields: tuple = None):
+    """
+    Retrieves products with a count above zero from the sparse in-stock
+    index of the stocks table, then reads those products by id.
+
+    Returns:
+        tuple: (products, last_key) where last_key is None after the last page.
+    """
+    product_table, stock_table = _get_tables()
+
+    query_kwargs = {
+        "IndexName": IN_STOCK_INDEX_NAME,
+        "KeyConditionExpression": Key("in_stock").eq(IN_STOCK),
+    }
+    if start_key:
+        query_kwargs["ExclusiveStartKey"] = start_key
+
+    stock_list = []
+    while True:
+        if limit:
+            query_kwargs["Limit"] = limit - len(stock_list)
+
+        response = stock_table.query(**query_kwargs)
+        stock_list.extend(response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+
+        if not last_key or (limit and len(stock_list) >= limit):
+            break
+        query_kwargs["ExclusiveStartKey"] = last_key
 
-    # combine product information with stock information
+    product_items = batch_get_items(
+        product_table.meta.client, product_table.name, "id",
+        [item['product_id'] for item in stock_list], **projection_kwargs(fields))
+    stock_items = {item['product_id']: item['count'] for item in stock_list}
+
+    # keep the index order; skip stock records without a product
+    ordered = [product_items[item['product_id']] for item in stock_list
+               if item['product_id'] in product_items]
+
+    return join_stocks(ordered, stock_items, fields, in_stock=True), last_key
+
+
+def price_range_condition(price, min_price, max_price):
+    """
+    Builds the condition min_price <= price <= max_price for a Key or Attr,
+    leaving out missing bounds.
+    """
+    if min_price is not None and max_price is not None:
+        return price.between(min_price, max_price)
+    if min_price is not None:
+        return price.gte(min_price)
+    return price.lte(max_price)
+
+
+def price_key_condition(bucket: int, min_price, max_price):
+    """
+    Builds the KeyConditionExpression for one price bucket.
+    """
+    condition = Key("price_bucket").eq(bucket)
+
+    if min_price is None and max_price is None:
+        return condition
+    return condition & price_range_condition(Key("price"), min_price, max_price)
+
+
+def parallel_scan_tables(tables, total_segments: int, scan_kwargs=None):
+    """
+    Scans several tables at the same time, splitting each one into
+    `total_segments` segments that are read by a shared worker pool.
+
+    Args:
+        tables: Table resources to scan.
+        total_segments: Number of segments per table.
+        scan_kwargs: Optional list of extra Scan arguments, one per table.
+
+    Returns:
+        list: One list of items per table, in the order of `tables`.
+    """
+    scan_kwargs = scan_kwargs or [{}] * len(tables)
+
+    with ThreadPoolExecutor(max_workers=len(tables) * total_segments) as executor:
+        futures = [
+            [executor.submit(scan_segment, table.meta.client, table.name,
+                             segment, total_segments, **kwargs)
+             for segment in range(total_segments)]
+            for table, kwargs in zip(tables, scan_kwargs)
+        ]
+
+        return [
+            [item for future in table_futures for item in future.result()]
+            for table_futures in futures
+        ]
+
+
+def scan_segment(client, table_name: str, segment: int, total_segments: int,
+                 **extra_kwargs):
+    """
+    Reads one segment of a parallel scan to the end.
+
+    Uses the low-level client, which unlike the resource is thread-safe,
+    and converts items to the same Python types the Table resource returns.
+    """
+    scan_kwargs = {
+        "TableName": table_name,
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        **extra_kwargs,
+    }
+
+    items = []
+    while True:
+        response = client.scan(**scan_kwargs)
+        items.extend(
+            {key: deserializer.deserialize(value) for key, value in item.items()}
+            for item in response.get("Items", [])
+        )
+
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return items
+        scan_kwargs["ExclusiveStartKey"] = last_key
+
+
+def get_stock_counts(stock_table, product_ids):
+    """
+    Fetches stock counts for the given product ids with BatchGetItem.
+
+    Returns:
+        dict: product_id -> count for the ids that have a stock record.
+    """
+    items = batch_get_items(
+        stock_table.meta.client, stock_table.name, "product_id", product_ids,
+        ProjectionExpression="product_id, #count",
+        ExpressionAttributeNames={"#count": "count"})
+    return {product_id: item["count"] for product_id, item in items.items()}
+
+
+def join_stocks(product_items, stock_items, fields: tuple = None,
+                in_stock: bool = False):
+    """
+    Combines product information with stock information.
+
+    Args:
+        product_items: Items read from the products table.
+        stock_items: product_id -> count, or None to leave out "count".
+        fields: Attributes to return, None for all public attributes.
+        in_stock: Leave out products with a count of zero.
+
+    Returns:
+        list: Product dicts. With all fields requested, products that carry
+            a pre-rendered product_json are returned as JSON text instead,
+            see render_json().
+    """
     products = []
     for product in product_items:
-        product_id = product['id']
-        product['count'] = int(stock_items.get(product_id, 0))
-        product['price'] = float(product['price'])
-        products.append(product)
+        if stock_items is not None:
+            product['count'] = stock_items.get(product['id'], 0)
+        if in_stock and not product['count'] > 0:
+            continue
+        if fields is None and 'product_json' in product:
+            products.append(splice_count(
+                decompress_text(product['product_json']),
+                product.get('count', 0)))
+        else:
+            products.append(shape_product(product, fields))
 
     return products
+
+
+def splice_count(product_json: str, count) -> str:
+    """
+    Adds the stock count to the pre-rendered product JSON stored by the
+    writers, giving the same text as json.dumps(shape_product(item)).
+    """
+    return f'{product_json[:-1]}, "count": {int(count)}}}'
+
+
+def render_json(payload) -> str:
+    """
+    Serializes a load_catalog() payload. Products that are already JSON
+    text (see join_stocks) are copied into the output as they are.
+    """
+    if isinstance(payload, dict):
+        return (f'{{"items": {render_json(payload["items"])}, '
+                f'"nextCursor": {json.dumps(payload["nextCursor"])}}}')
+
+    return "[" + ", ".join(
+        product if isinstance(product, str) else json.dumps(product)
+        for product in payload) + "]"
+
+
+def parse_limit(value):
+    """
+    Parses the ?limit= query parameter.
+    Raises ValueError if it is not an integer in [1, MAX_PAGE_LIMIT].
+    """
+    if value is None:
+        return None
+
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+
+    if limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+
+    return limit
+
+
+def parse_price_range(min_value, max_value):
+    """
+    Parses the ?minPrice= / ?maxPrice= query parameters.
+
+    Returns:
+        tuple: (min_price, max_price) as Decimals (either may be None),
+            or None when no price filter was requested.
+    """
+    if min_value is None and max_value is None:
+        return None
+
+    bounds = []
+    for name, value in (("minPrice", min_value), ("maxPrice", max_value)):
+        if value is None:
+            bounds.append(None)
+            continue
+        try:
+            bound = Decimal(value)
+        except InvalidOperation:
+            raise ValueError(f"{name} must be a number")
+        if not bound.is_finite() or bound < 0:
+            raise ValueError(f"{name} must be a non-negative number")
+        bounds.append(bound)
+
+    if None not in bounds and bounds[0] > bounds[1]:
+        raise ValueError("minPrice cannot be greater than maxPrice")
+
+    return tuple(bounds)
+
+
+def parse_sort(sort, order):
+    """
+    Parses the ?sort= / ?order= query parameters.
+
+    Returns:
+        tuple: (sort_field, descending), or None when unsorted.
+    """
+    if sort is None:
+        if order is not None:
+            raise ValueError("order requires sort")
+        return None
+
+    if sort not in SORT_INDEXES:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_INDEXES)}")
+    if order not in (None, "asc", "desc"):
+        raise ValueError("order must be asc or desc")
+
+    return sort, order == "desc"
+
+
+def check_cursor(start_key, price_range, sort, in_stock=False):
+    """
+    Checks that a decoded cursor belongs to the listing being requested.
+    Raises ValueError otherwise.
+    """
+    if not start_key:
+        return
+
+    if sort:
+        valid = ("catalog_pk" in start_key
+                 and SORT_INDEXES[sort[0]][1] in start_key)
+    elif price_range:
+        valid = "price_bucket" in start_key
+    elif in_stock:
+        valid = "in_stock" in start_key
+    else:
+        valid = set(start_key) == {"id"}
+
+    if not valid:
+        raise ValueError("Invalid cursor")
+
+
+def encode_cursor(last_key):
+    """
+    Wraps a DynamoDB LastEvaluatedKey into an opaque URL-safe token.
+    Values are stored in DynamoDB JSON so that number keys survive the trip.
+    """
+    if not last_key:
+        return None
+
+    typed_key = {name: serializer.serialize(value)
+                 for name, value in last_key.items()}
+    raw = json.dumps(typed_key, separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Unwraps a token produced by encode_cursor() back into an ExclusiveStartKey.
+    Raises ValueError if the token is malformed.
+    """
+    if not cursor:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        typed_key = json.loads(raw)
+        start_key = {name: deserializer.deserialize(value)
+                     for name, value in typed_key.items()}
+    except (binascii.Error, UnicodeError, ValueError, TypeError,
+            AttributeError):
+        raise ValueError("Invalid cursor")
+
+    if not start_key:
+        raise ValueError("Invalid cursor")
+
+    return start_key
+
+
+def error_response(status_code: int, message: str):
+    """
+    Helper function to create error responses.
+    """
+    return {
+        "statusCode": status_code,
+        "headers": HEADERS,
+        "body": json.dumps({"error": message}),
+    }
+
+
+def _get_tables():
+    dynamodb = boto3.resource("dynamodb", region_name=os.getenv("AWS_REGION"))
+
+    product_table_name = os.getenv("PRODUCTS_TABLE_NAME")
+    stock_table_name = os.getenv("STOCK_TABLE_NAME")
+
+    return dynamodb.Table(product_table_name), dynamodb.Table(stock_table_name)
+
+
+def _cache_get(key):
+    if CATALOG_CACHE_TTL <= 0:
+        return None
+
+    entry = _catalog_cache.get(key)
+    if not entry:
+        return None
+
+    expires_at, body, etag = entry
+    if expires_at < time.monotonic():
+        del _catalog_cache[key]
+        return None
+
+    return body, etag
+
+
+def _cache_put(key, body: str, etag: str):
+    if CATALOG_CACHE_TTL <= 0:
+        return
+
+    _catalog_cache.pop(key, None)
+
+    # Evict the oldest entries first (dicts keep insertion order)
+    while len(_catalog_cache) >= CATALOG_CACHE_MAX_ENTRIES:
+        del _catalog_cache[next(iter(_catalog_cache))]
+
+    _catalog_cache[key] = (time.monotonic() + CATALOG_CACHE_TTL, body, etag)
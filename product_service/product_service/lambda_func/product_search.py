@@ -0,0 +1,160 @@
+import bisect
+import json
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+try:
+    from .product_items import SEARCH_INDEX_KEY, get_products, tokenize
+except ImportError:  # Lambda loads the handlers as top-level modules
+    from product_items import SEARCH_INDEX_KEY, get_products, tokenize
+
+
+# Common headers for all responses
+HEADERS = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET",
+    "Access-Control-Allow-Credentials": True,
+}
+
+# Seconds a warm container serves its copy of the index before checking
+# S3 for a newer one
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "30"))
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+s3 = boto3.client("s3")
+
+# Index loaded by this container: {"etag": ..., "checked_at": ..., "index": ...}
+_index_cache = {}
+
+
+def handler(event, _context):
+    """
+    Lambda handler for GET /products/search endpoint.
+
+    Matches every word of ?q= as a prefix of a word of the product title or
+    description, using the inverted index built by catalog_indexer.
+    Results are ordered by title:
+    {"items": [...], "total": int}
+
+    Only the returned page of products is read from DynamoDB.
+    """
+    print("GET /products/search request received")
+
+    params = event.get("queryStringParameters") or {}
+
+    tokens = tokenize(params.get("q") or "")
+    if not tokens:
+        return error_response(400, "Missing search query: q")
+
+    try:
+        limit = parse_limit(params.get("limit"))
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    try:
+        index = load_index(os.environ["CATALOG_BUCKET_NAME"])
+        product_ids = search(index, tokens)
+        dynamodb_client = boto3.client(
+            "dynamodb", region_name=os.getenv("AWS_REGION"))
+        products = get_products(dynamodb_client, product_ids[:limit])
+
+        print(f"Search for {tokens} matched {len(product_ids)} products")
+
+        return {
+            "statusCode": 200,
+            "headers": HEADERS,
+            "body": json.dumps({"items": products, "total": len(product_ids)}),
+        }
+
+    except Exception as e:
+        print(f"Error: An unexpected error occurred: {str(e)}")
+        return error_response(500, "Internal Server Error")
+
+
+def search(index, tokens):
+    """
+    Returns the ids of the documents matching all tokens, each token being
+    a prefix of some indexed term.
+    """
+    terms = index["terms"]
+    matches = None
+
+    for token in tokens:
+        positions = set()
+        start = bisect.bisect_left(terms, token)
+        for i in range(start, len(terms)):
+            if not terms[i].startswith(token):
+                break
+            positions.update(index["postings"][i])
+
+        matches = positions if matches is None else matches & positions
+        if not matches:
+            return []
+
+    return [index["ids"][position] for position in sorted(matches)]
+
+
+def load_index(bucket_name: str):
+    """
+    Loads the search index lazily and keeps it in the warm container.
+    After SEARCH_INDEX_TTL seconds a conditional GET picks up a newer index.
+    """
+    now = time.time()
+    if _index_cache and now - _index_cache["checked_at"] < SEARCH_INDEX_TTL:
+        return _index_cache["index"]
+
+    request = {"Bucket": bucket_name, "Key": SEARCH_INDEX_KEY}
+    if _index_cache:
+        request["IfNoneMatch"] = _index_cache["etag"]
+
+    try:
+        response = s3.get_object(**request)
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        if code in ("304", "NotModified"):
+            _index_cache["checked_at"] = now
+            return _index_cache["index"]
+        if code in ("NoSuchKey", "404"):
+            print("No search index found")
+            return {"ids": [], "terms": [], "postings": []}
+        raise
+
+    index = json.loads(response["Body"].read())
+    _index_cache.update(etag=response["ETag"], checked_at=now, index=index)
+    return index
+
+
+def parse_limit(value):
+    """
+    Parses the ?limit= query parameter (default 20, at most 100).
+    Raises ValueError on invalid values.
+    """
+    if value is None or value == "":
+        return DEFAULT_LIMIT
+
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit: must be an integer")
+
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f"Invalid limit: must be between 1 and {MAX_LIMIT}")
+
+    return limit
+
+
+def error_response(status_code: int, message: str):
+    """
+    Helper function to create error responses.
+    """
+    return {
+        "statusCode": status_code,
+        "headers": HEADERS,
+        "body": json.dumps({"message": message}),
+    }
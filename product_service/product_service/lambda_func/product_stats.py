@@ -0,0 +1,81 @@
+import json
+import os
+
+import boto3
+
+
+# Common headers for all responses
+HEADERS = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET",
+    "Access-Control-Allow-Credentials": True,
+}
+
+# Item of the catalog counters table, maintained by catalog_stats from the
+# products/stocks DynamoDB Streams
+STATS_ID = "catalog"
+
+dynamodb_client = boto3.client("dynamodb", region_name=os.getenv("AWS_REGION"))
+
+
+def handler(event, _context):
+    """
+    Lambda handler for GET /products/stats endpoint.
+
+    Returns catalog statistics read from the pre-aggregated counters item
+    with a single GetItem:
+    {"productCount": int, "stockUnits": int, "minPrice": float | null,
+     "maxPrice": float | null, "avgPrice": float | null}
+    """
+    print("GET /products/stats request received")
+
+    try:
+        result = dynamodb_client.get_item(
+            TableName=os.environ["STATS_TABLE_NAME"],
+            Key={"id": {"S": STATS_ID}},
+        )
+        stats = shape_stats(result.get("Item") or {})
+
+        return {
+            "statusCode": 200,
+            "headers": HEADERS,
+            "body": json.dumps(stats),
+        }
+
+    except Exception as e:
+        print(f"Error: An unexpected error occurred: {str(e)}")
+        return error_response(500, "Internal Server Error")
+
+
+def shape_stats(item):
+    """
+    Converts the counters item (low-level DynamoDB format) into the public
+    statistics. The average price is derived from the running price sum.
+    """
+    def number(name):
+        value = item.get(name, {}).get("N")
+        return float(value) if value is not None else None
+
+    product_count = int(number("product_count") or 0)
+    price_sum = number("price_sum") or 0.0
+
+    return {
+        "productCount": product_count,
+        "stockUnits": int(number("stock_units") or 0),
+        "minPrice": number("min_price"),
+        "maxPrice": number("max_price"),
+        "avgPrice": (round(price_sum / product_count, 2)
+                     if product_count else None),
+    }
+
+
+def error_response(status_code: int, message: str):
+    """
+    Helper function to create error responses.
+    """
+    return {
+        "statusCode": status_code,
+        "headers": HEADERS,
+        "body": json.dumps({"message": message}),
+    }
@@ -7,8 +7,13 @@ from constructs import Construct
 from product_service.api_gateway import ApiGateway
 from product_service.get_products import GetProducts
 from product_service.get_product_by_id import GetProductById
+from product_service.get_product_changes import GetProductChanges
+from product_service.get_product_stats import GetProductStats
 from product_service.create_product import CreateProduct
 from product_service.catalog_batch_process import CatalogBatchProcess
+from product_service.catalog_snapshot import CatalogSnapshot
+from product_service.catalog_stats import CatalogStats
+from product_service.catalog_search import CatalogSearch
 
 
 class ProductServiceStack(Stack):
@@ -23,20 +28,70 @@ class ProductServiceStack(Stack):
     DynamoDB Tables:
         - products: Stores product information including id, title, description, and price
         - stock: Stores stock information for products including id and count
+        - product changes: Change log of product writes, expired by TTL
+        - catalog stats: Aggregate counters updated from the products/stocks
+          DynamoDB Streams
+        - idempotency keys: Recorded responses of POST /products requests with
+          an Idempotency-Key header, expired by TTL
 
     Lambda Functions:
         - GetProducts: Retrieves list of all products with their stock information
-        - GetProductById: Retrieves a specific product by ID with its stock information
-        - CreateProduct: Creates a new product with its initial stock information
+        - GetProductById: Retrieves a specific product by ID with its stock information,
+          and many products at once for POST /products/batchGet
+        - CreateProduct: Creates a new product with its initial stock information,
+          and many products at once for POST /products/batch
+        - GetProductChanges: Returns products changed since a version token
+        - GetProductStats: Returns catalog statistics from the aggregate counters
+        - CatalogStats: Keeps the aggregate counters up to date from the
+          products/stocks DynamoDB Streams
+        - CatalogSnapshot: Keeps a pre-joined catalog snapshot in S3 up to date
+          from the products/stocks DynamoDB Streams
+        - CatalogSearch: Maintains an inverted index of titles/descriptions and
+          a Bloom filter of product ids in S3, and serves the product search
 
     API Gateway endpoints:
         - GET /products: Returns all products with their stock information
         - GET /products/{id}: Returns specific product by ID
+        - GET /products/changes: Returns products changed since a version token
+        - GET /products/stats: Returns product count, stock units and prices
+        - GET /products/search: Returns products matching a search query
+        - POST /products/batchGet: Returns many products by ID
         - POST /products: Creates a new product
+        - POST /products/batch: Creates many products
 
     Environment Variables:
         - PRODUCTS_TABLE_NAME: Name of the products DynamoDB table
         - STOCK_TABLE_NAME: Name of the stock DynamoDB table
+        - PRICE_INDEX_NAME: GSI of the products table keyed on price_bucket/price
+        - PRICE_SORT_INDEX_NAME / TITLE_SORT_INDEX_NAME: GSIs of the products
+          table keyed on catalog_pk and price / title_sort
+        - IN_STOCK_INDEX_NAME: Sparse GSI of the stock table holding only
+          products with count > 0
+        - CHANGES_TABLE_NAME: Name of the product change log DynamoDB table
+        - STATS_TABLE_NAME: Name of the catalog stats DynamoDB table
+        - DESCRIPTION_COMPRESSION_MIN_SIZE: Descriptions of at least this many
+          bytes are stored zlib-compressed, 0 disables it
+        - CATALOG_BUCKET_NAME: S3 bucket with the catalog snapshot (GetProducts),
+          the search index and the product id filter (GetProductById)
+        - CATALOG_SNAPSHOT_MODE: "serve", "redirect" or empty (GetProducts)
+        - IDEMPOTENCY_TABLE_NAME: Name of the idempotency keys DynamoDB table
+          (CreateProduct)
+        - CATALOG_WRITE_MODE: "transaction" or "batch" (BatchWriteItem, bulk
+          imports without product/stock atomicity) (CatalogBatchProcess)
+        - PRODUCT_CACHE_TTL: Seconds GetProductById serves a cached product
+          before checking its version again, 0 disables the cache
+        - SEARCH_INDEXER_FUNCTION_NAME: Search indexer invoked after product
+          writes (CreateProduct, CatalogBatchProcess)
+
+    Context values:
+        - products_stream_arn / stocks_stream_arn: Stream ARNs of the existing
+          tables. The catalog snapshot and the stats counters are only kept
+          up to date when set
+        - catalog_snapshot_mode: Value of CATALOG_SNAPSHOT_MODE
+        - description_compression_min_size: Value of
+          DESCRIPTION_COMPRESSION_MIN_SIZE
+        - product_cache_ttl: Value of PRODUCT_CACHE_TTL
+        - catalog_write_mode: Value of CATALOG_WRITE_MODE
 
     Permissions:
         - GetProducts Lambda: Read/Write access to both products and stock tables
@@ -50,12 +105,33 @@ class ProductServiceStack(Stack):
 
     API Endpoints Usage:
         GET /products
+            Parameters: limit, cursor, fields, minPrice, maxPrice, sort, order,
+                inStock (all optional)
             Returns: List of all products with their stock information
 
         GET /products/{id}
             Parameters: id (string) - The unique identifier of the product
             Returns: Single product with its stock information
 
+        GET /products/changes
+            Parameters: since (string) - Token from a previous response
+            Returns: Changed products, removed ids and the next token
+
+        GET /products/stats
+            Returns: productCount, stockUnits, minPrice, maxPrice, avgPrice
+
+        GET /products/search
+            Parameters: q (string) - Words or word prefixes, limit (optional)
+            Returns: Matching products ordered by title and the total count
+
+        POST /products/batchGet
+            Body: {"ids": ["string", ...]} (up to 100 ids)
+            Returns: Found products in request order and the missing ids
+
+        POST /products/batch
+            Body: {"products": [{...}, ...]} (up to 500 products, as for POST /products)
+            Returns: Per product the created product or the validation error
+
         POST /products
             Body: {
                 "title": "string",
@@ -102,18 +178,70 @@ class ProductServiceStack(Stack):
         products_table_name = 'products'
         stock_table_name = 'stocks'
 
+        # Secondary indexes of the existing tables (created by migrate_dynamodb.py)
+        price_index_name = 'price-index'
+        price_sort_index_name = 'price-sort-index'
+        title_sort_index_name = 'title-sort-index'
+        in_stock_index_name = 'in-stock-index'
+
         # Create references to existing DynamoDB tables using their names
-        # from_table_name method is used when the tables already exist and we want to reference them
-        products_table = dynamodb.Table.from_table_name(
-            self, "ProductsTable", products_table_name)
-        stock_table = dynamodb.Table.from_table_name(
-            self, "StockTable", stock_table_name)
+        # from_table_attributes method is used when the tables already exist and we want to reference them
+        # Indexes are listed so that grants also cover them
+        products_table = dynamodb.Table.from_table_attributes(
+            self, "ProductsTable", table_name=products_table_name,
+            global_indexes=[price_index_name, price_sort_index_name,
+                            title_sort_index_name],
+            table_stream_arn=self.node.try_get_context("products_stream_arn"))
+        stock_table = dynamodb.Table.from_table_attributes(
+            self, "StockTable", table_name=stock_table_name,
+            global_indexes=[in_stock_index_name],
+            table_stream_arn=self.node.try_get_context("stocks_stream_arn"))
+
+        # Change log of product writes for GET '/products/changes'
+        # Entries are keyed by feed and a time-ordered version and expire by TTL
+        changes_table = dynamodb.Table(
+            self, "ProductChangesTable",
+            partition_key=dynamodb.Attribute(
+                name="feed", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(
+                name="version", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+        )
+
+        # Aggregate counters for GET '/products/stats'
+        # A single item updated from the table streams, never by the product
+        # writers, whose transactions would conflict on it
+        stats_table = dynamodb.Table(
+            self, "CatalogStatsTable",
+            partition_key=dynamodb.Attribute(
+                name="id", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+        )
+
+        # Responses of POST '/products' requests with an Idempotency-Key
+        # header, recorded in the product transaction and expired by TTL
+        idempotency_table = dynamodb.Table(
+            self, "IdempotencyTable",
+            partition_key=dynamodb.Attribute(
+                name="idempotency_key", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+        )
 
         # Create an environment variables dictionary that will be passed to Lambda functions
         # This allows Lambda functions to know which tables to interact with
         environment = {
             "PRODUCTS_TABLE_NAME": products_table_name,
             "STOCK_TABLE_NAME": stock_table_name,
+            "PRICE_INDEX_NAME": price_index_name,
+            "PRICE_SORT_INDEX_NAME": price_sort_index_name,
+            "TITLE_SORT_INDEX_NAME": title_sort_index_name,
+            "IN_STOCK_INDEX_NAME": in_stock_index_name,
+            "CHANGES_TABLE_NAME": changes_table.table_name,
+            "STATS_TABLE_NAME": stats_table.table_name,
+            "DESCRIPTION_COMPRESSION_MIN_SIZE": str(
+                self.node.try_get_context("description_compression_min_size") or 0),
         }
 
         # Create Lambda function for getting a list of all products
@@ -125,35 +253,129 @@ class ProductServiceStack(Stack):
         # This function will handle the GET '/products/{id}' endpoint
         get_product_by_id_fn = GetProductById(
             self, 'ProductById', environment=environment)
+        # Seconds a product is served from the container cache before its
+        # version is checked again, i.e. the staleness bound after writes
+        get_product_by_id_fn.get_product_by_id.add_environment(
+            "PRODUCT_CACHE_TTL",
+            str(self.node.try_get_context("product_cache_ttl") or 5))
 
         # Create Lambda function for creating a new product
         # This function will handle the POST '/products' endpoint
         create_product_fn = CreateProduct(
             self, 'CreateProduct', environment=environment)
+        create_product_fn.create_product.add_environment(
+            "IDEMPOTENCY_TABLE_NAME", idempotency_table.table_name)
+
+        # Create Lambda function for the product change feed
+        # This function will handle the GET '/products/changes' endpoint
+        get_product_changes_fn = GetProductChanges(
+            self, 'ProductChanges', environment=environment)
+
+        # Create Lambda function for the catalog statistics
+        # This function will handle the GET '/products/stats' endpoint
+        get_product_stats_fn = GetProductStats(
+            self, 'ProductStats', environment=environment)
 
         catalog_batch_process_fn = CatalogBatchProcess(
-            self, 'CatalogBatchProcess', environment=environment)
+            self, 'CatalogBatchProcess', environment=environment,
+            write_mode=self.node.try_get_context("catalog_write_mode")
+            or "transaction")
+
+        # Create the consumer keeping the stats counters up to date
+        catalog_stats = CatalogStats(
+            self, 'CatalogStats', environment=environment,
+            products_table=products_table, stock_table=stock_table)
+
+        # Create the catalog snapshot maintained from DynamoDB Streams
+        # GET '/products' can serve or redirect to it
+        catalog_snapshot = CatalogSnapshot(
+            self, 'CatalogSnapshot', environment=environment,
+            products_table=products_table, stock_table=stock_table)
+        get_products_fn.get_product_list.add_environment(
+            "CATALOG_BUCKET_NAME", catalog_snapshot.catalog_bucket.bucket_name)
+        get_products_fn.get_product_list.add_environment(
+            "CATALOG_SNAPSHOT_MODE",
+            self.node.try_get_context("catalog_snapshot_mode") or "")
+        catalog_snapshot.catalog_bucket.grant_read(
+            get_products_fn.get_product_list)
+
+        # Create the search index kept next to the snapshot
+        # The product writers trigger re-indexing of the products they wrote
+        catalog_search = CatalogSearch(
+            self, 'CatalogSearch', environment=environment,
+            catalog_bucket=catalog_snapshot.catalog_bucket,
+            products_table=products_table, stock_table=stock_table,
+            changes_table=changes_table)
+        # GET '/products/{id}' answers unknown ids from the id filter the
+        # indexer keeps next to the search index, checking the change log
+        # for products written since the filter
+        for reader_fn in (get_product_by_id_fn.get_product_by_id,
+                          get_product_by_id_fn.get_products_batch):
+            reader_fn.add_environment(
+                "CATALOG_BUCKET_NAME",
+                catalog_snapshot.catalog_bucket.bucket_name)
+            catalog_snapshot.catalog_bucket.grant_read(reader_fn)
+            changes_table.grant_read_data(reader_fn)
+        for writer_fn in (create_product_fn.create_product,
+                          create_product_fn.create_products_batch,
+                          catalog_batch_process_fn.catalog_batch_process):
+            writer_fn.add_environment(
+                "SEARCH_INDEXER_FUNCTION_NAME",
+                catalog_search.catalog_indexer.function_name)
+            catalog_search.catalog_indexer.grant_invoke(writer_fn)
 
         # Give read permissions to both Lambda functions for the products table
         products_table.grant_read_data(get_products_fn.get_product_list)
         products_table.grant_read_data(
             get_product_by_id_fn.get_product_by_id)
+        products_table.grant_read_data(
+            get_product_by_id_fn.get_products_batch)
 
         # Give read permissions to both Lambda functions for the stock table
         stock_table.grant_read_data(get_products_fn.get_product_list)
         stock_table.grant_read_data(
             get_product_by_id_fn.get_product_by_id)
+        stock_table.grant_read_data(
+            get_product_by_id_fn.get_products_batch)
 
         # Give write permissions to the create_product_fn for both tables
         products_table.grant_write_data(create_product_fn.create_product)
         stock_table.grant_write_data(create_product_fn.create_product)
+        products_table.grant_write_data(create_product_fn.create_products_batch)
+        stock_table.grant_write_data(create_product_fn.create_products_batch)
 
         products_table.grant_write_data(
             catalog_batch_process_fn.catalog_batch_process)
         stock_table.grant_write_data(
             catalog_batch_process_fn.catalog_batch_process)
 
+        # Give write permissions on the change log to the product writers
+        # and read permissions to the change feed
+        changes_table.grant_write_data(create_product_fn.create_product)
+        changes_table.grant_write_data(create_product_fn.create_products_batch)
+        changes_table.grant_write_data(
+            catalog_batch_process_fn.catalog_batch_process)
+        changes_table.grant_read_data(
+            get_product_changes_fn.get_product_changes)
+        products_table.grant_read_data(
+            get_product_changes_fn.get_product_changes)
+        stock_table.grant_read_data(
+            get_product_changes_fn.get_product_changes)
+
+        # Give write permissions on the stats counters to the stream consumer
+        # and read permissions to the stats endpoint
+        stats_table.grant_read_write_data(catalog_stats.catalog_stats)
+        stats_table.grant_read_data(get_product_stats_fn.get_product_stats)
+
+        # Give access to the recorded responses to the create_product_fn
+        idempotency_table.grant_read_write_data(create_product_fn.create_product)
+
         ApiGateway(self, "APIGateway",
                    get_products_fn=get_products_fn.get_product_list,
                    get_product_by_id_fn=get_product_by_id_fn.get_product_by_id,
-                   create_product_fn=create_product_fn.create_product)
+                   create_product_fn=create_product_fn.create_product,
+                   get_product_changes_fn=get_product_changes_fn.get_product_changes,
+                   get_product_stats_fn=get_product_stats_fn.get_product_stats,
+                   search_products_fn=catalog_search.product_search,
+                   get_products_batch_fn=get_product_by_id_fn.get_products_batch,
+                   create_products_batch_fn=create_product_fn.create_products_batch)
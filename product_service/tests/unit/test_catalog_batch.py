@@ -7,6 +7,7 @@ import pytest
 def mock_env_vars(monkeypatch):
     monkeypatch.setenv('STOCK_TABLE_NAME', 'test-stock')
     monkeypatch.setenv('PRODUCTS_TABLE_NAME', 'test-products')
+    monkeypatch.setenv('CHANGES_TABLE_NAME', 'test-changes')
     monkeypatch.setenv('SNS_TOPIC_ARN', 'test:arn:sns:topic')
     monkeypatch.setenv('AWS_REGION', 'eu-west-1')
 
@@ -23,7 +24,8 @@ def mock_aws_clients():
 
     # Create the patch
     with patch('product_service.lambda_func.catalog_batch.dynamodb_client', mock_dynamodb_client), \
-            patch('product_service.lambda_func.catalog_batch.sns_client', mock_sns_client):
+            patch('product_service.lambda_func.catalog_batch.sns_client', mock_sns_client), \
+            patch('product_service.lambda_func.catalog_batch.time.time', return_value=1700000000.0):
 
         yield {
             'dynamodb_client': mock_dynamodb_client,
@@ -67,7 +69,12 @@ def test_successful_processing(mock_env_vars, valid_event, mock_aws_clients):
                         'id': {'S': 'test-id'},
                         'title': {'S': 'Test Product'},
                         'description': {'S': 'Test Description'},
-                        'price': {'N': '100'}
+                        'price': {'N': '100'},
+                        'price_bucket': {'N': '7'},
+                        'catalog_pk': {'S': 'PRODUCT'},
+                        'title_sort': {'S': 'test product'},
+                        'product_json': {'S': '{"id": "test-id", "title": "Test Product", "description": "Test Description", "price": 100.0}'},
+                        'version': {'S': '1700000000000#test-id'}
                     }
                 }
             },
@@ -76,7 +83,20 @@ def test_successful_processing(mock_env_vars, valid_event, mock_aws_clients):
                     'TableName': 'test-stock',
                     'Item': {
                         'product_id': {'S': 'test-id'},
-                        'count': {'N': '5'}
+                        'count': {'N': '5'},
+                        'in_stock': {'S': 'Y'},
+                        'version': {'S': '1700000000000#test-id'}
+                    }
+                }
+            },
+            {
+                'Put': {
+                    'TableName': 'test-changes',
+                    'Item': {
+                        'feed': {'S': 'products'},
+                        'version': {'S': '1700000000000#test-id'},
+                        'product_id': {'S': 'test-id'},
+                        'expires_at': {'N': '1700604800'}
                     }
                 }
             }
@@ -99,12 +119,33 @@ def test_successful_processing(mock_env_vars, valid_event, mock_aws_clients):
     assert default_content['products'][0]['id'] == 'test-id'
 
 
+def test_long_description_stored_compressed(mock_env_vars, mock_aws_clients):
+    import zlib
+    from product_service.lambda_func.catalog_batch import handler
+
+    description = 'Evergreen tropical plant. ' * 20
+    event = {'Records': [{'body': json.dumps({
+        'id': 'test-id', 'title': 'Test Product', 'description': description,
+        'price': 100, 'count': 5})}]}
+
+    with patch('product_service.lambda_func.product_items.'
+               'DESCRIPTION_COMPRESSION_MIN_SIZE', 256):
+        handler(event, None)
+
+    transaction = mock_aws_clients['dynamodb_client'].transact_write_items.call_args
+    item = transaction.kwargs['TransactItems'][0]['Put']['Item']
+    assert zlib.decompress(item['description']['B']).decode('utf-8') == description
+    product = json.loads(zlib.decompress(item['product_json']['B']))
+    assert product['description'] == description
+
+
 def test_missing_required_field(mock_env_vars, mock_aws_clients):
     from product_service.lambda_func.catalog_batch import handler
 
     # Create event with missing field
     event = {
         'Records': [{
+            'messageId': 'message-1',
             'body': json.dumps({
                 'id': 'test-id',
                 'title': 'Test Product',
@@ -118,15 +159,40 @@ def test_missing_required_field(mock_env_vars, mock_aws_clients):
     # Execute lambda handler
     response = handler(event, None)
 
-    # Verify response
-    assert response['statusCode'] == 400
-    assert 'description is missing' in json.loads(response['body'])['message']
+    # Verify only the invalid record is reported for redelivery
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'message-1'}]
 
     # Verify no DynamoDB or SNS calls were made
     mock_aws_clients['dynamodb_client'].transact_write_items.assert_not_called()
     mock_aws_clients['sns_client'].publish.assert_not_called()
 
 
+def test_failed_records_reported(mock_env_vars, mock_aws_clients):
+    from product_service.lambda_func.catalog_batch import handler
+
+    # Arrange: a poison message and a failing write next to a valid record
+    records = [
+        {'messageId': 'message-1', 'body': 'not json'},
+        {'messageId': 'message-2', 'body': json.dumps({
+            'id': 'test-id-2', 'title': 'Palm', 'description': '',
+            'price': 10, 'count': 1})},
+        {'messageId': 'message-3', 'body': json.dumps({
+            'id': 'test-id-3', 'title': 'Fig', 'description': '',
+            'price': 20, 'count': 1})},
+    ]
+    # the shared transaction fails, then each product is retried alone
+    mock_aws_clients['dynamodb_client'].transact_write_items.side_effect = [
+        Exception('Throttled'), Exception('Throttled'), {}]
+
+    # Act
+    response = handler({'Records': records}, None)
+
+    # Assert
+    assert response['batchItemFailures'] == [
+        {'itemIdentifier': 'message-1'}, {'itemIdentifier': 'message-2'}]
+    assert mock_aws_clients['dynamodb_client'].transact_write_items.call_count == 3
+
+
 def test_multiple_records(mock_env_vars, mock_aws_clients):
     from product_service.lambda_func.catalog_batch import handler
 
@@ -168,7 +234,7 @@ def test_multiple_records(mock_env_vars, mock_aws_clients):
     assert json.loads(response['body'])[
         'message'] == 'Products added successfully'
 
-    # Verify DynamoDB transactions
+    # Verify both products are written in one transaction
     expected_calls = [
         call(TransactItems=[
             {
@@ -178,7 +244,12 @@ def test_multiple_records(mock_env_vars, mock_aws_clients):
                         'id': {'S': 'test-id-1'},
                         'title': {'S': 'Test Product 1'},
                         'description': {'S': 'Test Description 1'},
-                        'price': {'N': '100'}
+                        'price': {'N': '100'},
+                        'price_bucket': {'N': '7'},
+                        'catalog_pk': {'S': 'PRODUCT'},
+                        'title_sort': {'S': 'test product 1'},
+                        'product_json': {'S': '{"id": "test-id-1", "title": "Test Product 1", "description": "Test Description 1", "price": 100.0}'},
+                        'version': {'S': '1700000000000#test-id-1'}
                     }
                 }
             },
@@ -187,12 +258,23 @@ def test_multiple_records(mock_env_vars, mock_aws_clients):
                     'TableName': 'test-stock',
                     'Item': {
                         'product_id': {'S': 'test-id-1'},
-                        'count': {'N': '5'}
+                        'count': {'N': '5'},
+                        'in_stock': {'S': 'Y'},
+                        'version': {'S': '1700000000000#test-id-1'}
                     }
                 }
-            }
-        ]),
-        call(TransactItems=[
+            },
+            {
+                'Put': {
+                    'TableName': 'test-changes',
+                    'Item': {
+                        'feed': {'S': 'products'},
+                        'version': {'S': '1700000000000#test-id-1'},
+                        'product_id': {'S': 'test-id-1'},
+                        'expires_at': {'N': '1700604800'}
+                    }
+                }
+            },
             {
                 'Put': {
                     'TableName': 'test-products',
@@ -200,7 +282,12 @@ def test_multiple_records(mock_env_vars, mock_aws_clients):
                         'id': {'S': 'test-id-2'},
                         'title': {'S': 'Test Product 2'},
                         'description': {'S': 'Test Description 2'},
-                        'price': {'N': '200'}
+                        'price': {'N': '200'},
+                        'price_bucket': {'N': '8'},
+                        'catalog_pk': {'S': 'PRODUCT'},
+                        'title_sort': {'S': 'test product 2'},
+                        'product_json': {'S': '{"id": "test-id-2", "title": "Test Product 2", "description": "Test Description 2", "price": 200.0}'},
+                        'version': {'S': '1700000000000#test-id-2'}
                     }
                 }
             },
@@ -209,7 +296,20 @@ def test_multiple_records(mock_env_vars, mock_aws_clients):
                     'TableName': 'test-stock',
                     'Item': {
                         'product_id': {'S': 'test-id-2'},
-                        'count': {'N': '10'}
+                        'count': {'N': '10'},
+                        'in_stock': {'S': 'Y'},
+                        'version': {'S': '1700000000000#test-id-2'}
+                    }
+                }
+            },
+            {
+                'Put': {
+                    'TableName': 'test-changes',
+                    'Item': {
+                        'feed': {'S': 'products'},
+                        'version': {'S': '1700000000000#test-id-2'},
+                        'product_id': {'S': 'test-id-2'},
+                        'expires_at': {'N': '1700604800'}
                     }
                 }
             }
@@ -217,9 +317,9 @@ def test_multiple_records(mock_env_vars, mock_aws_clients):
     ]
 
     # Verify DynamoDB calls
-    assert mock_aws_clients['dynamodb_client'].transact_write_items.call_count == 2
+    assert mock_aws_clients['dynamodb_client'].transact_write_items.call_count == 1
     mock_aws_clients['dynamodb_client'].transact_write_items.assert_has_calls(
-        expected_calls, any_order=True)
+        expected_calls)
 
     # Verify SNS notification
     mock_aws_clients['sns_client'].publish.assert_called_once()
@@ -231,3 +331,85 @@ def test_multiple_records(mock_env_vars, mock_aws_clients):
     assert len(default_content['products']) == 2
     assert default_content['products'][0]['id'] == 'test-id-1'
     assert default_content['products'][1]['id'] == 'test-id-2'
+
+
+def test_records_packed_into_transactions(mock_env_vars, mock_aws_clients):
+    from product_service.lambda_func.catalog_batch import handler
+
+    # Arrange: 40 products, one of them sent twice
+    records = [{'messageId': f'message-{i}', 'body': json.dumps({
+        'id': f'test-id-{i}', 'title': 'Palm', 'description': '',
+        'price': 10, 'count': 1})} for i in range(40)]
+    records.insert(5, dict(records[0], messageId='message-again'))
+
+    # Act
+    response = handler({'Records': records}, None)
+
+    # Assert: 33 products per transaction, a repeated id starts a new one
+    assert response['batchItemFailures'] == []
+    calls = mock_aws_clients['dynamodb_client'].transact_write_items.call_args_list
+    assert [len(c.kwargs['TransactItems']) for c in calls] == \
+        [5 * 3, 33 * 3, 3 * 3]
+
+
+def test_batch_write_mode_retries_unprocessed_items(mock_env_vars, mock_aws_clients):
+    from product_service.lambda_func import catalog_batch
+
+    # Arrange
+    records = [{'messageId': f'message-{i}', 'body': json.dumps({
+        'id': f'test-id-{i}', 'title': 'Palm', 'description': '',
+        'price': 10 + i, 'count': 1})} for i in range(2)]
+    dynamodb_client = mock_aws_clients['dynamodb_client']
+
+    def batch_write_item(RequestItems):
+        if dynamodb_client.batch_write_item.call_count == 1:
+            # the stock of the second product is throttled once
+            return {'UnprocessedItems': {'test-stock': RequestItems['test-stock'][1:]}}
+        return {}
+
+    dynamodb_client.batch_write_item.side_effect = batch_write_item
+
+    # Act
+    with patch.object(catalog_batch, 'CATALOG_WRITE_MODE', 'batch'), \
+            patch.object(catalog_batch.time, 'sleep'):
+        response = catalog_batch.handler({'Records': records}, None)
+
+    # Assert
+    assert response['batchItemFailures'] == []
+    assert dynamodb_client.batch_write_item.call_count == 2
+    first = dynamodb_client.batch_write_item.call_args_list[0].kwargs['RequestItems']
+    assert {table: len(puts) for table, puts in first.items()} == \
+        {'test-products': 2, 'test-stock': 2, 'test-changes': 2}
+    dynamodb_client.transact_write_items.assert_not_called()
+
+
+def test_batch_write_mode_isolates_failing_records(mock_env_vars, mock_aws_clients):
+    from botocore.exceptions import ClientError
+    from product_service.lambda_func import catalog_batch
+
+    # Arrange: a price that cannot be bucketed, and an item DynamoDB rejects
+    records = [{'messageId': f'message-{i}', 'body': json.dumps({
+        'id': f'test-id-{i}', 'title': 'Palm', 'description': '',
+        'price': price, 'count': 1})} for i, price in enumerate([10, 'cheap', 12, 13])]
+    dynamodb_client = mock_aws_clients['dynamodb_client']
+
+    def batch_write_item(RequestItems):
+        ids = {put['PutRequest']['Item']['id']['S']
+               for put in RequestItems['test-products']}
+        if 'test-id-2' in ids:
+            raise ClientError({'Error': {'Code': 'ValidationException',
+                                         'Message': 'Item too large'}},
+                              'BatchWriteItem')
+        return {}
+
+    dynamodb_client.batch_write_item.side_effect = batch_write_item
+
+    # Act
+    with patch.object(catalog_batch, 'CATALOG_WRITE_MODE', 'batch'):
+        response = catalog_batch.handler({'Records': records}, None)
+
+    # Assert: only the two bad records are redelivered
+    assert response['batchItemFailures'] == [
+        {'itemIdentifier': 'message-1'}, {'itemIdentifier': 'message-2'}]
+    # one request for the chunk, then one per product
+    assert dynamodb_client.batch_write_item.call_count == 4
@@ -0,0 +1,132 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+
+@pytest.fixture
+def mock_env_vars(monkeypatch):
+    monkeypatch.setenv('STOCK_TABLE_NAME', 'stocks')
+    monkeypatch.setenv('PRODUCTS_TABLE_NAME', 'products')
+    monkeypatch.setenv('CATALOG_BUCKET_NAME', 'test-bucket')
+    monkeypatch.setenv('AWS_REGION', 'eu-west-1')
+
+
+@pytest.fixture
+def mock_s3():
+    mock_s3_client = MagicMock()
+    mock_s3_client.put_object.return_value = {'ETag': '"new-etag"'}
+
+    with patch('product_service.lambda_func.catalog_snapshot.s3', mock_s3_client), \
+            patch.dict('product_service.lambda_func.catalog_snapshot._state_cache', clear=True):
+        yield mock_s3_client
+
+
+def stream_record(table, event_name, keys, new_image=None):
+    record = {
+        'eventName': event_name,
+        'eventSourceARN': f'arn:aws:dynamodb:eu-west-1:123:table/{table}/stream/2024',
+        'dynamodb': {'Keys': keys},
+    }
+    if new_image:
+        record['dynamodb']['NewImage'] = new_image
+    return record
+
+
+def written_objects(mock_s3):
+    return {call.kwargs['Key']: call.kwargs['Body']
+            for call in mock_s3.put_object.call_args_list}
+
+
+def test_stream_records_patch_existing_snapshot(mock_env_vars, mock_s3):
+    from product_service.lambda_func.catalog_snapshot import handler
+
+    # Existing snapshot with two products
+    state = {
+        'products': {'1': {'id': '1', 'title': 'Palm', 'price': 10.0},
+                     '2': {'id': '2', 'title': 'Aloe', 'price': 5.0}},
+        'stocks': {'1': 3, '2': 1},
+        'complete': True,
+    }
+    body = MagicMock()
+    body.read.return_value = json.dumps(state).encode('utf-8')
+    mock_s3.get_object.return_value = {'Body': body, 'ETag': '"old-etag"'}
+
+    event = {'Records': [
+        stream_record('products', 'INSERT', {'id': {'S': '3'}}, {
+            'id': {'S': '3'}, 'title': {'S': 'Fig'},
+            'description': {'S': 'Tree'}, 'price': {'N': '49'},
+            'price_bucket': {'N': '6'}}),
+        stream_record('stocks', 'MODIFY', {'product_id': {'S': '1'}}, {
+            'product_id': {'S': '1'}, 'count': {'N': '0'}}),
+        stream_record('products', 'REMOVE', {'id': {'S': '2'}}),
+    ]}
+
+    handler(event, None)
+
+    objects = written_objects(mock_s3)
+    products = json.loads(objects['catalog/products.json'])
+    assert products == [
+        {'id': '1', 'title': 'Palm', 'price': 10.0, 'count': 0},
+        {'id': '3', 'title': 'Fig', 'description': 'Tree', 'price': 49.0,
+         'count': 0},
+    ]
+    ndjson_lines = objects['catalog/products.ndjson'].decode('utf-8').splitlines()
+    assert [json.loads(line) for line in ndjson_lines] == products
+    assert all(call.kwargs.get('Metadata') == {'complete': 'true'}
+               for call in mock_s3.put_object.call_args_list
+               if call.kwargs['Key'] != 'catalog/state.json')
+
+
+def test_state_reused_when_not_modified(mock_env_vars, mock_s3):
+    from product_service.lambda_func import catalog_snapshot
+
+    catalog_snapshot._state_cache.update(
+        etag='"cached"', state={'products': {}, 'stocks': {}, 'complete': True})
+    mock_s3.get_object.side_effect = ClientError(
+        {'Error': {'Code': '304', 'Message': 'Not Modified'}}, 'GetObject')
+
+    event = {'Records': [
+        stream_record('stocks', 'INSERT', {'product_id': {'S': '9'}}, {
+            'product_id': {'S': '9'}, 'count': {'N': '4'}}),
+    ]}
+
+    catalog_snapshot.handler(event, None)
+
+    assert mock_s3.get_object.call_args.kwargs['IfNoneMatch'] == '"cached"'
+    state = json.loads(written_objects(mock_s3)['catalog/state.json'])
+    assert state == {'products': {}, 'stocks': {'9': 4}, 'complete': True}
+
+
+def test_missing_state_rebuilt_before_publishing(mock_env_vars, mock_s3):
+    from product_service.lambda_func import catalog_snapshot
+
+    # Arrange: no state yet, the tables already hold two products
+    mock_s3.get_object.side_effect = ClientError(
+        {'Error': {'Code': 'NoSuchKey', 'Message': 'Not found'}}, 'GetObject')
+    tables = {
+        'products': MagicMock(**{'scan.return_value': {'Items': [
+            {'id': '1', 'title': 'Palm', 'price': 10},
+            {'id': '3', 'title': 'Fig', 'price': 49}]}}),
+        'stocks': MagicMock(**{'scan.return_value': {'Items': [
+            {'product_id': '1', 'count': 3}]}}),
+    }
+    event = {'Records': [
+        stream_record('products', 'INSERT', {'id': {'S': '3'}}, {
+            'id': {'S': '3'}, 'title': {'S': 'Fig'}, 'price': {'N': '49'}}),
+    ]}
+
+    # Act
+    with patch.object(catalog_snapshot, 'dynamodb') as mock_dynamodb:
+        mock_dynamodb.Table.side_effect = tables.get
+        catalog_snapshot.handler(event, None)
+
+    # Assert: the whole catalog is published, not just the streamed product
+    objects = written_objects(mock_s3)
+    assert json.loads(objects['catalog/products.json']) == [
+        {'id': '1', 'title': 'Palm', 'price': 10.0, 'count': 3},
+        {'id': '3', 'title': 'Fig', 'price': 49.0, 'count': 0},
+    ]
+    assert json.loads(objects['catalog/state.json'])['complete'] is True
+    assert tables['products'].scan.call_args.kwargs['ConsistentRead'] is True
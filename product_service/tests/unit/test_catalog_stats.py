@@ -0,0 +1,98 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+@pytest.fixture
+def mock_env_vars(monkeypatch):
+    monkeypatch.setenv('STOCK_TABLE_NAME', 'stocks')
+    monkeypatch.setenv('PRODUCTS_TABLE_NAME', 'products')
+    monkeypatch.setenv('STATS_TABLE_NAME', 'test-stats')
+    monkeypatch.setenv('AWS_REGION', 'eu-west-1')
+
+
+@pytest.fixture
+def mock_dynamodb_client():
+    dynamodb_client = MagicMock()
+    dynamodb_client.exceptions.ConditionalCheckFailedException = type(
+        'ConditionalCheckFailedException', (Exception,), {})
+    with patch('product_service.lambda_func.catalog_stats.dynamodb_client',
+               dynamodb_client):
+        yield dynamodb_client
+
+
+def stream_record(table, event_name, old_image=None, new_image=None):
+    record = {
+        'eventName': event_name,
+        'eventSourceARN': f'arn:aws:dynamodb:eu-west-1:123:table/{table}/stream/2024',
+        'dynamodb': {},
+    }
+    if old_image:
+        record['dynamodb']['OldImage'] = old_image
+    if new_image:
+        record['dynamodb']['NewImage'] = new_image
+    return record
+
+
+def test_stream_records_folded_into_one_update(mock_env_vars, mock_dynamodb_client):
+    from product_service.lambda_func.catalog_stats import handler
+
+    event = {'Records': [
+        # new product with its stock
+        stream_record('products', 'INSERT', new_image={
+            'id': {'S': '1'}, 'price': {'N': '10'}}),
+        stream_record('stocks', 'INSERT', new_image={
+            'product_id': {'S': '1'}, 'count': {'N': '3'}}),
+        # existing product overwritten by a re-import: only the difference
+        stream_record('products', 'MODIFY',
+                      old_image={'id': {'S': '2'}, 'price': {'N': '20'}},
+                      new_image={'id': {'S': '2'}, 'price': {'N': '25.5'}}),
+        stream_record('stocks', 'MODIFY',
+                      old_image={'product_id': {'S': '2'}, 'count': {'N': '4'}},
+                      new_image={'product_id': {'S': '2'}, 'count': {'N': '1'}}),
+        stream_record('products', 'REMOVE', old_image={
+            'id': {'S': '3'}, 'price': {'N': '7'}}),
+    ]}
+
+    # cheapest and most expensive product left in the price sort index
+    mock_dynamodb_client.query.side_effect = [
+        {'Items': [{'price': {'N': '10'}}]},
+        {'Items': [{'price': {'N': '25.5'}}]},
+    ]
+
+    handler(event, None)
+
+    counters, extremes = mock_dynamodb_client.update_item.call_args_list
+    assert counters.kwargs['ExpressionAttributeValues'] == {
+        ':products': {'N': '0'},
+        ':units': {'N': '0'},
+        ':price_sum': {'N': '8.5'},
+    }
+    assert extremes.kwargs['ExpressionAttributeValues'] == {
+        ':min_price': {'N': '10'}, ':max_price': {'N': '25.5'}}
+    queries = [c.kwargs for c in mock_dynamodb_client.query.call_args_list]
+    assert [(q['ScanIndexForward'], q['Limit']) for q in queries] == \
+        [(True, 1), (False, 1)]
+
+
+def test_price_extremes_removed_with_last_product(mock_env_vars, mock_dynamodb_client):
+    from product_service.lambda_func.catalog_stats import handler
+
+    mock_dynamodb_client.query.return_value = {'Items': []}
+
+    handler({'Records': [stream_record('products', 'REMOVE', old_image={
+        'id': {'S': '1'}, 'price': {'N': '7'}})]}, None)
+
+    extremes = mock_dynamodb_client.update_item.call_args_list[-1]
+    assert extremes.kwargs['UpdateExpression'] == 'REMOVE min_price, max_price'
+
+
+def test_unchanged_counters_not_written(mock_env_vars, mock_dynamodb_client):
+    from product_service.lambda_func.catalog_stats import handler
+
+    # a backfill touching a stock item without changing its count
+    image = {'product_id': {'S': '1'}, 'count': {'N': '2'}}
+    handler({'Records': [
+        stream_record('stocks', 'MODIFY', old_image=image, new_image=image)]}, None)
+
+    mock_dynamodb_client.update_item.assert_not_called()
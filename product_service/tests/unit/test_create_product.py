@@ -0,0 +1,215 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from product_service.lambda_func import create_product
+
+
+@pytest.fixture
+def mock_env_vars(monkeypatch):
+    monkeypatch.setenv('PRODUCTS_TABLE_NAME', 'products')
+    monkeypatch.setenv('STOCK_TABLE_NAME', 'stocks')
+    monkeypatch.setenv('CHANGES_TABLE_NAME', 'changes')
+
+
+@pytest.fixture
+def mock_dynamodb_client():
+    with patch('product_service.lambda_func.create_product.boto3') as mock_boto3:
+        yield mock_boto3.client.return_value
+
+
+def product(i, **overrides):
+    return dict({'title': f'Product {i}', 'description': 'Plant',
+                 'price': 10 + i, 'count': 1}, **overrides)
+
+
+def test_batch_creates_products_in_chunks(mock_env_vars, mock_dynamodb_client):
+    # Arrange
+    products = [product(i) for i in range(40)]
+
+    # Act
+    response = create_product.batch_handler(
+        {'body': json.dumps({'products': products})}, None)
+
+    # Assert
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['created'] == 40 and body['failed'] == 0
+    assert [item['product']['title'] for item in body['items']] == \
+        [p['title'] for p in products]
+    assert len({item['product']['id'] for item in body['items']}) == 40
+
+    calls = mock_dynamodb_client.transact_write_items.call_args_list
+    sizes = sorted(len(call.kwargs['TransactItems']) for call in calls)
+    assert sizes == [7 * 3, 33 * 3]
+    # chunks run concurrently: no item may be shared between transactions
+    assert all('Put' in action for call in calls
+               for action in call.kwargs['TransactItems'])
+
+
+def test_batch_reports_invalid_and_failed_products(mock_env_vars, mock_dynamodb_client):
+    # Arrange
+    mock_dynamodb_client.transact_write_items.side_effect = ClientError(
+        {'Error': {'Code': 'ProvisionedThroughputExceededException',
+                   'Message': 'Throttled'}}, 'TransactWriteItems')
+    products = [product(1, price=-1), 'Palm', product(2)]
+
+    # Act
+    response = create_product.batch_handler(
+        {'body': json.dumps({'products': products})}, None)
+
+    # Assert
+    body = json.loads(response['body'])
+    assert body['created'] == 0 and body['failed'] == 3
+    assert body['items'] == [
+        {'status': 'failed', 'error': "Field 'price' must be at least 0"},
+        {'status': 'failed', 'error': 'Product must be an object'},
+        {'status': 'failed', 'error': 'Database error: Throttled'},
+    ]
+    mock_dynamodb_client.update_item.assert_not_called()
+
+
+
+def test_batch_reports_timed_out_chunk_as_unknown(mock_env_vars, mock_dynamodb_client):
+    # Arrange: the smaller of two concurrent transactions times out
+    def transact_write_items(TransactItems):
+        if len(TransactItems) < create_product.BATCH_CHUNK_SIZE * 3:
+            raise ReadTimeoutError(endpoint_url='https://dynamodb')
+        return {}
+
+    mock_dynamodb_client.transact_write_items.side_effect = transact_write_items
+    products = [product(i) for i in range(create_product.BATCH_CHUNK_SIZE + 2)]
+
+    # Act
+    response = create_product.batch_handler(
+        {'body': json.dumps({'products': products})}, None)
+
+    # Assert: only the timed out chunk is reported, and not as failed
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert (body['created'], body['failed'], body['unknown']) == \
+        (create_product.BATCH_CHUNK_SIZE, 0, 2)
+    assert [item['status'] for item in body['items'][-3:]] == \
+        ['created', 'unknown', 'unknown']
+
+
+@pytest.mark.parametrize('event', [
+    {'body': json.dumps({'products': []})},
+    {'body': None},
+    {},
+])
+def test_batch_rejects_empty_body(mock_env_vars, mock_dynamodb_client, event):
+    response = create_product.batch_handler(event, None)
+
+    assert response['statusCode'] == 400
+    mock_dynamodb_client.transact_write_items.assert_not_called()
+
+
+@pytest.fixture
+def idempotency_table(monkeypatch):
+    monkeypatch.setenv('IDEMPOTENCY_TABLE_NAME', 'idempotency')
+
+
+def test_create_records_idempotency_key(mock_env_vars, idempotency_table,
+                                        mock_dynamodb_client):
+    # Arrange
+    mock_dynamodb_client.get_item.return_value = {}
+    event = {'headers': {'Idempotency-Key': 'key-1'},
+             'body': json.dumps(product(1))}
+
+    # Act
+    response = create_product.handler(event, None)
+
+    # Assert: the response is recorded in the product transaction
+    assert response['statusCode'] == 201
+    items = mock_dynamodb_client.transact_write_items.call_args.kwargs['TransactItems']
+    record = items[-1]['Put']
+    assert record['TableName'] == 'idempotency'
+    assert record['Item']['idempotency_key'] == {'S': 'key-1'}
+    assert record['Item']['response_body'] == {'S': response['body']}
+
+
+def test_create_replays_recorded_response(mock_env_vars, idempotency_table,
+                                          mock_dynamodb_client):
+    # Arrange
+    body = product(1)
+    request_hash = create_product.hashlib.sha256(
+        json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+    mock_dynamodb_client.get_item.return_value = {'Item': {
+        'idempotency_key': {'S': 'key-1'},
+        'request_hash': {'S': request_hash},
+        'status_code': {'N': '201'},
+        'response_body': {'S': '{"product": {"id": "abc"}}'},
+        'expires_at': {'N': '9999999999'},
+    }}
+    event = {'headers': {'idempotency-key': 'key-1'}, 'body': json.dumps(body)}
+
+    # Act
+    response = create_product.handler(event, None)
+    other = create_product.handler(
+        dict(event, body=json.dumps(product(2))), None)
+
+    # Assert
+    assert response['statusCode'] == 201
+    assert response['body'] == '{"product": {"id": "abc"}}'
+    assert response['headers']['Idempotent-Replayed'] == 'true'
+    assert other['statusCode'] == 422
+    mock_dynamodb_client.transact_write_items.assert_not_called()
+
+
+def test_create_replays_concurrent_request(mock_env_vars, idempotency_table,
+                                           mock_dynamodb_client):
+    # Arrange: the key is recorded between the lookup and the transaction
+    body = product(1)
+    request_hash = create_product.hashlib.sha256(
+        json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+    mock_dynamodb_client.get_item.side_effect = [{}, {'Item': {
+        'idempotency_key': {'S': 'key-1'},
+        'request_hash': {'S': request_hash},
+        'status_code': {'N': '201'},
+        'response_body': {'S': '{"product": {"id": "abc"}}'},
+        'expires_at': {'N': '9999999999'},
+    }}]
+    mock_dynamodb_client.transact_write_items.side_effect = ClientError(
+        {'Error': {'Code': 'TransactionCanceledException', 'Message': ''},
+         'CancellationReasons': [{'Code': 'None'}] * 3
+         + [{'Code': 'ConditionalCheckFailed'}]}, 'TransactWriteItems')
+
+    # Act
+    response = create_product.handler(
+        {'headers': {'Idempotency-Key': 'key-1'}, 'body': json.dumps(body)}, None)
+
+    # Assert
+    assert response['statusCode'] == 201
+    assert response['body'] == '{"product": {"id": "abc"}}'
+
+
+@pytest.mark.parametrize('data, error', [
+    ({'title': 'Palm', 'description': '', 'price': 1}, 'Missing required field: count'),
+    (product(1, title=5), "Field 'title' must be of type string"),
+    (product(1, price='5'), "Field 'price' must be of type number"),
+    (product(1, count=1.5), "Field 'count' must be of type integer"),
+    (product(1, count=True), "Field 'count' must be of type integer"),
+    (product(1, count=-1), "Field 'count' must be at least 0"),
+])
+def test_validate_product_data_follows_schema(data, error):
+    with pytest.raises(ValueError, match=error):
+        create_product.validate_product_data(data)
+
+    create_product.validate_product_data(product(1, price=0.5, count=0))
+
+
+def test_untitled_product_left_out_of_title_sort_index():
+    # Act
+    actions = create_product.product_actions(
+        ('products', 'stocks', 'changes'), '1', product(1, title=''), 'v1')
+
+    # Assert: DynamoDB rejects empty strings as index keys
+    item = actions[0]['Put']['Item']
+    assert item['title'] == {'S': ''}
+    assert 'title_sort' not in item
+    assert create_product.product_actions(
+        ('products', 'stocks', 'changes'), '2', product(2), 'v2'
+    )[0]['Put']['Item']['title_sort'] == {'S': 'product 2'}
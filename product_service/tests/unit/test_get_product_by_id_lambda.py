@@ -1,7 +1,15 @@
-from unittest.mock import Mock, patch
+from decimal import Decimal
+from unittest.mock import MagicMock, Mock, patch
 import json
+import time
+import zlib
 
-from product_service.lambda_func.product_by_id import handler
+import pytest
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
+
+from product_service.lambda_func import product_by_id
+from product_service.lambda_func.product_by_id import batch_handler, handler
 
 
 # Sample test data
@@ -11,6 +19,13 @@ MOCK_PRODUCTS = [
 ]
 
 
+@pytest.fixture(autouse=True)
+def empty_product_cache():
+    # every test starts with a cold container
+    with patch.dict(product_by_id._product_cache, clear=True):
+        yield
+
+
 def test_product_by_id_success():
     # Arrange
     event = {
@@ -66,3 +81,451 @@ def test_product_by_id_not_found():
 
     body = json.loads(response['body'])
     assert body == {"message": "Product not found"}
+
+
+@pytest.fixture
+def mock_tables(monkeypatch):
+    monkeypatch.setenv('PRODUCTS_TABLE_NAME', 'test-products')
+    monkeypatch.setenv('STOCK_TABLE_NAME', 'test-stock')
+
+    product_table = MagicMock()
+    product_table.name = 'test-products'
+    stock_table = MagicMock()
+    stock_table.name = 'test-stock'
+    tables = {'test-products': product_table, 'test-stock': stock_table}
+
+    with patch('product_service.lambda_func.product_by_id.boto3') as mock_boto3:
+        mock_boto3.resource.return_value.Table.side_effect = tables.get
+        yield {'products': product_table, 'stock': stock_table,
+               'client': mock_boto3.client.return_value}
+
+
+def test_product_by_id_sparse_fields(mock_tables):
+    # Arrange
+    mock_tables['products'].get_item.return_value = {
+        'Item': {'id': '1', 'title': 'Citrus', 'price': Decimal('29.9')}}
+    event = {
+        'pathParameters': {'id': '1'},
+        'queryStringParameters': {'fields': 'title,price'},
+    }
+
+    # Act
+    response = handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {
+        'id': '1', 'title': 'Citrus', 'price': 29.9}
+    mock_tables['products'].get_item.assert_called_once_with(
+        Key={'id': '1'},
+        ProjectionExpression='#id, #title, #price, #version',
+        ExpressionAttributeNames={
+            '#id': 'id', '#title': 'title', '#price': 'price',
+            '#version': 'version'})
+    mock_tables['stock'].get_item.assert_not_called()
+
+
+def test_product_by_id_splices_pre_rendered_json(mock_tables):
+    # Arrange
+    mock_tables['client'].batch_get_item.return_value = {'Responses': {
+        'test-products': [{
+            'id': {'S': '1'}, 'title': {'S': 'Citrus'}, 'price': {'N': '29.9'},
+            'product_json': {'S': '{"id": "1", "title": "Citrus", "price": 29.9}'}}],
+        'test-stock': [{'product_id': {'S': '1'}, 'count': {'N': '4'}}],
+    }}
+
+    # Act
+    response = handler({'pathParameters': {'id': '1'}}, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert response['body'] == (
+        '{"id": "1", "title": "Citrus", "price": 29.9, "count": 4}')
+
+
+def test_product_by_id_single_batch_get(mock_tables):
+    # Arrange: the stock key is unprocessed on the first attempt
+    mock_tables['client'].batch_get_item.side_effect = [
+        {'Responses': {'test-products': [
+            {'id': {'S': '1'}, 'title': {'S': 'Citrus'}, 'price': {'N': '5'}}]},
+         'UnprocessedKeys': {'test-stock': {
+             'Keys': [{'product_id': {'S': '1'}}]}}},
+        {'Responses': {'test-stock': [
+            {'product_id': {'S': '1'}, 'count': {'N': '2'}}]}},
+    ]
+
+    # Act
+    with patch('product_service.lambda_func.product_items.time.sleep'):
+        response = handler({'pathParameters': {'id': '1'}}, Mock())
+
+    # Assert
+    assert json.loads(response['body']) == {
+        'id': '1', 'title': 'Citrus', 'price': 5.0, 'count': 2}
+    assert mock_tables['client'].batch_get_item.call_args_list[0].kwargs == {
+        'RequestItems': {
+            'test-products': {'Keys': [{'id': {'S': '1'}}]},
+            'test-stock': {'Keys': [{'product_id': {'S': '1'}}]},
+        }}
+    mock_tables['products'].get_item.assert_not_called()
+    mock_tables['stock'].get_item.assert_not_called()
+
+
+def test_product_by_id_consistent_read_not_found(mock_tables):
+    # Arrange: stock exists, product does not
+    mock_tables['client'].transact_get_items.return_value = {'Responses': [
+        {}, {'Item': {'product_id': {'S': '1'}, 'count': {'N': '2'}}}]}
+    event = {
+        'pathParameters': {'id': '1'},
+        'queryStringParameters': {'consistent': 'true'},
+    }
+
+    # Act
+    response = handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 404
+    mock_tables['client'].transact_get_items.assert_called_once_with(
+        TransactItems=[
+            {'Get': {'TableName': 'test-products', 'Key': {'id': {'S': '1'}}}},
+            {'Get': {'TableName': 'test-stock',
+                     'Key': {'product_id': {'S': '1'}}}},
+        ])
+    mock_tables['client'].batch_get_item.assert_not_called()
+
+
+def test_product_by_id_decompresses_description(mock_tables):
+    # Arrange
+    description = 'Evergreen tropical plant. ' * 20
+    mock_tables['products'].get_item.return_value = {'Item': {
+        'id': '1', 'title': 'Palm', 'price': Decimal('10'),
+        'description': Binary(zlib.compress(description.encode('utf-8')))}}
+    event = {
+        'pathParameters': {'id': '1'},
+        'queryStringParameters': {'fields': 'description'},
+    }
+
+    # Act
+    response = handler(event, Mock())
+
+    # Assert
+    assert json.loads(response['body']) == {'id': '1', 'description': description}
+
+
+def test_product_by_id_unknown_field():
+    # Act
+    response = handler({
+        'pathParameters': {'id': '1'},
+        'queryStringParameters': {'fields': 'weight'},
+    }, Mock())
+
+    # Assert
+    assert response['statusCode'] == 400
+
+
+def test_batch_get_chunks_and_reports_missing(mock_tables):
+    # Arrange: 60 ids need two chunks of 50 product+stock pairs
+    product_ids = [str(i) for i in range(60)]
+
+    def batch_get_item(RequestItems):
+        product_keys = RequestItems['test-products']['Keys']
+        assert len(product_keys) + len(RequestItems['test-stock']['Keys']) <= 100
+        return {'Responses': {
+            'test-products': [
+                {'id': key['id'], 'title': {'S': 'Palm'}, 'price': {'N': '10'}}
+                for key in product_keys if key['id']['S'] != '7'],
+            'test-stock': [
+                {'product_id': key['id'], 'count': {'N': '3'}}
+                for key in product_keys],
+        }}
+
+    mock_tables['client'].batch_get_item.side_effect = batch_get_item
+    event = {'body': json.dumps({'ids': product_ids})}
+
+    # Act
+    response = batch_handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert [item['id'] for item in body['items']] == [
+        i for i in product_ids if i != '7']
+    assert body['items'][0] == {'id': '0', 'title': 'Palm', 'price': 10.0,
+                                'count': 3}
+    assert body['missing'] == ['7']
+    assert mock_tables['client'].batch_get_item.call_count == 2
+
+
+@pytest.mark.parametrize('body', [
+    '{}', '{"ids": []}', '{"ids": [1]}', '{"ids": "1"}', 'not json',
+    json.dumps({'ids': [str(i) for i in range(101)]}),
+])
+def test_batch_get_invalid_body(body):
+    response = batch_handler({'body': body}, Mock())
+
+    assert response['statusCode'] == 400
+
+
+@pytest.fixture
+def id_filter(monkeypatch):
+    from product_service.lambda_func import catalog_indexer, product_by_id
+
+    monkeypatch.setenv('CATALOG_BUCKET_NAME', 'test-bucket')
+    body = MagicMock()
+    body.read.return_value = json.dumps(catalog_indexer.render_id_filter(
+        [str(i) for i in range(100)],
+        f"{int(time.time() * 1000) - 60000:013d}")).encode('utf-8')
+    mock_s3_client = MagicMock()
+    mock_s3_client.get_object.return_value = {'Body': body, 'ETag': '"etag"'}
+
+    with patch.object(product_by_id, 's3', mock_s3_client), \
+            patch.dict(product_by_id._id_filter_cache, clear=True):
+        yield mock_s3_client
+
+
+def test_id_filter_rules_out_unknown_ids(mock_tables, id_filter):
+    from product_service.lambda_func.product_by_id import might_exist
+
+    assert all(might_exist(str(i)) for i in range(100))
+    false_positives = sum(might_exist(f'unknown-{i}') for i in range(1000))
+    assert false_positives < 20
+    id_filter.get_object.assert_called_once()
+
+
+def test_unknown_id_not_found_without_dynamodb_read(mock_tables, id_filter):
+    # Arrange: no product written since the filter
+    mock_tables['client'].query.return_value = {'Items': []}
+
+    # Act
+    responses = [handler({'pathParameters': {'id': f'unknown-{i}'}}, Mock())
+                 for i in range(3)]
+
+    # Assert: filter and change log are read once per ID_FILTER_TTL
+    assert [response['statusCode'] for response in responses] == [404] * 3
+    id_filter.get_object.assert_called_once()
+    mock_tables['client'].query.assert_called_once()
+    assert mock_tables['client'].query.call_args.kwargs['ConsistentRead'] is True
+    mock_tables['client'].batch_get_item.assert_not_called()
+    mock_tables['products'].get_item.assert_not_called()
+
+
+def test_id_filter_and_change_log_refreshed_after_ttl(mock_tables, id_filter):
+    # Arrange
+    mock_tables['client'].query.return_value = {'Items': []}
+    handler({'pathParameters': {'id': 'unknown-id'}}, Mock())
+    id_filter.get_object.side_effect = ClientError(
+        {'Error': {'Code': '304', 'Message': 'Not Modified'}}, 'GetObject')
+
+    # Act
+    with patch.object(product_by_id.time, 'time',
+                      return_value=time.time() + product_by_id.ID_FILTER_TTL):
+        response = handler({'pathParameters': {'id': 'unknown-id'}}, Mock())
+
+    # Assert
+    assert response['statusCode'] == 404
+    assert id_filter.get_object.call_args.kwargs['IfNoneMatch'] == '"etag"'
+    assert mock_tables['client'].query.call_count == 2
+
+
+def test_id_written_since_filter_is_read(mock_tables, id_filter):
+    # Arrange: the product was created after the filter was written
+    mock_tables['client'].query.return_value = {
+        'Items': [{'product_id': {'S': 'new-id'}}]}
+    mock_tables['client'].batch_get_item.return_value = {'Responses': {
+        'test-products': [{'id': {'S': 'new-id'}, 'title': {'S': 'Fig'},
+                           'price': {'N': '12'}}],
+        'test-stock': [{'product_id': {'S': 'new-id'}, 'count': {'N': '1'}}],
+    }}
+
+    # Act
+    response = handler({'pathParameters': {'id': 'new-id'}}, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['id'] == 'new-id'
+
+
+def test_unversioned_id_filter_rules_out_nothing(mock_tables, id_filter):
+    from product_service.lambda_func import catalog_indexer
+
+    # Arrange: filter written before it recorded its change log version
+    id_filter.get_object.return_value['Body'].read.return_value = json.dumps(
+        catalog_indexer.render_id_filter(['1'])).encode('utf-8')
+
+    # Act
+    absent = product_by_id.ruled_out(['unknown-id'])
+
+    # Assert
+    assert absent == set()
+    mock_tables['client'].query.assert_not_called()
+
+
+def test_batch_get_checks_change_log_once(mock_tables, id_filter):
+    # Arrange
+    mock_tables['client'].query.return_value = {
+        'Items': [{'product_id': {'S': 'new-id'}}]}
+    mock_tables['client'].batch_get_item.return_value = {'Responses': {}}
+    event = {'body': json.dumps({'ids': ['1', 'unknown-id', 'new-id']})}
+
+    # Act
+    response = batch_handler(event, Mock())
+
+    # Assert: only the ruled out id is not read
+    assert response['statusCode'] == 200
+    mock_tables['client'].query.assert_called_once()
+    request = mock_tables['client'].batch_get_item.call_args.kwargs['RequestItems']
+    assert [key['id']['S'] for key in request['test-products']['Keys']] == \
+        ['1', 'new-id']
+
+
+def test_consistent_read_bypasses_id_filter(mock_tables, id_filter):
+    # Arrange
+    mock_tables['client'].transact_get_items.return_value = {'Responses': [
+        {'Item': {'id': {'S': 'new-id'}, 'title': {'S': 'Fig'},
+                  'price': {'N': '12'}}},
+        {}]}
+    event = {
+        'pathParameters': {'id': 'new-id'},
+        'queryStringParameters': {'consistent': 'true'},
+    }
+
+    # Act
+    response = handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['count'] == 0
+
+
+def test_product_by_id_etag_from_versions(mock_tables):
+    # Arrange
+    mock_tables['client'].batch_get_item.return_value = {'Responses': {
+        'test-products': [{
+            'id': {'S': '1'}, 'title': {'S': 'Citrus'}, 'price': {'N': '5'},
+            'version': {'S': '1700000000000#1'}}],
+        'test-stock': [{'product_id': {'S': '1'}, 'count': {'N': '2'},
+                        'version': {'S': '1700000000000#1'}}],
+    }}
+
+    # Act
+    response = handler({'pathParameters': {'id': '1'}}, Mock())
+
+    # Assert
+    from product_service.lambda_func.product_by_id import version_etag
+    assert response['statusCode'] == 200
+    assert response['headers']['ETag'] == version_etag(
+        '1700000000000#1', '1700000000000#1')
+
+
+def test_product_by_id_not_modified_from_version_read(mock_tables):
+    from product_service.lambda_func.product_by_id import version_etag
+
+    # Arrange
+    mock_tables['client'].batch_get_item.return_value = {'Responses': {
+        'test-products': [{'id': {'S': '1'}, 'version': {'S': 'v2'}}],
+        'test-stock': [{'product_id': {'S': '1'}, 'version': {'S': 'v3'}}],
+    }}
+    event = {
+        'pathParameters': {'id': '1'},
+        'headers': {'if-none-match': version_etag('v2', 'v3')},
+    }
+
+    # Act
+    response = handler(event, Mock())
+
+    # Assert: a single projection-only read
+    assert response['statusCode'] == 304
+    assert response['body'] == ''
+    request = mock_tables['client'].batch_get_item.call_args.kwargs['RequestItems']
+    assert request['test-products']['ProjectionExpression'] == '#id, #version'
+    assert request['test-stock']['ProjectionExpression'] == '#product_id, #version'
+    assert mock_tables['client'].batch_get_item.call_count == 1
+
+
+def test_product_by_id_stock_change_invalidates_etag(mock_tables):
+    from product_service.lambda_func.product_by_id import version_etag
+
+    # Arrange: the stock was written since the client's copy
+    mock_tables['client'].batch_get_item.return_value = {'Responses': {
+        'test-products': [{'id': {'S': '1'}, 'title': {'S': 'Citrus'},
+                           'price': {'N': '5'}, 'version': {'S': 'v2'}}],
+        'test-stock': [{'product_id': {'S': '1'}, 'count': {'N': '1'},
+                        'version': {'S': 'v4'}}],
+    }}
+    event = {
+        'pathParameters': {'id': '1'},
+        'headers': {'If-None-Match': version_etag('v2', 'v3')},
+    }
+
+    # Act
+    response = handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert response['headers']['ETag'] == version_etag('v2', 'v4')
+
+
+
+def test_product_by_id_served_from_cache(mock_tables):
+    # Arrange
+    mock_tables['client'].batch_get_item.return_value = {'Responses': {
+        'test-products': [{
+            'id': {'S': '1'}, 'title': {'S': 'Citrus'}, 'price': {'N': '5'},
+            'version': {'S': 'v1'}}],
+        'test-stock': [{'product_id': {'S': '1'}, 'count': {'N': '2'},
+                        'version': {'S': 'v1'}}],
+    }}
+    event = {'pathParameters': {'id': '1'}}
+
+    # Act
+    first = handler(event, Mock())
+    second = handler(event, Mock())
+    sparse = handler(dict(event, queryStringParameters={'fields': 'title'}), Mock())
+
+    # Assert: one read serves all three requests
+    assert second['body'] == first['body']
+    assert second['headers']['ETag'] == first['headers']['ETag']
+    assert json.loads(sparse['body']) == {'id': '1', 'title': 'Citrus'}
+    assert mock_tables['client'].batch_get_item.call_count == 1
+
+
+def test_product_by_id_cache_revalidated_by_version(mock_tables):
+    # Arrange
+    mock_tables['client'].batch_get_item.side_effect = [
+        {'Responses': {
+            'test-products': [{'id': {'S': '1'}, 'title': {'S': 'Citrus'},
+                               'price': {'N': '5'}, 'version': {'S': 'v1'}}],
+            'test-stock': [{'product_id': {'S': '1'}, 'count': {'N': '2'},
+                            'version': {'S': 'v1'}}]}},
+        # version check after the TTL: stock was written meanwhile
+        {'Responses': {
+            'test-products': [{'id': {'S': '1'}, 'version': {'S': 'v1'}}],
+            'test-stock': [{'product_id': {'S': '1'}, 'version': {'S': 'v2'}}]}},
+        {'Responses': {
+            'test-products': [{'id': {'S': '1'}, 'title': {'S': 'Citrus'},
+                               'price': {'N': '5'}, 'version': {'S': 'v1'}}],
+            'test-stock': [{'product_id': {'S': '1'}, 'count': {'N': '7'},
+                            'version': {'S': 'v2'}}]}},
+    ]
+    event = {'pathParameters': {'id': '1'}}
+    handler(event, Mock())
+
+    # Act
+    fresh_until = product_by_id._product_cache['1'][0]
+    with patch('product_service.lambda_func.product_by_id.time.time',
+               return_value=fresh_until + 1):
+        response = handler(event, Mock())
+
+    # Assert
+    assert json.loads(response['body'])['count'] == 7
+    assert product_by_id._product_cache['1'][1]['stock_version'] == 'v2'
+
+
+def test_product_by_id_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(product_by_id, 'PRODUCT_CACHE_MAX_ENTRIES', 2)
+
+    product_by_id.cache_put('1', {'id': '1'})
+    product_by_id.cache_put('2', {'id': '2'})
+    product_by_id.cache_get('1')
+    product_by_id.cache_put('3', {'id': '3'})
+
+    assert list(product_by_id._product_cache) == ['1', '3']
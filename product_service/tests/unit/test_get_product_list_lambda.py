@@ -1,6 +1,11 @@
-from unittest.mock import Mock
+import base64
+import gzip
+from decimal import Decimal
+from unittest.mock import MagicMock, Mock, patch
 import json
 
+import pytest
+
 from product_service.lambda_func import product_list
 
 # Sample test data
@@ -39,6 +44,484 @@ def test_product_list_success():
         assert isinstance(product['price'], (int, float))
 
 
+@pytest.fixture
+def mock_tables(monkeypatch):
+    monkeypatch.setenv('PRODUCTS_TABLE_NAME', 'test-products')
+    monkeypatch.setenv('STOCK_TABLE_NAME', 'test-stock')
+
+    product_table = MagicMock()
+    product_table.name = 'test-products'
+    stock_table = MagicMock()
+    stock_table.name = 'test-stock'
+    tables = {'test-products': product_table, 'test-stock': stock_table}
+    product_list._catalog_cache.clear()
+
+    with patch('product_service.lambda_func.product_list.boto3') as mock_boto3:
+        mock_boto3.resource.return_value.Table.side_effect = tables.get
+        yield {'products': product_table, 'stock': stock_table}
+
+
+def test_product_list_follows_last_evaluated_key(mock_tables):
+    # Arrange
+    mock_tables['products'].scan.side_effect = [
+        {'Items': [{'id': '1', 'title': 'Citrus', 'price': Decimal('5.99')}],
+         'LastEvaluatedKey': {'id': '1'}},
+        {'Items': [{'id': '2', 'title': 'Palm', 'price': Decimal('10')}]},
+    ]
+    mock_tables['stock'].scan.return_value = {
+        'Items': [{'product_id': '1', 'count': Decimal('3')}]}
+
+    # Act
+    response = product_list.handler({}, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    products = json.loads(response['body'])
+    assert [p['id'] for p in products] == ['1', '2']
+    assert products[0]['count'] == 3
+    assert products[1]['count'] == 0
+    assert mock_tables['products'].scan.call_args_list[1].kwargs == {
+        'ExclusiveStartKey': {'id': '1'}}
+
+
+def test_product_list_splices_pre_rendered_json(mock_tables):
+    # Arrange: one product written with product_json, one without
+    mock_tables['products'].scan.return_value = {'Items': [
+        {'id': '1', 'title': 'Citrus', 'price': Decimal('5.99'),
+         'product_json': '{"id": "1", "title": "Citrus", "price": 5.99}'},
+        {'id': '2', 'title': 'Palm', 'price': Decimal('10')},
+    ]}
+    mock_tables['stock'].scan.return_value = {
+        'Items': [{'product_id': '1', 'count': Decimal('3')}]}
+
+    # Act
+    response = product_list.handler({}, Mock())
+
+    # Assert: same text as serializing the converted items
+    assert response['body'] == json.dumps([
+        {'id': '1', 'title': 'Citrus', 'price': 5.99, 'count': 3},
+        {'id': '2', 'title': 'Palm', 'price': 10.0, 'count': 0},
+    ])
+
+
+def test_product_list_page_with_cursor(mock_tables):
+    # Arrange
+    mock_tables['products'].scan.return_value = {
+        'Items': [{'id': '2', 'title': 'Palm', 'price': Decimal('10')}],
+        'LastEvaluatedKey': {'id': '2'}}
+    mock_tables['stock'].meta.client.batch_get_item.return_value = {
+        'Responses': {'test-stock': [
+            {'product_id': {'S': '2'}, 'count': {'N': '7'}}]}}
+    cursor = product_list.encode_cursor({'id': '1'})
+    event = {'queryStringParameters': {'limit': '1', 'cursor': cursor}}
+
+    # Act
+    response = product_list.handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['items'] == [
+        {'id': '2', 'title': 'Palm', 'price': 10.0, 'count': 7}]
+    assert product_list.decode_cursor(body['nextCursor']) == {'id': '2'}
+    mock_tables['products'].scan.assert_called_once_with(
+        Limit=1, ExclusiveStartKey={'id': '1'})
+    mock_tables['stock'].scan.assert_not_called()
+
+
+def test_get_stock_counts_chunks_and_retries_unprocessed_keys(mock_tables):
+    # Arrange
+    client = mock_tables['stock'].meta.client
+    ids = [str(i) for i in range(150)]
+
+    def batch_get_item(RequestItems):
+        keys = RequestItems['test-stock']['Keys']
+        if len(keys) == 100 and client.batch_get_item.call_count == 1:
+            # first chunk: return half, leave the rest unprocessed
+            return {
+                'Responses': {'test-stock': [
+                    {'product_id': key['product_id'], 'count': {'N': '1'}}
+                    for key in keys[:50]]},
+                'UnprocessedKeys': {'test-stock': dict(
+                    RequestItems['test-stock'], Keys=keys[50:])}}
+        return {'Responses': {'test-stock': [
+            {'product_id': key['product_id'], 'count': {'N': '1'}}
+            for key in keys]}}
+
+    client.batch_get_item.side_effect = batch_get_item
+
+    # Act
+    with patch('product_service.lambda_func.product_items.time.sleep'):
+        counts = product_list.get_stock_counts(mock_tables['stock'], ids)
+
+    # Assert
+    assert set(counts) == set(ids)
+    assert client.batch_get_item.call_count == 3
+
+
+def test_get_products_with_stocks_parallel_scan(mock_tables):
+    # Arrange
+    client = MagicMock()
+    mock_tables['products'].meta.client = client
+    mock_tables['stock'].meta.client = client
+
+    def scan(TableName, Segment, TotalSegments, **_kwargs):
+        if TableName == 'test-products':
+            return {'Items': [{
+                'id': {'S': f'p{Segment}'},
+                'title': {'S': 'Plant'},
+                'price': {'N': '10'}}]}
+        return {'Items': [{
+            'product_id': {'S': f'p{Segment}'},
+            'count': {'N': str(Segment + 1)}}]}
+
+    client.scan.side_effect = scan
+
+    # Act
+    products = product_list.get_products_with_stocks(total_segments=3)
+
+    # Assert
+    assert sorted((p['id'], p['count']) for p in products) == [
+        ('p0', 1), ('p1', 2), ('p2', 3)]
+    assert client.scan.call_count == 6
+    assert {c.kwargs['TotalSegments'] for c in client.scan.call_args_list} == {3}
+    mock_tables['products'].scan.assert_not_called()
+
+
+def test_product_list_not_modified_from_warm_cache(mock_tables):
+    # Arrange
+    mock_tables['products'].scan.return_value = {
+        'Items': [{'id': '1', 'title': 'Citrus', 'price': Decimal('5.99')}]}
+    mock_tables['stock'].scan.return_value = {'Items': []}
+    first = product_list.handler({}, Mock())
+    etag = first['headers']['ETag']
+
+    # Act
+    response = product_list.handler(
+        {'headers': {'if-none-match': etag}}, Mock())
+
+    # Assert
+    assert first['statusCode'] == 200
+    assert response['statusCode'] == 304
+    assert response['body'] == ''
+    assert response['headers']['ETag'] == etag
+    mock_tables['products'].scan.assert_called_once()
+
+
+def test_product_list_gzip_compressed(mock_tables):
+    # Arrange
+    mock_tables['products'].scan.return_value = {'Items': [
+        {'id': str(i), 'title': 'Plant', 'description': 'Green ' * 20,
+         'price': Decimal('10')} for i in range(50)]}
+    mock_tables['stock'].scan.return_value = {'Items': []}
+    event = {'headers': {'Accept-Encoding': 'br;q=0, gzip, deflate'}}
+
+    # Act
+    response = product_list.handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert response['isBase64Encoded'] is True
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    products = json.loads(gzip.decompress(base64.b64decode(response['body'])))
+    assert len(products) == 50
+
+
+def test_product_list_compressed_etag_is_weak(mock_tables):
+    # Arrange
+    mock_tables['products'].scan.return_value = {'Items': [
+        {'id': str(i), 'title': 'Plant', 'description': 'Green ' * 20,
+         'price': Decimal('10')} for i in range(50)]}
+    mock_tables['stock'].scan.return_value = {'Items': []}
+    identity = product_list.handler({}, Mock())
+
+    # Act
+    compressed = product_list.handler(
+        {'headers': {'Accept-Encoding': 'gzip'}}, Mock())
+    revalidated = product_list.handler(
+        {'headers': {'Accept-Encoding': 'gzip',
+                     'If-None-Match': compressed['headers']['ETag']}}, Mock())
+
+    # Assert: the gzip body does not share the strong ETag of the identity body
+    assert compressed['headers']['ETag'] == 'W/' + identity['headers']['ETag']
+    assert revalidated['statusCode'] == 304
+    assert revalidated['headers']['ETag'] == compressed['headers']['ETag']
+
+
+def test_product_list_small_body_not_compressed(mock_tables):
+    # Arrange
+    mock_tables['products'].scan.return_value = {'Items': []}
+    mock_tables['stock'].scan.return_value = {'Items': []}
+
+    # Act
+    response = product_list.handler(
+        {'headers': {'Accept-Encoding': 'gzip'}}, Mock())
+
+    # Assert
+    assert response['body'] == '[]'
+    assert 'isBase64Encoded' not in response
+
+
+def test_product_list_sparse_fields_skip_stock(mock_tables):
+    # Arrange
+    mock_tables['products'].scan.return_value = {
+        'Items': [{'id': '1', 'title': 'Citrus', 'price': Decimal('5.99')}]}
+    event = {'queryStringParameters': {'fields': 'title,price'}}
+
+    # Act
+    response = product_list.handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == [
+        {'id': '1', 'title': 'Citrus', 'price': 5.99}]
+    mock_tables['products'].scan.assert_called_once_with(
+        ProjectionExpression='#id, #title, #price',
+        ExpressionAttributeNames={
+            '#id': 'id', '#title': 'title', '#price': 'price'})
+    mock_tables['stock'].scan.assert_not_called()
+
+
+def test_product_list_price_range_queries_overlapping_buckets(mock_tables):
+    # Arrange
+    items_by_bucket = {
+        5: [{'id': 'a', 'title': 'Aloe', 'price': Decimal('25'),
+             'price_bucket': Decimal('5')}],
+        6: [{'id': 'b', 'title': 'Palm', 'price': Decimal('40'),
+             'price_bucket': Decimal('6')}],
+    }
+
+    def query(IndexName, KeyConditionExpression, **_kwargs):
+        bucket = KeyConditionExpression.get_expression()['values'][0] \
+            .get_expression()['values'][1]
+        return {'Items': items_by_bucket[bucket]}
+
+    mock_tables['products'].query.side_effect = query
+    mock_tables['stock'].meta.client.batch_get_item.return_value = {
+        'Responses': {'test-stock': [
+            {'product_id': {'S': 'b'}, 'count': {'N': '2'}}]}}
+    event = {'queryStringParameters': {'minPrice': '20', 'maxPrice': '50'}}
+
+    # Act
+    response = product_list.handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == [
+        {'id': 'a', 'title': 'Aloe', 'price': 25.0, 'count': 0},
+        {'id': 'b', 'title': 'Palm', 'price': 40.0, 'count': 2},
+    ]
+    assert mock_tables['products'].query.call_count == 2
+    mock_tables['products'].scan.assert_not_called()
+    mock_tables['stock'].scan.assert_not_called()
+
+
+def test_get_products_by_price_page_ends_on_bucket_boundary(mock_tables):
+    # Arrange
+    mock_tables['products'].query.return_value = {'Items': [
+        {'id': 'a', 'price': Decimal('25'), 'price_bucket': Decimal('5')}]}
+
+    # Act
+    products, last_key = product_list.get_products_by_price(
+        Decimal('20'), Decimal('50'), limit=1, fields=('id', 'price'))
+
+    # Assert
+    assert products == [{'id': 'a', 'price': 25.0}]
+    assert last_key == {'price_bucket': 6}
+    assert mock_tables['products'].query.call_args.kwargs['Limit'] == 1
+    assert product_list.decode_cursor(
+        product_list.encode_cursor(last_key)) == {'price_bucket': 6}
+
+
+def test_get_products_by_price_caps_buckets(mock_tables):
+    # Arrange
+    mock_tables['products'].query.return_value = {'Items': []}
+
+    # Act
+    product_list.get_products_by_price(
+        Decimal('1e299'), Decimal('1e300'), fields=('id', 'price'))
+
+    # Assert
+    assert mock_tables['products'].query.call_count == 1
+    assert product_list.price_bucket(Decimal('1e300')) == \
+        product_list.MAX_PRICE_BUCKET
+
+
+def test_product_list_cheapest_first_is_single_query(mock_tables):
+    # Arrange
+    last_key = {'catalog_pk': 'PRODUCT', 'price': Decimal('20'), 'id': 'p'}
+    mock_tables['products'].query.return_value = {
+        'Items': [{'id': 'p', 'title': 'Pothos', 'price': Decimal('20')}],
+        'LastEvaluatedKey': last_key}
+    event = {'queryStringParameters': {
+        'sort': 'price', 'order': 'asc', 'limit': '1', 'fields': 'title,price'}}
+
+    # Act
+    response = product_list.handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['items'] == [{'id': 'p', 'title': 'Pothos', 'price': 20.0}]
+    assert product_list.decode_cursor(body['nextCursor']) == last_key
+    mock_tables['products'].query.assert_called_once()
+    query_kwargs = mock_tables['products'].query.call_args.kwargs
+    assert query_kwargs['IndexName'] == 'price-sort-index'
+    assert query_kwargs['ScanIndexForward'] is True
+    assert query_kwargs['Limit'] == 1
+
+
+def test_product_list_sorted_page_continues_from_cursor(mock_tables):
+    # Arrange
+    start_key = {'catalog_pk': 'PRODUCT', 'title_sort': 'palm', 'id': 'b'}
+    mock_tables['products'].query.return_value = {'Items': []}
+    event = {'queryStringParameters': {
+        'sort': 'title', 'order': 'desc', 'fields': 'title',
+        'cursor': product_list.encode_cursor(start_key)}}
+
+    # Act
+    response = product_list.handler(event, Mock())
+
+    # Assert
+    assert json.loads(response['body']) == {'items': [], 'nextCursor': None}
+    query_kwargs = mock_tables['products'].query.call_args.kwargs
+    assert query_kwargs['IndexName'] == 'title-sort-index'
+    assert query_kwargs['ScanIndexForward'] is False
+    assert query_kwargs['ExclusiveStartKey'] == start_key
+
+
+def test_product_list_in_stock_from_sparse_index(mock_tables):
+    # Arrange
+    mock_tables['stock'].query.return_value = {
+        'Items': [{'product_id': 'b', 'count': Decimal('2'), 'in_stock': 'Y'},
+                  {'product_id': 'a', 'count': Decimal('5'), 'in_stock': 'Y'}],
+        'LastEvaluatedKey': {'in_stock': 'Y', 'product_id': 'a'}}
+    mock_tables['products'].meta.client.batch_get_item.return_value = {
+        'Responses': {'test-products': [
+            {'id': {'S': 'a'}, 'title': {'S': 'Aloe'}, 'price': {'N': '25'}},
+            {'id': {'S': 'b'}, 'title': {'S': 'Palm'}, 'price': {'N': '40'}}]}}
+    event = {'queryStringParameters': {'inStock': 'true', 'limit': '2'}}
+
+    # Act
+    response = product_list.handler(event, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['items'] == [
+        {'id': 'b', 'title': 'Palm', 'price': 40.0, 'count': 2},
+        {'id': 'a', 'title': 'Aloe', 'price': 25.0, 'count': 5},
+    ]
+    assert product_list.decode_cursor(body['nextCursor']) == {
+        'in_stock': 'Y', 'product_id': 'a'}
+    assert mock_tables['stock'].query.call_args.kwargs['IndexName'] == \
+        'in-stock-index'
+    mock_tables['products'].scan.assert_not_called()
+    mock_tables['stock'].scan.assert_not_called()
+
+
+def test_product_list_sorted_in_stock_drops_sold_out(mock_tables):
+    # Arrange
+    mock_tables['products'].query.return_value = {'Items': [
+        {'id': 'a', 'title': 'Aloe', 'price': Decimal('25')},
+        {'id': 'b', 'title': 'Palm', 'price': Decimal('40')}]}
+    mock_tables['stock'].meta.client.batch_get_item.return_value = {
+        'Responses': {'test-stock': [
+            {'product_id': {'S': 'a'}, 'count': {'N': '0'}},
+            {'product_id': {'S': 'b'}, 'count': {'N': '3'}}]}}
+    event = {'queryStringParameters': {
+        'sort': 'price', 'inStock': 'true', 'fields': 'title'}}
+
+    # Act
+    response = product_list.handler(event, Mock())
+
+    # Assert
+    assert json.loads(response['body']) == [{'id': 'b', 'title': 'Palm'}]
+
+
+def test_product_list_served_from_snapshot(mock_tables, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(product_list, 'CATALOG_SNAPSHOT_MODE', 'serve')
+    monkeypatch.setenv('CATALOG_BUCKET_NAME', 'test-bucket')
+    snapshot = MagicMock()
+    snapshot.read.return_value = b'[{"id": "1", "title": "Palm"}]'
+
+    # Act
+    with patch.object(product_list, 's3') as mock_s3:
+        mock_s3.get_object.return_value = {
+            'Body': snapshot, 'Metadata': {'complete': 'true'}}
+        response = product_list.handler({}, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == [{'id': '1', 'title': 'Palm'}]
+    mock_s3.get_object.assert_called_once_with(
+        Bucket='test-bucket', Key='catalog/products.json')
+    mock_tables['products'].scan.assert_not_called()
+
+
+def test_incomplete_snapshot_not_served(mock_tables, monkeypatch):
+    # Arrange: snapshot written before the state was complete
+    monkeypatch.setattr(product_list, 'CATALOG_SNAPSHOT_MODE', 'serve')
+    monkeypatch.setenv('CATALOG_BUCKET_NAME', 'test-bucket')
+    snapshot = MagicMock()
+    snapshot.read.return_value = b'[]'
+    mock_tables['products'].scan.return_value = {'Items': [
+        {'id': '1', 'title': 'Palm', 'price': Decimal('10')}]}
+    mock_tables['stock'].scan.return_value = {'Items': []}
+
+    # Act
+    with patch.object(product_list, 's3') as mock_s3:
+        mock_s3.get_object.return_value = {'Body': snapshot, 'Metadata': {}}
+        response = product_list.handler({}, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert [product['id'] for product in json.loads(response['body'])] == ['1']
+    snapshot.read.assert_not_called()
+
+
+def test_no_redirect_to_incomplete_snapshot(mock_tables, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(product_list, 'CATALOG_SNAPSHOT_MODE', 'redirect')
+    monkeypatch.setenv('CATALOG_BUCKET_NAME', 'test-bucket')
+    mock_tables['products'].scan.return_value = {'Items': []}
+    mock_tables['stock'].scan.return_value = {'Items': []}
+
+    # Act
+    with patch.object(product_list, 's3') as mock_s3, \
+            patch.dict(product_list._snapshot_status, complete=False):
+        mock_s3.head_object.return_value = {'Metadata': {}}
+        response = product_list.handler({}, Mock())
+
+    # Assert
+    assert response['statusCode'] == 200
+    mock_s3.generate_presigned_url.assert_not_called()
+
+
+@pytest.mark.parametrize('params', [
+    {'limit': '0'},
+    {'limit': 'abc'},
+    {'cursor': 'not-a-cursor'},
+    {'fields': 'title,weight'},
+    {'minPrice': 'cheap'},
+    {'minPrice': '50', 'maxPrice': '10'},
+    {'sort': 'rating'},
+    {'order': 'desc'},
+    {'inStock': 'maybe'},
+    {'sort': 'price', 'cursor': 'eyJpZCI6eyJTIjoiMSJ9fQ=='},
+    {'sort': 'price', 'cursor': product_list.encode_cursor(
+        {'catalog_pk': 'PRODUCT', 'title_sort': 'aloe', 'id': 'a'})},
+])
+def test_product_list_invalid_paging_params(params):
+    # Act
+    response = product_list.handler(
+        {'queryStringParameters': params}, Mock())
+
+    # Assert
+    assert response['statusCode'] == 400
+
+
 #     # Arrange
 #     event = {
 #         'pathParameters': {
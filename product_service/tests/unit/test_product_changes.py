@@ -0,0 +1,118 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from product_service.lambda_func import product_changes
+
+
+NOW = 1700000000.0
+
+
+@pytest.fixture
+def mock_env_vars(monkeypatch):
+    monkeypatch.setenv('STOCK_TABLE_NAME', 'test-stock')
+    monkeypatch.setenv('PRODUCTS_TABLE_NAME', 'test-products')
+    monkeypatch.setenv('CHANGES_TABLE_NAME', 'test-changes')
+
+
+@pytest.fixture
+def mock_dynamodb():
+    changes_table = MagicMock()
+    dynamodb_client = MagicMock()
+
+    with patch('product_service.lambda_func.product_changes.boto3') as mock_boto3, \
+            patch('product_service.lambda_func.product_items.time.time', return_value=NOW):
+        mock_boto3.resource.return_value.Table.return_value = changes_table
+        mock_boto3.client.return_value = dynamodb_client
+        yield {'changes_table': changes_table, 'client': dynamodb_client}
+
+
+def test_changes_without_since_returns_start_token(mock_env_vars, mock_dynamodb):
+    response = product_changes.handler({}, None)
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['items'] == []
+    assert product_changes.decode_token(body['nextToken']) == '1699999995000'
+    mock_dynamodb['changes_table'].query.assert_not_called()
+
+
+def test_changes_since_token(mock_env_vars, mock_dynamodb):
+    since = product_changes.encode_token('1699999000000')
+    mock_dynamodb['changes_table'].query.return_value = {'Items': [
+        {'version': '1699999100000#a', 'product_id': 'a'},
+        {'version': '1699999200000#b', 'product_id': 'b'},
+        {'version': '1699999300000#a', 'product_id': 'a'},
+    ]}
+
+    def batch_get_item(RequestItems):
+        table_name, request = next(iter(RequestItems.items()))
+        if table_name == 'test-products':
+            return {'Responses': {table_name: [
+                {'id': {'S': 'a'}, 'title': {'S': 'Aloe'},
+                 'description': {'S': 'Succulent'}, 'price': {'N': '25'}}]}}
+        return {'Responses': {table_name: [
+            {'product_id': {'S': 'a'}, 'count': {'N': '4'}}]}}
+
+    mock_dynamodb['client'].batch_get_item.side_effect = batch_get_item
+
+    response = product_changes.handler(
+        {'queryStringParameters': {'since': since}}, None)
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['items'] == [{'id': 'a', 'title': 'Aloe',
+                              'description': 'Succulent', 'price': 25.0,
+                              'count': 4}]
+    assert body['removed'] == ['b']
+    assert body['hasMore'] is False
+    # every entry up to the settled version was read
+    assert product_changes.decode_token(body['nextToken']) == '1699999995000'
+
+
+def test_changes_expired_token(mock_env_vars, mock_dynamodb):
+    since = product_changes.encode_token('1600000000000')
+
+    response = product_changes.handler(
+        {'queryStringParameters': {'since': since}}, None)
+
+    assert response['statusCode'] == 410
+
+
+def test_changes_invalid_token(mock_env_vars, mock_dynamodb):
+    response = product_changes.handler(
+        {'queryStringParameters': {'since': 'garbage'}}, None)
+
+    assert response['statusCode'] == 400
+
+
+def test_changes_page_stops_at_settled_version(mock_env_vars, mock_dynamodb,
+                                               monkeypatch):
+    # Arrange: a full page ending on the entry the token points at
+    monkeypatch.setattr(product_changes, 'CHANGES_PAGE_LIMIT', 2)
+    since = '1699999000000#a'
+    mock_dynamodb['changes_table'].query.side_effect = [
+        {'Items': [{'version': since, 'product_id': 'a'},
+                   {'version': '1699999100000#b', 'product_id': 'b'}],
+         'LastEvaluatedKey': {'version': '1699999100000#b'}},
+        {'Items': [{'version': '1699999200000#c', 'product_id': 'c'}],
+         'LastEvaluatedKey': {'version': '1699999200000#c'}},
+    ]
+    mock_dynamodb['client'].batch_get_item.return_value = {'Responses': {}}
+
+    # Act
+    response = product_changes.handler(
+        {'queryStringParameters': {
+            'since': product_changes.encode_token(since)}}, None)
+
+    # Assert: the entry at `since` is not returned again
+    body = json.loads(response['body'])
+    assert body['removed'] == ['b', 'c']
+    assert body['hasMore'] is True
+    assert product_changes.decode_token(body['nextToken']) == '1699999200000#c'
+    query = mock_dynamodb['changes_table'].query.call_args.kwargs
+    assert query['ConsistentRead'] is True
+    condition = query['KeyConditionExpression']._values[1]
+    assert condition.expression_operator == 'BETWEEN'
+    assert condition._values[1:] == (since, '1699999995000')
@@ -0,0 +1,206 @@
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from product_service.lambda_func import catalog_indexer, product_search
+
+
+@pytest.fixture
+def mock_env_vars(monkeypatch):
+    monkeypatch.setenv('STOCK_TABLE_NAME', 'stocks')
+    monkeypatch.setenv('PRODUCTS_TABLE_NAME', 'products')
+    monkeypatch.setenv('CATALOG_BUCKET_NAME', 'test-bucket')
+
+
+@pytest.fixture
+def index():
+    return catalog_indexer.render_index({'docs': {
+        '1': catalog_indexer.index_document(
+            {'title': 'Palm', 'description': 'Tropical palm tree'}),
+        '2': catalog_indexer.index_document(
+            {'title': 'Aloe', 'description': 'Succulent, easy care'}),
+        '3': catalog_indexer.index_document(
+            {'title': 'Fig tree', 'description': 'Indoor tree'}),
+    }})
+
+
+@pytest.fixture
+def mock_aws(index):
+    mock_s3_client = MagicMock()
+    body = MagicMock()
+    body.read.return_value = json.dumps(index).encode('utf-8')
+    mock_s3_client.get_object.return_value = {'Body': body, 'ETag': '"etag"'}
+
+    dynamodb_client = MagicMock()
+
+    def batch_get_item(RequestItems):
+        table_name, request = next(iter(RequestItems.items()))
+        ids = [next(iter(key.values()))['S'] for key in request['Keys']]
+        if table_name == 'products':
+            items = [{'id': {'S': i}, 'title': {'S': f'Product {i}'},
+                      'price': {'N': '10'}} for i in ids]
+        else:
+            items = [{'product_id': {'S': i}, 'count': {'N': '2'}} for i in ids]
+        return {'Responses': {table_name: items}}
+
+    dynamodb_client.batch_get_item.side_effect = batch_get_item
+
+    with patch('product_service.lambda_func.product_search.s3', mock_s3_client), \
+            patch('product_service.lambda_func.product_search.boto3') as mock_boto3, \
+            patch.dict('product_service.lambda_func.product_search._index_cache', clear=True):
+        mock_boto3.client.return_value = dynamodb_client
+        yield {'s3': mock_s3_client, 'client': dynamodb_client}
+
+
+def test_search_matches_prefixes_of_all_words(index):
+    # results are ordered by title
+    assert product_search.search(index, ['tre']) == ['3', '1']
+    assert product_search.search(index, ['tree', 'ind']) == ['3']
+    assert product_search.search(index, ['succ']) == ['2']
+    assert product_search.search(index, ['cactus']) == []
+
+
+def test_search_handler_returns_page_of_products(mock_env_vars, mock_aws):
+    # Act
+    response = product_search.handler(
+        {'queryStringParameters': {'q': 'Tree', 'limit': '1'}}, None)
+
+    # Assert
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['total'] == 2
+    assert body['items'] == [
+        {'id': '3', 'title': 'Product 3', 'price': 10.0, 'count': 2}]
+
+
+def test_search_index_loaded_once_per_container(mock_env_vars, mock_aws):
+    event = {'queryStringParameters': {'q': 'palm'}}
+
+    product_search.handler(event, None)
+    product_search.handler(event, None)
+
+    mock_aws['s3'].get_object.assert_called_once_with(
+        Bucket='test-bucket', Key='search/index.json')
+
+
+def test_search_index_revalidated_after_ttl(mock_env_vars, mock_aws):
+    event = {'queryStringParameters': {'q': 'palm'}}
+    product_search.handler(event, None)
+    mock_aws['s3'].get_object.side_effect = ClientError(
+        {'Error': {'Code': '304'}}, 'GetObject')
+
+    with patch('product_service.lambda_func.product_search.time.time',
+               return_value=product_search._index_cache['checked_at'] + 60):
+        response = product_search.handler(event, None)
+
+    assert response['statusCode'] == 200
+    assert mock_aws['s3'].get_object.call_args.kwargs['IfNoneMatch'] == '"etag"'
+
+
+def test_search_without_query(mock_env_vars, mock_aws):
+    response = product_search.handler({'queryStringParameters': {'q': ' '}}, None)
+
+    assert response['statusCode'] == 400
+    mock_aws['s3'].get_object.assert_not_called()
+
+
+def test_indexer_updates_written_products(mock_env_vars):
+    # Arrange
+    state = {'docs': {
+        '1': catalog_indexer.index_document({'title': 'Palm', 'description': ''}),
+        '2': catalog_indexer.index_document({'title': 'Aloe', 'description': ''}),
+    }}
+    mock_s3_client = MagicMock()
+    body = MagicMock()
+    body.read.return_value = json.dumps(state).encode('utf-8')
+    mock_s3_client.get_object.return_value = {'Body': body, 'ETag': '"etag"'}
+    mock_s3_client.put_object.return_value = {'ETag': '"new-etag"'}
+    dynamodb_client = MagicMock()
+    dynamodb_client.batch_get_item.return_value = {'Responses': {'products': [
+        {'id': {'S': '1'}, 'title': {'S': 'Palm'},
+         'description': {'S': 'Green leaves'}},
+    ]}}
+
+    # Act: product 1 was updated, product 2 no longer exists
+    with patch('product_service.lambda_func.catalog_indexer.s3', mock_s3_client), \
+            patch('product_service.lambda_func.catalog_indexer.dynamodb_client', dynamodb_client), \
+            patch.dict('product_service.lambda_func.catalog_indexer._state_cache', clear=True):
+        catalog_indexer.handler({'ids': ['1', '2']}, None)
+
+    # Assert
+    objects = {call.kwargs['Key']: json.loads(call.kwargs['Body'])
+               for call in mock_s3_client.put_object.call_args_list}
+    index = objects['search/index.json']
+    assert index['ids'] == ['1']
+    assert index['terms'] == ['green', 'leaves', 'palm']
+    assert index['postings'] == [[0], [0], [0]]
+
+
+def test_indexer_gives_up_on_unprocessed_keys(mock_env_vars):
+    # Arrange: the products table keeps throttling the read
+    dynamodb_client = MagicMock()
+    dynamodb_client.batch_get_item.return_value = {
+        'Responses': {},
+        'UnprocessedKeys': {'products': {'Keys': [{'id': {'S': '1'}}]}}}
+
+    # Act
+    with patch('product_service.lambda_func.catalog_indexer.dynamodb_client', dynamodb_client), \
+            patch('product_service.lambda_func.product_items.time.sleep') as sleep, \
+            pytest.raises(RuntimeError):
+        catalog_indexer.get_products(['1'])
+
+    # Assert: bounded retries with growing delays
+    delays = [call.args[0] for call in sleep.call_args_list]
+    assert len(delays) == 5
+    assert delays == sorted(delays)
+
+
+def test_indexer_follows_change_log(mock_env_vars):
+    # Arrange: complete state, product 3 was written without a notification
+    version = f"{int(time.time() * 1000) - 60000:013d}"
+    state = {'docs': {}, 'complete': True, 'version': version}
+    mock_s3_client = MagicMock()
+    body = MagicMock()
+    body.read.return_value = json.dumps(state).encode('utf-8')
+    mock_s3_client.get_object.return_value = {'Body': body, 'ETag': '"etag"'}
+    mock_s3_client.put_object.return_value = {'ETag': '"new-etag"'}
+    dynamodb_client = MagicMock()
+    dynamodb_client.query.return_value = {
+        'Items': [{'product_id': {'S': '3'}}]}
+    dynamodb_client.batch_get_item.return_value = {'Responses': {'products': [
+        {'id': {'S': product_id}, 'title': {'S': 'Palm'}}
+        for product_id in ('1', '3')]}}
+
+    # Act
+    with patch('product_service.lambda_func.catalog_indexer.s3', mock_s3_client), \
+            patch('product_service.lambda_func.catalog_indexer.dynamodb_client', dynamodb_client), \
+            patch.dict('product_service.lambda_func.catalog_indexer._state_cache', clear=True):
+        catalog_indexer.handler({'ids': ['1']}, None)
+
+    # Assert: the change log is read from the state's version, which advances
+    query = dynamodb_client.query.call_args.kwargs
+    assert query['ExpressionAttributeValues'][':since'] == {'S': version}
+    objects = {call.kwargs['Key']: json.loads(call.kwargs['Body'])
+               for call in mock_s3_client.put_object.call_args_list}
+    assert objects['search/index.json']['ids'] == ['1', '3']
+    assert objects['filters/product-ids.json']['version'] > version
+    assert objects['search/state.json']['version'] > version
+
+
+def test_scheduled_refresh_builds_missing_index(mock_env_vars):
+    # Arrange: no index was ever built
+    mock_s3_client = MagicMock()
+    mock_s3_client.get_object.side_effect = ClientError(
+        {'Error': {'Code': 'NoSuchKey', 'Message': 'Not found'}}, 'GetObject')
+
+    # Act
+    with patch('product_service.lambda_func.catalog_indexer.s3', mock_s3_client), \
+            patch('product_service.lambda_func.catalog_indexer.rebuild') as rebuild, \
+            patch.dict('product_service.lambda_func.catalog_indexer._state_cache', clear=True):
+        catalog_indexer.handler({'refresh': True}, None)
+
+    # Assert
+    rebuild.assert_called_once_with('test-bucket')
@@ -0,0 +1,77 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from product_service.lambda_func import product_stats
+
+
+@pytest.fixture
+def mock_env_vars(monkeypatch):
+    monkeypatch.setenv('STATS_TABLE_NAME', 'test-stats')
+
+
+@pytest.fixture
+def mock_dynamodb_client():
+    dynamodb_client = MagicMock()
+    with patch('product_service.lambda_func.product_stats.dynamodb_client',
+               dynamodb_client):
+        yield dynamodb_client
+
+
+def test_stats_single_get_item(mock_env_vars, mock_dynamodb_client):
+    # Arrange
+    mock_dynamodb_client.get_item.return_value = {
+        'Item': {
+            'id': {'S': 'catalog'},
+            'product_count': {'N': '4'},
+            'stock_units': {'N': '30'},
+            'price_sum': {'N': '100.6'},
+            'min_price': {'N': '5.5'},
+            'max_price': {'N': '50'},
+        }
+    }
+
+    # Act
+    response = product_stats.handler({}, None)
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {
+        'productCount': 4,
+        'stockUnits': 30,
+        'minPrice': 5.5,
+        'maxPrice': 50.0,
+        'avgPrice': 25.15,
+    }
+    mock_dynamodb_client.get_item.assert_called_once_with(
+        TableName='test-stats', Key={'id': {'S': 'catalog'}})
+
+
+def test_stats_empty_catalog(mock_env_vars, mock_dynamodb_client):
+    # Arrange
+    mock_dynamodb_client.get_item.return_value = {}
+
+    # Act
+    response = product_stats.handler({}, None)
+
+    # Assert
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {
+        'productCount': 0,
+        'stockUnits': 0,
+        'minPrice': None,
+        'maxPrice': None,
+        'avgPrice': None,
+    }
+
+
+def test_stats_error(mock_env_vars, mock_dynamodb_client):
+    # Arrange
+    mock_dynamodb_client.get_item.side_effect = Exception('boom')
+
+    # Act
+    response = product_stats.handler({}, None)
+
+    # Assert
+    assert response['statusCode'] == 500